@@ -0,0 +1,265 @@
+"""
+Benchmark the complainer pipeline on synthetic complaints.
+
+Times and memory-profiles each stage of the pipeline, from reading the raw
+csv to scoring, and writes the results to a JSON file named after the
+current commit, so runs can be compared across commits.
+
+Usage (from the repository root):
+
+    PYTHONPATH=. python3 benchmarks/run.py --rows 100000
+
+Compares against the most recent earlier result at the same scale, and with
+--fail-on-regression exits non-zero if any stage slowed down by more than
+--threshold.
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sklearn import __version__ as sklearn_version
+
+from complainer.features import TermCounts
+from complainer.ingestion import read_complaints
+from complainer.preprocessing import (
+    encode_targets, filter_rename_mortgages, target_encoding_dict
+)
+from complainer.scoring import Scorer
+from complainer.splitter import (
+    train_dev_test_split, stream_train_dev_test_split
+)
+from complainer.synthetic import write_synthetic_complaints
+from complainer.classifiers import make_classifier
+
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'results')
+
+
+# ## Stages
+
+# Each stage takes the state left by the previous stages, and returns the
+# number of rows it processed and any state it adds.
+
+def read(state):
+    raw = read_complaints(state['path'])
+    return len(raw), {'raw': raw}
+
+
+def split(state):
+    train, dev, test = train_dev_test_split(state['raw'], random_state=42)
+    return len(state['raw']), {'train_raw': train, 'dev_raw': dev}
+
+
+def stream_split(state):
+    raw = state['raw']
+    chunks = (raw.iloc[i:i + 100000] for i in range(0, len(raw), 100000))
+    rows = sum(len(train) + len(dev) + len(test) for train, dev, test
+               in stream_train_dev_test_split(chunks, 'Complaint ID',
+                                              random_state=42))
+    return rows, {}
+
+
+def filter_rename(state):
+    train = filter_rename_mortgages(state['train_raw'])
+    dev = filter_rename_mortgages(state['dev_raw'])
+    return len(state['train_raw']) + len(state['dev_raw']), \
+        {'train': train, 'dev': dev}
+
+
+def encode(state):
+    train = encode_targets(state['train'], 'issue', target_encoding_dict)
+    dev = encode_targets(state['dev'], 'issue', target_encoding_dict)
+    return len(train) + len(dev), {'train': train, 'dev': dev}
+
+
+def featurize(state):
+    counts = TermCounts.from_texts(state['train'].complaint)
+    vectorizer, X = counts.tfidf()
+    return len(state['train']), {'vectorizer': vectorizer, 'X': X}
+
+
+def fit(state):
+    model = make_classifier(state['classifier'])
+    model.fit(state['X'], state['train'].issue)
+    return len(state['train']), {'model': model}
+
+
+def score(state):
+    scorer = Scorer(state['vectorizer'], state['model'])
+    scored = scorer(state['dev'])
+    return len(scored), {}
+
+
+stages = [
+    ('read', read),
+    ('train_dev_test_split', split),
+    ('stream_train_dev_test_split', stream_split),
+    ('filter_rename_mortgages', filter_rename),
+    ('encode_targets', encode),
+    ('featurize', featurize),
+    ('fit', fit),
+    ('score', score)
+]
+
+
+# ## Running
+
+def run_pipeline(state, trace_memory=False):
+    """
+    Run every stage once. Returns {stage: measurements}.
+    """
+    results = {}
+    for name, stage in stages:
+        if trace_memory:
+            tracemalloc.start()
+        wall, cpu = time.perf_counter(), time.process_time()
+        rows, update = stage(state)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        result = {'seconds': wall, 'cpu_seconds': cpu, 'rows': rows}
+        if trace_memory:
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        state.update(update)
+        results[name] = result
+    return results
+
+
+def benchmark(path, repeat=3, classifier='nb'):
+    """
+    Best wall and cpu time of each stage over `repeat` runs, and its peak
+    traced memory in one further run (tracing slows the stages down).
+    """
+    runs = [run_pipeline({'path': path, 'classifier': classifier})
+            for _ in range(repeat)]
+    memory = run_pipeline({'path': path, 'classifier': classifier},
+                          trace_memory=True)
+    results = {}
+    for name, _ in stages:
+        results[name] = {
+            'seconds': min(run[name]['seconds'] for run in runs),
+            'cpu_seconds': min(run[name]['cpu_seconds'] for run in runs),
+            'peak_bytes': memory[name]['peak_bytes'],
+            'rows': runs[0][name]['rows']
+        }
+        results[name]['rows_per_second'] = \
+            results[name]['rows'] / results[name]['seconds']
+    return results
+
+
+def git_commit():
+    """
+    Short hash of HEAD, suffixed "-dirty" if the tree has changes.
+    """
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], universal_newlines=True
+        ).strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD'])
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+
+def previous_result(rows, exclude):
+    """
+    The most recent result file at the same scale, other than `exclude`.
+    """
+    candidates = []
+    for path in glob.glob(os.path.join(RESULTS_DIRECTORY, '*.json')):
+        if os.path.abspath(path) == os.path.abspath(exclude):
+            continue
+        with open(path) as f:
+            result = json.load(f)
+        if result['rows'] == rows:
+            candidates.append((result['date'], result))
+    return max(candidates, key=lambda c: c[0])[1] if candidates else None
+
+
+def compare(result, baseline, threshold):
+    """
+    Print stage times against `baseline`. Returns names of stages slower
+    than `threshold` times their baseline.
+    """
+    print("Compared to {} ({}):".format(baseline['commit'], baseline['date']))
+    regressions = []
+    for name, stage in result['stages'].items():
+        if name not in baseline['stages']:
+            continue
+        ratio = stage['seconds'] / baseline['stages'][name]['seconds']
+        flag = ''
+        if ratio > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print("  {:<30} {:>8.3f}s  x{:.2f}{}".format(
+            name, stage['seconds'], ratio, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=10000,
+                        help='raw complaints to generate (default 10000)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timed runs per stage; the best is kept')
+    parser.add_argument('--classifier', default='nb',
+                        help='classifier to fit, as '
+                             'complainer.classifiers.make_classifier')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='slowdown ratio reported as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'complaints.csv')
+        write_synthetic_complaints(path, args.rows, random_state=0)
+        stage_results = benchmark(path, args.repeat, args.classifier)
+
+    result = {
+        'commit': git_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'rows': args.rows,
+        'classifier': args.classifier,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn_version,
+        'stages': stage_results
+    }
+
+    if not os.path.exists(RESULTS_DIRECTORY):
+        os.makedirs(RESULTS_DIRECTORY)
+    path = os.path.join(RESULTS_DIRECTORY,
+                        '{}-{}.json'.format(result['commit'], args.rows))
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    print("{} rows, commit {}".format(args.rows, result['commit']))
+    for name, stage in stage_results.items():
+        print("  {:<30} {:>8.3f}s {:>8.3f}s cpu {:>10.1f} MiB {:>12.0f} rows/s"
+              .format(name, stage['seconds'], stage['cpu_seconds'],
+                      stage['peak_bytes'] / 2 ** 20,
+                      stage['rows_per_second']))
+    print("Results written to {}".format(path))
+
+    baseline = previous_result(args.rows, exclude=path)
+    if baseline is not None:
+        regressions = compare(result, baseline, args.threshold)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,359 @@
+"""
+Compact, memory-mappable artifacts for fitted vectorizers and linear models.
+
+Pickled vectorizers hold their vocabulary as a large python dict, which is
+slow to unpickle and is copied into every process that loads it.
+Here, the vocabulary is stored as a sorted table of 64 bit term hashes, and
+idf weights and model coefficients as float32 arrays, all as raw .npy files.
+Loading memory maps them, so it takes milliseconds, and processes loading
+the same artifact share one copy of it in the page cache.
+"""
+
+import hashlib
+import json
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from sklearn.feature_extraction.text import (
+    CountVectorizer, HashingVectorizer, TfidfVectorizer
+)
+from sklearn.preprocessing import normalize
+
+from complainer.cache import file_digest
+from complainer.features import HashingTfidfVectorizer
+from complainer.text import TextPolicy
+
+
+FORMAT_VERSION = 1
+
+# Tokenization params of a TfidfVectorizer that are stored in an artifact.
+_analyzer_params = ['lowercase', 'strip_accents', 'stop_words',
+                    'token_pattern', 'ngram_range', 'analyzer']
+
+
+def hash_terms(terms):
+    """
+    64 bit hashes of the strings in `terms`, as a numpy uint64 array.
+    """
+    return pd.util.hash_array(np.asarray(terms, dtype=object))
+
+
+def _save_array(directory, name, array):
+    np.save(os.path.join(directory, name + '.npy'),
+            np.ascontiguousarray(array))
+
+
+def _load_array(directory, name, mmap):
+    return np.load(os.path.join(directory, name + '.npy'),
+                   mmap_mode='r' if mmap else None)
+
+
+def _jsonable(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, tuple):
+        return list(value)
+    return value
+
+
+def save_compact_vectorizer(vectorizer, directory):
+    """
+    Save a fitted TfidfVectorizer or
+    complainer.features.HashingTfidfVectorizer to `directory`.
+
+    Raises
+    ------
+    TypeError
+        If the vectorizer is of another type, or uses a callable
+        tokenizer, preprocessor or analyzer.
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    if isinstance(vectorizer, TfidfVectorizer):
+        params = vectorizer.get_params()
+        if any(callable(params[name])
+               for name in ['tokenizer', 'preprocessor', 'analyzer']):
+            raise(TypeError(
+                "Cannot save a vectorizer with callable tokenization"
+            ))
+        terms = sorted(vectorizer.vocabulary_)
+        hashes = hash_terms(terms)
+        if len(np.unique(hashes)) != len(hashes):
+            raise(ValueError("Vocabulary term hashes collide"))
+        order = np.argsort(hashes)
+        columns = np.array([vectorizer.vocabulary_[term] for term in terms],
+                           dtype=np.int32)
+        _save_array(directory, 'term_hashes', hashes[order])
+        _save_array(directory, 'term_columns', columns[order])
+        meta = {
+            'kind': 'vocabulary',
+            'n_features': len(terms),
+            'analyzer': {name: _jsonable(params[name])
+                         for name in _analyzer_params},
+            # Lets loading check that terms still hash the same way.
+            'hash_check': {term: str(h) for term, h in
+                           zip(terms[:3], hash_terms(terms[:3]))}
+        }
+        idf = vectorizer.idf_ if vectorizer.use_idf else None
+    elif isinstance(vectorizer, HashingTfidfVectorizer):
+        meta = {
+            'kind': 'hashing',
+            'n_features': vectorizer.n_features,
+            'analyzer': {name: _jsonable(getattr(vectorizer, name))
+                         for name in ['lowercase', 'token_pattern',
+                                      'ngram_range']}
+        }
+        idf = (vectorizer.idf_ if vectorizer.use_idf
+               else (vectorizer.document_counts_ > 0).astype(np.float32))
+    else:
+        raise(TypeError(
+            "Cannot save a compact {}".format(type(vectorizer).__name__)
+        ))
+
+    meta.update({
+        'format_version': FORMAT_VERSION,
+        'norm': vectorizer.norm,
+        'sublinear_tf': vectorizer.sublinear_tf,
+        'binary': bool(getattr(vectorizer, 'binary', False))
+    })
+    if idf is not None:
+        _save_array(directory, 'idf', np.asarray(idf, dtype=np.float32))
+    with open(os.path.join(directory, 'vectorizer.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+class CompactVectorizer:
+    """
+    Fitted vectorizer loaded by `load_compact_vectorizer`.
+    Transforms text exactly as the vectorizer it was saved from
+    (up to float32 precision).
+    """
+
+    def __init__(self, meta, idf, term_hashes=None, term_columns=None):
+        self.meta = meta
+        self.idf = idf
+        self.term_hashes = term_hashes
+        self.term_columns = term_columns
+        analyzer = dict(meta['analyzer'])
+        analyzer['ngram_range'] = tuple(analyzer['ngram_range'])
+        if meta['kind'] == 'vocabulary':
+            self._analyze = CountVectorizer(**analyzer).build_analyzer()
+        else:
+            self._hashing = HashingVectorizer(
+                n_features=meta['n_features'], alternate_sign=False,
+                norm=None, dtype=np.float32, **analyzer
+            )
+
+    def _counts(self, texts):
+        if self.meta['kind'] == 'hashing':
+            return self._hashing.transform(texts)
+
+        # Hash each distinct token of the whole batch once, in one call:
+        # hashing and looking up hashes is cheap per token but costly per
+        # call.
+        tokens = [self._analyze(text) for text in texts]
+        lengths = np.array([len(doc) for doc in tokens], dtype=np.int64)
+        codes, distinct = pd.factorize(
+            np.array([token for doc in tokens for token in doc], dtype=object)
+        )
+        hashes = hash_terms(distinct) if len(distinct) \
+            else np.empty(0, dtype=np.uint64)
+
+        term_hashes = np.asarray(self.term_hashes)
+        column_of = np.full(len(distinct), -1, dtype=np.int64)
+        if len(term_hashes):
+            positions = np.minimum(np.searchsorted(term_hashes, hashes),
+                                   len(term_hashes) - 1)
+            known = term_hashes[positions] == hashes
+            column_of[known] = np.asarray(self.term_columns)[positions[known]]
+
+        # Documents' tokens are consecutive, so the CSR row offsets follow
+        # from the number of known tokens of each document.
+        columns = column_of[codes]
+        in_vocabulary = columns >= 0
+        offsets = np.r_[0, np.cumsum(lengths)]
+        indptr = np.r_[0, np.cumsum(in_vocabulary)][offsets]
+        counts = scipy.sparse.csr_matrix(
+            (np.ones(indptr[-1], dtype=np.float32),
+             columns[in_vocabulary], indptr),
+            shape=(len(tokens), self.meta['n_features'])
+        )
+        counts.sum_duplicates()
+        return counts
+
+    def transform(self, texts):
+        """
+        Transform the documents in `texts` to a sparse float32 matrix.
+        """
+        X = self._counts(texts).astype(np.float32)
+        if self.meta['binary']:
+            X.data[:] = 1
+        if self.meta['sublinear_tf']:
+            np.log(X.data, X.data)
+            X.data += 1
+        if self.idf is not None:
+            X.data *= np.asarray(self.idf, dtype=np.float32)[X.indices]
+        if self.meta['norm']:
+            X = normalize(X, norm=self.meta['norm'], copy=False)
+        return scipy.sparse.csr_matrix(X)
+
+
+def load_compact_vectorizer(directory, mmap=True):
+    """
+    Load a vectorizer saved by `save_compact_vectorizer`, memory mapping its
+    arrays if `mmap`.
+    """
+    with open(os.path.join(directory, 'vectorizer.json')) as f:
+        meta = json.load(f)
+    if meta['format_version'] != FORMAT_VERSION:
+        raise(ValueError(
+            "Unsupported artifact format {}".format(meta['format_version'])
+        ))
+    idf = None
+    if os.path.exists(os.path.join(directory, 'idf.npy')):
+        idf = _load_array(directory, 'idf', mmap)
+    if meta['kind'] == 'hashing':
+        return CompactVectorizer(meta, idf)
+
+    check = meta['hash_check']
+    if [str(h) for h in hash_terms(list(check))] != list(check.values()):
+        raise(ValueError(
+            "Terms no longer hash as when the artifact was saved"
+        ))
+    return CompactVectorizer(meta,
+                             idf,
+                             _load_array(directory, 'term_hashes', mmap),
+                             _load_array(directory, 'term_columns', mmap))
+
+
+def linear_parameters(model):
+    """
+    Coefficients, intercepts and classes of a fitted linear classifier
+    (anything with `coef_` and `intercept_`, e.g. NBSVM or SGDClassifier)
+    or of multinomial naive bayes, whose log probabilities are linear too.
+    """
+    if hasattr(model, 'feature_log_prob_'):
+        return (model.feature_log_prob_, model.class_log_prior_,
+                model.classes_)
+    if hasattr(model, 'coef_'):
+        coef = model.coef_
+        if scipy.sparse.issparse(coef):
+            coef = coef.toarray()
+        return (coef, np.ravel(model.intercept_) * np.ones(coef.shape[0]),
+                model.classes_)
+    raise(TypeError(
+        "Cannot save a compact {}".format(type(model).__name__)
+    ))
+
+
+def save_compact_model(model, directory):
+    """
+    Save the parameters of a fitted linear classifier to `directory`,
+    as float32 arrays.
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    coef, intercept, classes = linear_parameters(model)
+    _save_array(directory, 'coef', np.asarray(coef, dtype=np.float32))
+    _save_array(directory, 'intercept',
+                np.asarray(intercept, dtype=np.float32))
+    with open(os.path.join(directory, 'model.json'), 'w') as f:
+        json.dump({'format_version': FORMAT_VERSION,
+                   'classes': [str(c) for c in classes]}, f, indent=2)
+
+
+class CompactLinearModel:
+    """
+    Fitted linear classifier loaded by `load_compact_model`.
+    Predicts as the model it was saved from, with one sparse-dense product.
+    """
+
+    def __init__(self, coef, intercept, classes):
+        self.coef_ = coef
+        self.intercept_ = intercept
+        self.classes_ = np.asarray(classes, dtype=object)
+
+    def decision_function(self, X):
+        scores = np.asarray(X @ np.asarray(self.coef_).T) + self.intercept_
+        if scores.shape[1] == 1:
+            return scores.ravel()
+        return scores
+
+    def predict(self, X):
+        scores = self.decision_function(X)
+        if scores.ndim == 1:
+            return self.classes_[(scores > 0).astype(int)]
+        return self.classes_[np.argmax(scores, axis=1)]
+
+
+def load_compact_model(directory, mmap=True):
+    """
+    Load a model saved by `save_compact_model`, memory mapping its
+    coefficients if `mmap`.
+    """
+    with open(os.path.join(directory, 'model.json')) as f:
+        meta = json.load(f)
+    return CompactLinearModel(_load_array(directory, 'coef', mmap),
+                              _load_array(directory, 'intercept', False),
+                              meta['classes'])
+
+
+def save_compact(vectorizer, model, directory, text_policy=None):
+    """
+    Save a fitted vectorizer and linear model as a compact artifact, with
+    the complainer.text.TextPolicy their training texts were prepared with,
+    if given.
+    """
+    save_compact_vectorizer(vectorizer, directory)
+    save_compact_model(model, directory)
+    if text_policy is not None:
+        text_policy.save(directory)
+
+
+def compact_digest(directory):
+    """
+    SHA-256 hex digest of every file of a compact artifact, identifying the
+    fitted vectorizer and model it holds.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        digest.update(name.encode('utf-8'))
+        digest.update(file_digest(os.path.join(directory, name)).encode())
+    return digest.hexdigest()
+
+
+def load_compact(directory, mmap=True):
+    """
+    Load a compact artifact saved by `save_compact`.
+    Returns (vectorizer, model).
+    """
+    return (load_compact_vectorizer(directory, mmap),
+            load_compact_model(directory, mmap))
+
+
+def load_vectorizer_and_model(vectorizer_path=None,
+    model_path=None,
+    compact_path=None):
+    """
+    Load pickled vectorizer and model files, or, if `compact_path` is
+    given, a memory mapped compact artifact.
+    Returns (vectorizer, model).
+    """
+    if compact_path:
+        return load_compact(compact_path)
+    return joblib.load(vectorizer_path), joblib.load(model_path)
+
+
+def load_text_policy(vectorizer_path=None, compact_path=None):
+    """
+    Load the complainer.text.TextPolicy of a model: the one saved in its
+    compact artifact, if `compact_path` is given, otherwise the one saved
+    beside its pickled vectorizer.
+    """
+    if compact_path:
+        return TextPolicy.load(compact_path)
+    return TextPolicy.load(os.path.dirname(vectorizer_path))
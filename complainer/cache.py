@@ -0,0 +1,214 @@
+"""
+Content-addressed cache of featurized data.
+
+Features are keyed by a digest of the data file they were computed from and
+of the vectorizer that computed them, so they are reused only while both are
+unchanged.
+"""
+
+import hashlib
+import json
+import os
+
+import joblib
+import scipy.sparse
+import sklearn
+
+from complainer.features import TermCounts
+from complainer.storage import list_parts
+
+
+# Bump to invalidate every existing cache entry.
+CACHE_VERSION = 1
+
+
+def file_digest(path, block_bytes=1 << 20):
+    """
+    SHA-256 hex digest of the contents of the file at `path`, read in blocks
+    of `block_bytes`. If `path` is a directory of part files (see
+    complainer.storage), the digest covers every part, so it changes
+    whenever a part is added.
+    """
+    if os.path.isdir(path):
+        digest = hashlib.sha256()
+        for part in list_parts(path):
+            digest.update(os.path.basename(part).encode())
+            digest.update(file_digest(part, block_bytes).encode())
+        return digest.hexdigest()
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_bytes), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def vectorizer_fingerprint(vectorizer):
+    """
+    JSON-serializable description of an (unfitted) vectorizer: its class,
+    its parameters, and the scikit-learn version.
+    """
+    vectorizer_class = type(vectorizer)
+    return {
+        'class': vectorizer_class.__module__ + '.' + vectorizer_class.__name__,
+        'params': {
+            name: repr(value)
+            for name, value in sorted(vectorizer.get_params().items())
+        },
+        'sklearn': sklearn.__version__
+    }
+
+
+class FeatureCache:
+    """
+    Cache of sparse feature matrices, and the vectorizers fitted to produce
+    them, stored as .npz and .pkl files in `directory`.
+
+    Parameters
+    ----------
+    directory : string
+        Directory holding the cache. Created if it does not exist.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def key(self, **parts):
+        """
+        Digest of the JSON-serializable keyword arguments `parts`.
+        """
+        parts['cache_version'] = CACHE_VERSION
+        encoded = json.dumps(parts, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def load(self, key):
+        """
+        The matrix stored under `key`, or None if there is none.
+        """
+        path = self._path(key, '.npz')
+        if not os.path.exists(path):
+            return None
+        return scipy.sparse.load_npz(path)
+
+    def save(self, key, matrix):
+        """
+        Store `matrix` under `key`.
+        Written to a temporary file first, so a crash never leaves a
+        partial entry behind.
+        """
+        tmp = self._path(key, '.tmp.npz')
+        scipy.sparse.save_npz(tmp, matrix, compressed=False)
+        os.replace(tmp, self._path(key, '.npz'))
+
+    def fit_transform(self, vectorizer, texts, data_digest):
+        """
+        As `vectorizer.fit_transform(texts)`, unless the same (unfitted)
+        vectorizer has already been fitted on data with `data_digest`, in
+        which case the cached fitted vectorizer and features are returned.
+
+        Parameters
+        ----------
+        vectorizer : sklearn-style vectorizer
+            Unfitted vectorizer.
+        texts : iterable of strings, or callable returning one
+            Documents to featurize. Pass a callable to avoid reading the
+            documents at all on a cache hit.
+        data_digest : string
+            Digest of the data `texts` came from, e.g. `file_digest`.
+        Returns
+        -------
+        vectorizer : sklearn-style vectorizer
+            The fitted vectorizer.
+        X : scipy.sparse matrix
+            Features of `texts`.
+        """
+        key = self.key(stage='fit_transform',
+                       data=data_digest,
+                       vectorizer=vectorizer_fingerprint(vectorizer))
+        X = self.load(key)
+        vectorizer_path = self._path(key, '.vectorizer.pkl')
+        if X is not None and os.path.exists(vectorizer_path):
+            return joblib.load(vectorizer_path), X
+
+        X = vectorizer.fit_transform(texts() if callable(texts) else texts)
+        tmp = self._path(key, '.vectorizer.tmp.pkl')
+        joblib.dump(vectorizer, tmp)
+        os.replace(tmp, vectorizer_path)
+        self.save(key, X)
+        return vectorizer, X
+
+    def transform(self, vectorizer, texts, data_digest, vectorizer_digest):
+        """
+        As `vectorizer.transform(texts)`, unless the features of data with
+        `data_digest` from the fitted vectorizer with `vectorizer_digest`
+        are cached.
+
+        Parameters
+        ----------
+        vectorizer : sklearn-style vectorizer
+            Fitted vectorizer.
+        texts : iterable of strings, or callable returning one
+            As `fit_transform`.
+        data_digest : string
+            Digest of the data `texts` came from, e.g. `file_digest`.
+        vectorizer_digest : string
+            Digest identifying the fitted vectorizer, e.g. the `file_digest`
+            of its persisted file.
+        Returns
+        -------
+        X : scipy.sparse matrix
+            Features of `texts`.
+        """
+        key = self.key(stage='transform',
+                       data=data_digest,
+                       vectorizer=vectorizer_digest,
+                       sklearn=sklearn.__version__)
+        X = self.load(key)
+        if X is None:
+            X = vectorizer.transform(texts() if callable(texts) else texts)
+            self.save(key, X)
+        return X
+
+    def term_counts(self, texts, data_digest, executor=None, **tokenization):
+        """
+        As `complainer.features.TermCounts.from_texts(texts, **tokenization)`,
+        unless the term counts of data with `data_digest` and the same
+        tokenization params are cached. Any tf-idf vectorizer over those
+        tokens can then be derived without reading the text (see
+        `TermCounts.tfidf`).
+
+        Parameters
+        ----------
+        texts : iterable of strings, or callable returning one
+            As `fit_transform`.
+        data_digest : string
+            Digest of the data `texts` came from, e.g. `file_digest`.
+        executor : concurrent.futures.Executor or None (default=None)
+            Where to tokenize shards of `texts` in parallel, as
+            `TermCounts.from_texts`.
+        **tokenization
+            Passed to `TermCounts.from_texts`.
+        Returns
+        -------
+        counts : complainer.features.TermCounts
+        """
+        key = self.key(stage='term_counts',
+                       data=data_digest,
+                       tokenization={name: repr(value) for name, value
+                                     in sorted(tokenization.items())},
+                       sklearn=sklearn.__version__)
+        directory = self._path(key, '.counts')
+        if os.path.exists(directory):
+            return TermCounts.load(directory)
+
+        counts = TermCounts.from_texts(texts() if callable(texts) else texts,
+                                       executor=executor,
+                                       **tokenization)
+        tmp = self._path(key, '.counts.tmp')
+        counts.save(tmp)
+        os.replace(tmp, directory)
+        return counts
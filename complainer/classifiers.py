@@ -0,0 +1,40 @@
+"""
+The classifiers that can be trained on tf-idf features, by name.
+"""
+
+import inspect
+
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import MultinomialNB
+
+from complainer.nbsvm import NBSVM
+
+
+classifiers = {
+    'nbsvm': NBSVM,
+    'nb': MultinomialNB,
+    'sgd': SGDClassifier
+}
+
+
+def make_classifier(name,
+    n_jobs=None,
+    **params):
+    """
+    Create an unfitted classifier: "nbsvm", "nb" (multinomial naive bayes)
+    or "sgd" (linear SVM trained by stochastic gradient descent), with
+    `params`.
+    `n_jobs` sets the threads of the classifiers that fit on several
+    (nbsvm, sgd; None is their default), and is ignored by the others, so
+    that classifiers fitted on the workers of a process pool can be kept to
+    one thread each.
+    """
+    if name not in classifiers:
+        raise(ValueError(
+            "Unknown classifier {}, expected one of {}".format(
+                name, ', '.join(classifiers))
+        ))
+    if n_jobs is not None and \
+            'n_jobs' in inspect.signature(classifiers[name]).parameters:
+        params['n_jobs'] = n_jobs
+    return classifiers[name](**params)
@@ -0,0 +1,259 @@
+"""
+Datasets partitioned on disk by the values of some columns.
+
+Rows are stored in Hive-style directories, one level per partition column,
+e.g. `Product=Mortgage/year=2019/part-00000.parquet`, and partition columns
+are not stored in the files themselves. Readers prune partitions by their
+directory names before opening any file, so reading the mortgages never
+touches the rows of other products, and read only the requested columns of
+columnar files (see complainer.storage).
+"""
+
+import os
+import urllib.parse
+
+import pandas as pd
+
+from complainer.ingestion import concat_chunks
+from complainer.storage import (
+    TableWriter, extensions, iter_table, list_parts, part_path
+)
+
+
+# Directory name of the partition of null values, as Hive.
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+def _quote(value):
+    if pd.isnull(value):
+        return NULL_PARTITION
+    return urllib.parse.quote(str(value), safe='')
+
+
+def _unquote(name):
+    if name == NULL_PARTITION:
+        return None
+    return urllib.parse.unquote(name)
+
+
+def partition_directory(root, values):
+    """
+    Directory of the partition with `values`, a list of (column, value)
+    pairs in partition order, under `root`.
+    """
+    return os.path.join(root, *['{}={}'.format(column, _quote(value))
+                                for column, value in values])
+
+
+def _accepts(accepted, value):
+    if callable(accepted):
+        return accepted(value)
+    return value in accepted
+
+
+def list_partitions(root, filters=None):
+    """
+    Leaf partitions of the dataset at `root` that pass `filters`, in sorted
+    order of directory names.
+
+    Parameters
+    ----------
+    root : string
+        Root directory of the dataset.
+    filters : dict or None (default=None)
+        Maps partition columns to a collection of accepted values, or to a
+        function of a value returning whether it is accepted. Values are
+        strings (None for nulls). A directory that fails a filter is pruned
+        with everything under it.
+    Returns
+    -------
+    partitions : list of (dict, string)
+        Partition values by column, and the directory of the partition.
+    """
+    filters = filters or {}
+    partitions = []
+
+    def walk(directory, values):
+        children = sorted(name for name in os.listdir(directory)
+                          if '=' in name
+                          and os.path.isdir(os.path.join(directory, name)))
+        if not children:
+            partitions.append((values, directory))
+            return
+        for name in children:
+            column, _, quoted = name.partition('=')
+            value = _unquote(quoted)
+            if column in filters and not _accepts(filters[column], value):
+                continue
+            walk(os.path.join(directory, name),
+                 dict(values, **{column: value}))
+
+    walk(root, {})
+    return partitions
+
+
+def iter_dataset(root,
+    chunksize=100000,
+    columns=None,
+    filters=None,
+    stats=None):
+    """
+    Lazily read the partitions of the dataset at `root` that pass `filters`
+    in chunks of at most `chunksize` rows.
+
+    Parameters
+    ----------
+    root : string
+        Root directory of the dataset.
+    chunksize : int (default=100000)
+        Maximum number of rows per chunk. Chunks do not span part files.
+    columns : list of strings or None (default=None)
+        Columns to read, which may include partition columns. Defaults to
+        all columns, followed by the partition columns.
+    filters : dict or None (default=None)
+        Partition filters, as `list_partitions`.
+    stats : dict or None (default=None)
+        If not None, updated in place with running read statistics,
+        as complainer.storage.iter_table.
+    Returns
+    -------
+    chunks : generator of pandas.DataFrame
+        Partition columns are categorical.
+    """
+    for values, directory in list_partitions(root, filters):
+        if not list_parts(directory):
+            continue
+        file_columns = None if columns is None else \
+            [column for column in columns if column not in values]
+        for chunk in iter_table(directory, chunksize, file_columns, stats):
+            for column, value in values.items():
+                if columns is None or column in columns:
+                    chunk[column] = pd.Categorical(
+                        [value] * len(chunk),
+                        categories=pd.Index(
+                            [] if value is None else [value], dtype=str)
+                    )
+            if columns is not None:
+                chunk = chunk[columns]
+            yield chunk
+
+
+def read_dataset(root, columns=None, filters=None):
+    """
+    Read the partitions of the dataset at `root` that pass `filters` into a
+    pandas.DataFrame, as `iter_dataset`.
+    """
+    chunks = list(iter_dataset(root, columns=columns, filters=filters))
+    if not chunks:
+        return pd.DataFrame(columns=columns or [])
+    return concat_chunks(chunks)
+
+
+class PartitionedWriter:
+    """
+    Write a dataset partitioned by `partition_by` columns, one
+    pandas.DataFrame chunk at a time, adding one part file to every
+    partition that gets rows. Use as a context manager, so the parts are
+    finalized on exit.
+
+    Parts are written under a temporary name and renamed on `close`, so a
+    partially written part is never read.
+
+    Parameters
+    ----------
+    root : string
+        Root directory of the dataset. Created if necessary.
+    partition_by : list of strings
+        Partition columns, outermost first.
+    fmt : string (default="csv")
+        Storage format of the part files, as complainer.storage.
+    part : int (default=0)
+        Number of the part files written. Existing parts of the same number
+        are replaced.
+    replace : bool (default=False)
+        Whether the parts written replace the whole dataset: on `close`,
+        once they are published, every other part file under `root` is
+        removed, including those of partitions that got no rows.
+    **writer_kwargs
+        Passed to complainer.storage.TableWriter.
+    """
+
+    def __init__(self,
+        root,
+        partition_by,
+        fmt='csv',
+        part=0,
+        replace=False,
+        **writer_kwargs):
+        self.root = root
+        self.partition_by = list(partition_by)
+        self.fmt = fmt
+        self.part = part
+        self.replace = replace
+        self.writer_kwargs = writer_kwargs
+        self._writers = {}
+        self._closed = False
+        self.rows = 0
+        if fmt not in extensions:
+            raise(ValueError(
+                "Unknown format {}, expected one of {}".format(
+                    fmt, ', '.join(extensions))
+            ))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def partitions(self):
+        """
+        Directories of the partitions written to.
+        """
+        return sorted(self._writers)
+
+    def _writer(self, values):
+        directory = partition_directory(self.root,
+                                        zip(self.partition_by, values))
+        if directory not in self._writers:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            path = part_path(directory, self.part, self.fmt)
+            tmp = os.path.join(directory, '.tmp-' + os.path.basename(path))
+            self._writers[directory] = TableWriter(tmp, **self.writer_kwargs)
+        return self._writers[directory]
+
+    def write(self, df):
+        """
+        Append the rows of `df` to their partitions.
+        All chunks must have the same columns.
+        """
+        # Nulls are grouped under the name of their partition, as groupby
+        # drops null keys.
+        keys = [df[column].astype(object) for column in self.partition_by]
+        keys = [key.where(key.notnull(), NULL_PARTITION) for key in keys]
+        for values, group in df.groupby(keys, sort=False):
+            if not isinstance(values, tuple):
+                values = (values,)
+            self._writer(values).write(group.drop(columns=self.partition_by))
+        self.rows += len(df)
+
+    def close(self):
+        """
+        Finalize and publish every part written.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for directory, writer in self._writers.items():
+            writer.close()
+            os.replace(writer.path,
+                       part_path(directory, self.part, self.fmt))
+        if self.replace and os.path.exists(self.root):
+            written = {part_path(directory, self.part, self.fmt)
+                       for directory in self._writers}
+            for _, directory in list_partitions(self.root):
+                for path in list_parts(directory):
+                    if path not in written:
+                        os.remove(path)
@@ -0,0 +1,352 @@
+"""
+Normalization of complaint narratives, and detection of exact and near
+duplicate narratives.
+
+Narratives are redacted with runs of "XXXX" (names, places, dates like
+"XX/XX/2019"), and many are resubmitted with small edits. Normalizing
+redactions and whitespace shrinks the vocabulary, and clustering duplicates
+lets them be dropped, or kept within one split so they do not leak between
+train and test.
+
+Exact duplicates are found by hashing normalized text. Near duplicates are
+found by MinHash signatures of word shingles, with locality sensitive
+hashing (LSH) bands proposing candidate pairs, which are kept if their
+signatures agree on at least `threshold` of their values. Every step is a
+vectorized pass over the shingles or the rows, so the cost grows linearly
+with the amount of text.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from scipy.sparse.csgraph import connected_components
+
+
+# A token of redaction characters, e.g. "XXXX", "XX/XX/XXXX" or "XX/XX/2019",
+# and runs of such tokens.
+_redaction = r'\b[X\d/]*XX[X\d/]*\b'
+_redaction_run = re.compile(_redaction + r'(?:\s+' + _redaction + ')*')
+
+REDACTION = 'XXXX'
+
+
+def normalize_text(texts):
+    """
+    Replace every run of redaction tokens in `texts` with a single "XXXX",
+    collapse whitespace to single spaces and strip it from both ends.
+    Null texts become empty strings.
+    Returns a pandas.Series of normalized texts.
+    """
+    texts = pd.Series(texts, dtype=object).fillna('')
+    # Splitting and joining is several times faster than a regex.
+    return pd.Series([' '.join(_redaction_run.sub(REDACTION, text).split())
+                      for text in texts], index=texts.index, dtype=object)
+
+
+def _keys(texts):
+    # Normalized, lowercased texts, which duplicates are detected on.
+    return [text.lower() for text in normalize_text(texts)]
+
+
+def normalize_complaints(df, column='complaint'):
+    """
+    Preprocessing step normalizing the `column` texts of `df`, as
+    `normalize_text`, for complainer.preprocessing.Preprocessor's `steps`.
+    """
+    df = df.copy(deep=False)
+    df[column] = normalize_text(df[column]).values
+    return df
+
+
+def text_hashes(texts):
+    """
+    64 bit hash of each text after normalization and lowercasing, equal for
+    exact duplicates.
+    """
+    return _hash_keys(_keys(texts))
+
+
+def _hash_keys(keys):
+    if not len(keys):
+        return np.zeros(0, dtype=np.uint64)
+    return pd.util.hash_array(np.array(keys, dtype=object))
+
+
+def _mix(values):
+    # Hash uint64 values into well mixed uint64 values.
+    return pd.util.hash_array(values)
+
+
+class MinHasher:
+    """
+    MinHash signatures of word shingles.
+
+    Parameters
+    ----------
+    num_perm : int (default=64)
+        Number of hash functions, i.e. signature length.
+    shingle_size : int (default=5)
+        Number of consecutive words per shingle. Texts with fewer words are
+        a single shingle.
+    random_state : int (default=0)
+        Seed of the hash functions. Signatures are only comparable between
+        hashers with the same params.
+    """
+
+    def __init__(self, num_perm=64, shingle_size=5, random_state=0):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.random_state = random_state
+        rng = np.random.RandomState(random_state)
+        # Multiply-shift hash functions: (a * x + b) >> 32, with odd `a`.
+        self._a = (rng.randint(0, 2 ** 32, num_perm, dtype=np.uint64) << 32
+                   | rng.randint(0, 2 ** 32, num_perm, dtype=np.uint64)
+                   | np.uint64(1))
+        self._b = (rng.randint(0, 2 ** 32, num_perm, dtype=np.uint64) << 32
+                   | rng.randint(0, 2 ** 32, num_perm, dtype=np.uint64))
+
+    def shingles(self, texts):
+        """
+        Hashes of the word shingles of `texts`, after normalization and
+        lowercasing. Returns (shingle hashes, row of each shingle), with the
+        shingles of each row contiguous and rows in order.
+        """
+        return self._shingles(_keys(texts))
+
+    def _shingles(self, keys):
+        k = self.shingle_size
+        words = [key.split() for key in keys]
+        lengths = np.array([len(row) for row in words], dtype=np.int64)
+        tokens = np.array([word for row in words for word in row],
+                          dtype=object)
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        hashes = _hash_keys(tokens)
+
+        # Combine k consecutive word hashes, keeping shingles within a row.
+        n = max(len(tokens) - k + 1, 0)
+        shingles = hashes[:n].copy()
+        for j in range(1, k):
+            shingles = _mix(shingles ^ hashes[j:j + n])
+        valid = rows[:n] == rows[k - 1:k - 1 + n]
+        shingles, shingle_rows = shingles[valid], rows[:n][valid]
+
+        # Rows with fewer than k words are one shingle of all their words.
+        short = np.flatnonzero((lengths < k) & (lengths > 0))
+        if len(short):
+            starts = np.concatenate([[0], np.cumsum(lengths)])[short]
+            combined = hashes[starts]
+            for j in range(1, k):
+                more = j < lengths[short]
+                combined[more] = _mix(combined[more]
+                                      ^ hashes[starts[more] + j])
+            order = np.argsort(np.concatenate([shingle_rows, short]),
+                               kind='mergesort')
+            shingles = np.concatenate([shingles, combined])[order]
+            shingle_rows = np.concatenate([shingle_rows, short])[order]
+        return shingles, shingle_rows
+
+    def signatures(self, texts):
+        """
+        MinHash signatures of `texts`, an array of shape
+        (len(texts), num_perm) of uint32. Empty texts have the maximum
+        value everywhere.
+        """
+        return self._signatures(_keys(texts))
+
+    def _signatures(self, keys):
+        shingles, rows = self._shingles(keys)
+        n = len(keys)
+        signatures = np.full((n, self.num_perm), np.iinfo(np.uint32).max,
+                             dtype=np.uint32)
+        if not len(shingles):
+            return signatures
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        with np.errstate(over='ignore'):
+            for p in range(self.num_perm):
+                values = ((self._a[p] * shingles + self._b[p])
+                          >> np.uint64(32)).astype(np.uint32)
+                signatures[rows[starts], p] = np.minimum.reduceat(values,
+                                                                  starts)
+        return signatures
+
+
+def _bucket_edges(keys):
+    # Edges from every row to the first row with the same key.
+    if not len(keys):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    order = np.argsort(keys, kind='mergesort')
+    sorted_keys = keys[order]
+    first = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+    representative = order[np.flatnonzero(first)[np.cumsum(first) - 1]]
+    duplicate = representative != order
+    return order[duplicate], representative[duplicate]
+
+
+def _clusters(n, sources, targets):
+    # Union-find over the edges, as connected components. Each cluster is
+    # labelled by its first row.
+    if not n:
+        return np.zeros(0, dtype=np.int64)
+    graph = scipy.sparse.coo_matrix(
+        (np.ones(len(sources), dtype=np.int8), (sources, targets)),
+        shape=(n, n)
+    )
+    _, labels = connected_components(graph, directed=False)
+    _, first = np.unique(labels, return_index=True)
+    return first[labels].astype(np.int64)
+
+
+def exact_duplicate_clusters(texts):
+    """
+    Cluster rows whose texts are equal after normalization and lowercasing.
+    Returns the position of the first row of each row's cluster.
+    """
+    return DuplicateDetector(near=False).update(texts).clusters()
+
+
+def near_duplicate_clusters(signatures, bands=8, threshold=0.8):
+    """
+    Cluster rows with similar MinHash `signatures`.
+
+    Rows sharing all values of any of `bands` equal slices of their
+    signatures are candidate pairs, which are linked if their signatures
+    agree on at least a `threshold` fraction of values (an estimate of the
+    Jaccard similarity of their shingles). Clusters are the connected
+    components of the links, so clusters can chain.
+
+    Parameters
+    ----------
+    signatures : numpy.ndarray
+        Signatures, of shape (rows, num_perm), from `MinHasher.signatures`.
+    bands : int (default=8)
+        Number of LSH bands. Must divide num_perm. More bands find pairs of
+        lower similarity, at the cost of more candidates.
+    threshold : float (default=0.8)
+        Minimum estimated similarity of linked rows.
+    Returns
+    -------
+    clusters : numpy.ndarray of int64
+        The position of the first row of each row's cluster.
+    """
+    n, num_perm = signatures.shape
+    if num_perm % bands:
+        raise(ValueError(
+            "bands ({}) must divide the signature length ({})".format(
+                bands, num_perm)
+        ))
+    width = num_perm // bands
+    empty = (signatures == np.iinfo(np.uint32).max).all(axis=1)
+
+    sources, targets = [], []
+    for band in range(bands):
+        block = signatures[:, band * width:(band + 1) * width]
+        keys = np.zeros(n, dtype=np.uint64)
+        for column in block.T:
+            keys = _mix(keys ^ column.astype(np.uint64))
+        source, target = _bucket_edges(keys)
+        similar = ((signatures[source] == signatures[target]).mean(axis=1)
+                   >= threshold) & ~empty[source]
+        sources.append(source[similar])
+        targets.append(target[similar])
+
+    return _clusters(n, np.concatenate(sources), np.concatenate(targets))
+
+
+class DuplicateDetector:
+    """
+    Cluster exact and, if `near`, near duplicate texts, accumulated over
+    chunks, so rows of different chunks are compared too.
+
+    Each chunk is normalized once. Near duplicates are only searched among
+    the first row of every exact duplicate cluster, and only those rows'
+    MinHash signatures are kept, which takes num_perm * 4 bytes per row.
+
+    Parameters
+    ----------
+    near : bool (default=True)
+        Also cluster near duplicates.
+    num_perm, shingle_size, random_state
+        As `MinHasher`.
+    bands, threshold
+        As `near_duplicate_clusters`.
+
+    Example
+    -------
+    >>> detector = DuplicateDetector()
+    >>> for chunk in chunks:
+    ...     detector.update(chunk['Consumer complaint narrative'])
+    >>> clusters = detector.clusters()
+    """
+
+    def __init__(self,
+        near=True,
+        num_perm=64,
+        bands=8,
+        threshold=0.8,
+        shingle_size=5,
+        random_state=0):
+        self.near = near
+        self.bands = bands
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, shingle_size, random_state)
+        self.rows = 0
+        self._hashes = []
+        self._positions = []
+        self._signatures = []
+
+    def update(self, texts):
+        """
+        Add a chunk of `texts`. Returns self.
+        """
+        keys = _keys(texts)
+        hashes = _hash_keys(keys)
+        if self.near:
+            first = np.flatnonzero(~pd.Series(hashes).duplicated().values)
+            self._signatures.append(
+                self.hasher._signatures([keys[i] for i in first])
+            )
+            self._positions.append(first + self.rows)
+        self._hashes.append(hashes)
+        self.rows += len(keys)
+        return self
+
+    def clusters(self):
+        """
+        The position of the first row of each row's cluster, over every
+        chunk added, in order.
+        """
+        if not self.rows:
+            return np.zeros(0, dtype=np.int64)
+        hashes = np.concatenate(self._hashes)
+        exact = _clusters(self.rows, *_bucket_edges(hashes))
+        if not self.near:
+            return exact
+
+        positions = np.concatenate(self._positions)
+        unique = exact[positions] == positions
+        near_clusters = near_duplicate_clusters(
+            np.concatenate(self._signatures)[unique],
+            self.bands, self.threshold
+        )
+        # Map each exact cluster to the near cluster of its first row.
+        positions = positions[unique]
+        return positions[near_clusters][np.searchsorted(positions, exact)]
+
+
+def duplicate_clusters(texts, near=True, **kwargs):
+    """
+    Cluster exact and, if `near`, near duplicate texts. Keyword arguments
+    are passed to `DuplicateDetector`.
+    Returns the position of the first row of each row's cluster.
+    """
+    return DuplicateDetector(near=near, **kwargs).update(texts).clusters()
+
+
+def drop_duplicates(df, clusters):
+    """
+    Keep only the first row of every cluster of `df`, given each row's
+    `clusters` label from `duplicate_clusters`.
+    """
+    return df[np.asarray(clusters) == np.arange(len(df))]
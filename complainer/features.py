@@ -0,0 +1,507 @@
+"""
+Featurizers for turning complaint text into sparse feature matrices.
+"""
+
+import functools
+import json
+import numbers
+import os
+
+import numpy as np
+import scipy.sparse
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction.text import (
+    CountVectorizer, HashingVectorizer, TfidfTransformer, TfidfVectorizer
+)
+from sklearn.preprocessing import normalize
+
+from complainer.parallel import default_workers, imap_ordered
+
+
+class HashingTfidfVectorizer(BaseEstimator, TransformerMixin):
+    """
+    Stateless alternative to sklearn's TfidfVectorizer.
+    Terms are mapped to columns by feature hashing, so there is no vocabulary
+    to build or store, and the only fitted state is the document frequency
+    of each column. That can be accumulated over a stream of chunks with
+    `partial_fit`, in fixed memory and a single pass.
+
+    Like TfidfVectorizer, terms never seen during fitting get zero weight.
+    Unlike it, distinct terms can collide in the same column, which is rare
+    for a large `n_features`.
+
+    Parameters
+    ----------
+    n_features : int (default=2 ** 20)
+        Number of columns terms are hashed into.
+    ngram_range : tuple (default=(1, 1))
+        As sklearn's TfidfVectorizer.
+    lowercase : bool (default=True)
+        As sklearn's TfidfVectorizer.
+    token_pattern : string (default=r"(?u)\\b\\w\\w+\\b")
+        As sklearn's TfidfVectorizer.
+    norm : "l1", "l2" or None (default="l2")
+        As sklearn's TfidfVectorizer.
+    use_idf : bool (default=True)
+        As sklearn's TfidfVectorizer.
+    smooth_idf : bool (default=True)
+        As sklearn's TfidfVectorizer.
+    sublinear_tf : bool (default=False)
+        As sklearn's TfidfVectorizer.
+    dtype : numpy dtype (default=numpy.float32)
+        Type of the returned matrix.
+    """
+
+    def __init__(self,
+        n_features=2 ** 20,
+        ngram_range=(1, 1),
+        lowercase=True,
+        token_pattern=r"(?u)\b\w\w+\b",
+        norm='l2',
+        use_idf=True,
+        smooth_idf=True,
+        sublinear_tf=False,
+        dtype=np.float32):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.lowercase = lowercase
+        self.token_pattern = token_pattern
+        self.norm = norm
+        self.use_idf = use_idf
+        self.smooth_idf = smooth_idf
+        self.sublinear_tf = sublinear_tf
+        self.dtype = dtype
+
+    def _hash_counts(self, texts):
+        hashing = HashingVectorizer(n_features=self.n_features,
+                                    ngram_range=self.ngram_range,
+                                    lowercase=self.lowercase,
+                                    token_pattern=self.token_pattern,
+                                    alternate_sign=False,
+                                    norm=None,
+                                    dtype=self.dtype)
+        return hashing.transform(texts)
+
+    def _count_documents(self, counts):
+        if not hasattr(self, 'document_counts_'):
+            self.document_counts_ = np.zeros(self.n_features, dtype=np.int64)
+            self.n_documents_ = 0
+        # Each stored entry is one (document, column) pair.
+        self.document_counts_ += np.bincount(counts.indices,
+                                             minlength=self.n_features)
+        self.n_documents_ += counts.shape[0]
+        # Column weights are derived from the document counts on first use.
+        self._weights = None
+
+    def _reset(self):
+        for attribute in ['document_counts_', 'n_documents_', '_weights']:
+            if hasattr(self, attribute):
+                delattr(self, attribute)
+
+    def partial_fit(self, texts, y=None):
+        """
+        Update document frequencies with the documents in `texts`.
+        """
+        self._count_documents(self._hash_counts(texts))
+        return self
+
+    def fit(self, texts, y=None):
+        """
+        Learn document frequencies from the documents in `texts`.
+        """
+        self._reset()
+        self.partial_fit(texts)
+        self._column_weights()
+        return self
+
+    def fit_transform(self, texts, y=None):
+        """
+        Learn document frequencies from the documents in `texts` and
+        transform them, hashing them only once.
+        """
+        self._reset()
+        X = self._hash_counts(texts)
+        self._count_documents(X)
+        return self._weigh(X)
+
+    @property
+    def idf_(self):
+        """
+        Inverse document frequency of each column, as TfidfVectorizer.
+        Zero for columns with no documents.
+        """
+        return self._idf()
+
+    def _idf(self):
+        document_counts = self.document_counts_.astype(np.float64)
+        n_documents = float(self.n_documents_)
+        if self.smooth_idf:
+            document_counts += 1
+            n_documents += 1
+        seen = self.document_counts_ > 0
+        idf = np.zeros(self.n_features, dtype=np.float64)
+        idf[seen] = np.log(n_documents / document_counts[seen]) + 1
+        return idf
+
+    def _column_weights(self):
+        # The weight of each column: its idf, or, without idf, whether any
+        # document had it. Computed once per fit, not on every transform.
+        if getattr(self, '_weights', None) is None:
+            if self.use_idf:
+                weights = self._idf()
+            else:
+                weights = self.document_counts_ > 0
+            self._weights = weights.astype(self.dtype)
+        return self._weights
+
+    def _weigh(self, X):
+        X = X.tocsr()
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+        X.data *= self._column_weights()[X.indices]
+        X.eliminate_zeros()
+        if self.norm:
+            X = normalize(X, norm=self.norm, copy=False)
+        return X
+
+    def transform(self, texts):
+        """
+        Transform the documents in `texts` to a tf-idf weighted matrix.
+        """
+        return self._weigh(self._hash_counts(texts))
+
+    def __getstate__(self):
+        # Store only the non-zero document frequencies, which keeps the
+        # pickled artifact proportional to the number of distinct terms seen.
+        state = self.__dict__.copy()
+        state.pop('_weights', None)
+        if 'document_counts_' in state:
+            counts = state.pop('document_counts_')
+            columns = np.flatnonzero(counts)
+            state['_document_count_columns'] = columns.astype(np.int32)
+            state['_document_count_values'] = counts[columns]
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        if '_document_count_columns' in state:
+            counts = np.zeros(state['n_features'], dtype=np.int64)
+            counts[state.pop('_document_count_columns')] = \
+                state.pop('_document_count_values')
+            state['document_counts_'] = counts
+        self.__dict__.update(state)
+
+
+# Params of a TfidfVectorizer that determine how text is split into terms.
+# Everything else (n-gram sizes kept, document frequency limits, weighting)
+# can be derived from term counts.
+tokenization_params = ['lowercase', 'strip_accents', 'stop_words',
+                       'token_pattern']
+
+
+class TermCounts:
+    """
+    Term counts of a corpus, tokenized once.
+
+    Tokenizing is the expensive part of tf-idf. Term counts hold everything
+    a TfidfVectorizer learns from a corpus, so vectorizers with any n-gram
+    range within the counted one, any document frequency limits and any
+    weighting can be derived from them by sparse array operations, exactly
+    as if fitted on the text (see `tfidf`).
+
+    Create with `TermCounts.from_texts`, or `TermCounts.load`.
+
+    Attributes
+    ----------
+    counts : scipy.sparse.csr_matrix
+        Count of each term (column) in each document (row), int64.
+    terms : numpy array of strings
+        Term of each column, in sorted order.
+    params : dict
+        Tokenization params, and the counted "ngram_range".
+    """
+
+    def __init__(self, counts, terms, params):
+        # Canonical (sorted) order of entries within rows, so counts are
+        # identical however they were computed.
+        self.counts = scipy.sparse.csr_matrix(counts)
+        self.counts.has_sorted_indices = False
+        self.counts.sort_indices()
+        self.terms = np.asarray(terms)
+        self.params = dict(params)
+        self.params['ngram_range'] = tuple(self.params['ngram_range'])
+
+    @classmethod
+    def from_texts(cls,
+        texts,
+        ngram_range=(1, 1),
+        lowercase=True,
+        strip_accents=None,
+        stop_words=None,
+        token_pattern=r"(?u)\b\w\w+\b",
+        executor=None,
+        n_shards=None):
+        """
+        Count the terms of `texts`, with tokenization params as sklearn's
+        TfidfVectorizer. Derived vectorizers may use any n-gram range within
+        `ngram_range`.
+
+        With an `executor`, `texts` are split into `n_shards` contiguous
+        shards (default: four per core) that are tokenized in parallel, and
+        their vocabularies merged. The result is identical to the serial
+        one.
+        """
+        params = {'ngram_range': tuple(ngram_range),
+                  'lowercase': lowercase,
+                  'strip_accents': strip_accents,
+                  'stop_words': stop_words,
+                  'token_pattern': token_pattern}
+        if executor is None:
+            return cls(*_count_shard(texts, params), params)
+
+        shards = _shards(texts, n_shards)
+        results = list(imap_ordered(
+            functools.partial(_count_shard, params=params, allow_empty=True),
+            shards,
+            executor
+        ))
+        terms = np.unique(np.concatenate(
+            [np.asarray(shard_terms, dtype=object)
+             for _, shard_terms in results]
+        ).astype(str))
+        if len(terms) == 0:
+            raise(ValueError(
+                "empty vocabulary; perhaps the documents only contain stop "
+                "words"
+            ))
+        counts = []
+        for shard_counts, shard_terms in results:
+            # Shard terms are sorted, so their columns map to the merged
+            # vocabulary in order.
+            columns = np.searchsorted(terms,
+                                      np.asarray(shard_terms, dtype=str))
+            shard_counts = scipy.sparse.csr_matrix(shard_counts)
+            counts.append(scipy.sparse.csr_matrix(
+                (shard_counts.data, columns[shard_counts.indices],
+                 shard_counts.indptr),
+                shape=(shard_counts.shape[0], len(terms))
+            ))
+        return cls(scipy.sparse.vstack(counts, format='csr'), terms, params)
+
+    def count(self, texts, executor=None, n_shards=None):
+        """
+        Term counts of other `texts` over the same terms (e.g. of a dev set,
+        to be scored with vectorizers derived from this training set).
+        With an `executor`, shards of `texts` are counted in parallel, as
+        `from_texts`.
+        """
+        count = functools.partial(_count_known_terms, terms=self.terms,
+                                  params=self.params)
+        if executor is None:
+            counts = count(texts)
+        else:
+            counts = scipy.sparse.vstack(
+                list(imap_ordered(count, _shards(texts, n_shards), executor)),
+                format='csr'
+            )
+        return TermCounts(counts, self.terms, self.params)
+
+    def _ngram_counts(self, ngram_range):
+        """
+        Columns of n-grams with sizes in `ngram_range`, and their counts,
+        which are exactly those CountVectorizer would produce with that
+        range.
+        """
+        counted = self.params['ngram_range']
+        if ngram_range is None or tuple(ngram_range) == counted:
+            return np.arange(len(self.terms)), self.counts
+        if ngram_range[0] < counted[0] or ngram_range[1] > counted[1]:
+            raise(ValueError(
+                "ngram_range {} is not within the counted {}".format(
+                    tuple(ngram_range), counted)
+            ))
+        # Terms are space separated tokens; tokens never contain spaces.
+        sizes = np.char.count(self.terms.astype(str), ' ') + 1
+        mask = (sizes >= ngram_range[0]) & (sizes <= ngram_range[1])
+        new_columns = np.cumsum(mask) - 1
+        entries = mask[self.counts.indices]
+        indptr = np.concatenate([[0], np.cumsum(entries)])[self.counts.indptr]
+        counts = scipy.sparse.csr_matrix(
+            (self.counts.data[entries],
+             new_columns[self.counts.indices[entries]],
+             indptr),
+            shape=(self.counts.shape[0], int(mask.sum()))
+        )
+        return np.flatnonzero(mask), counts
+
+    def _limit(self, counts, min_df, max_df, max_features, binary, dtype):
+        # As sklearn's CountVectorizer._limit_features.
+        n_documents = counts.shape[0]
+        high = max_df if isinstance(max_df, numbers.Integral) \
+            else max_df * n_documents
+        low = min_df if isinstance(min_df, numbers.Integral) \
+            else min_df * n_documents
+        if high < low:
+            raise(ValueError("max_df corresponds to < documents than min_df"))
+        document_frequency = np.bincount(counts.indices,
+                                         minlength=counts.shape[1])
+        keep = (document_frequency <= high) & (document_frequency >= low)
+        if max_features is not None and keep.sum() > max_features:
+            counts = counts.astype(dtype)
+            if binary:
+                counts.data[:] = 1
+            term_frequency = np.asarray(counts.sum(axis=0)).ravel()
+            top = (-term_frequency[keep]).argsort()[:max_features]
+            limited = np.zeros(len(keep), dtype=bool)
+            limited[np.flatnonzero(keep)[top]] = True
+            keep = limited
+        if not keep.any():
+            raise(ValueError(
+                "After pruning, no terms remain. "
+                "Try a lower min_df or a higher max_df."
+            ))
+        return np.flatnonzero(keep)
+
+    def columns(self,
+        ngram_range=None,
+        min_df=1,
+        max_df=1.0,
+        max_features=None,
+        binary=False,
+        dtype=np.float64):
+        """
+        Indices of the columns a TfidfVectorizer with these params, and the
+        tokenization params of these counts, would keep when fitted on the
+        counted texts.
+        `dtype` is the vectorizer's; it can break ties for `max_features`.
+        """
+        selected, counts = self._ngram_counts(ngram_range)
+        return selected[self._limit(counts, min_df, max_df, max_features,
+                                    binary, dtype)]
+
+    def tfidf(self, **params):
+        """
+        Derive a fitted TfidfVectorizer, and the features of the counted
+        texts, without tokenizing again.
+        Equivalent to `TfidfVectorizer(**params).fit_transform(texts)`.
+
+        Parameters
+        ----------
+        **params
+            TfidfVectorizer params. Tokenization params (see
+            `tokenization_params`) default to, and must equal, those of the
+            counts, and "ngram_range" must be within the counted one.
+        Returns
+        -------
+        vectorizer : sklearn.feature_extraction.text.TfidfVectorizer
+            The fitted vectorizer.
+        X : scipy.sparse.csr_matrix
+            Features of the counted texts.
+        """
+        params = dict(params)
+        for name in tokenization_params:
+            if params.setdefault(name, self.params[name]) != self.params[name]:
+                raise(ValueError(
+                    "Counts were tokenized with {}={!r}, not {!r}".format(
+                        name, self.params[name], params[name])
+                ))
+        params.setdefault('ngram_range', (1, 1))
+        vectorizer = TfidfVectorizer(**params)
+
+        selected, counts = self._ngram_counts(vectorizer.ngram_range)
+        keep = self._limit(counts,
+                           vectorizer.min_df,
+                           vectorizer.max_df,
+                           vectorizer.max_features,
+                           vectorizer.binary,
+                           vectorizer.dtype)
+        columns = selected[keep]
+        X = counts[:, keep].astype(vectorizer.dtype)
+        if vectorizer.binary:
+            X.data[:] = 1
+
+        # What TfidfVectorizer.fit_transform leaves fitted.
+        vectorizer.vocabulary_ = {term: i for i, term in
+                                  enumerate(self.terms[columns].tolist())}
+        vectorizer.fixed_vocabulary_ = False
+        vectorizer._tfidf = TfidfTransformer(
+            norm=vectorizer.norm,
+            use_idf=vectorizer.use_idf,
+            smooth_idf=vectorizer.smooth_idf,
+            sublinear_tf=vectorizer.sublinear_tf
+        ).fit(X)
+        return vectorizer, vectorizer._tfidf.transform(X, copy=False)
+
+    def transform(self, vectorizer):
+        """
+        Features of the counted texts from `vectorizer`, derived with `tfidf`
+        from these or other counts with the same terms (see `count`).
+        Equivalent to `vectorizer.transform(texts)`.
+        """
+        terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        columns = np.searchsorted(self.terms, terms)
+        columns[columns == len(self.terms)] = 0
+        if len(self.terms) == 0 or (self.terms[columns] != terms).any():
+            raise(ValueError("Vectorizer has terms that were not counted"))
+        X = self.counts[:, columns].astype(vectorizer.dtype)
+        if vectorizer.binary:
+            X.data[:] = 1
+        return vectorizer._tfidf.transform(X, copy=False)
+
+    def save(self, directory):
+        """
+        Save to `directory`: counts.npz, terms.npy and params.json.
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        scipy.sparse.save_npz(os.path.join(directory, 'counts.npz'),
+                              self.counts, compressed=False)
+        np.save(os.path.join(directory, 'terms.npy'),
+                self.terms.astype(str))
+        params = dict(self.params)
+        if isinstance(params['stop_words'], (set, frozenset, list)):
+            params['stop_words'] = sorted(params['stop_words'])
+        with open(os.path.join(directory, 'params.json'), 'w') as f:
+            json.dump(params, f, indent=2)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Load term counts saved by `save`.
+        """
+        with open(os.path.join(directory, 'params.json')) as f:
+            params = json.load(f)
+        return cls(scipy.sparse.load_npz(os.path.join(directory,
+                                                      'counts.npz')),
+                   np.load(os.path.join(directory, 'terms.npy')),
+                   params)
+
+
+def _shards(texts, n_shards=None):
+    texts = list(texts)
+    if n_shards is None:
+        n_shards = 4 * default_workers()
+    n_shards = max(1, min(n_shards, len(texts)))
+    bounds = np.linspace(0, len(texts), n_shards + 1).astype(int)
+    return [texts[start:stop] for start, stop in zip(bounds, bounds[1:])]
+
+
+def _count_shard(texts, params, allow_empty=False):
+    counter = CountVectorizer(**params)
+    try:
+        counts = counter.fit_transform(texts)
+    except ValueError as error:
+        # A shard may have no terms even if the corpus does.
+        if not allow_empty or 'empty vocabulary' not in str(error):
+            raise
+        return scipy.sparse.csr_matrix((len(texts), 0), dtype=np.int64), []
+    terms = sorted(counter.vocabulary_, key=counter.vocabulary_.get)
+    return counts, terms
+
+
+def _count_known_terms(texts, terms, params):
+    counter = CountVectorizer(
+        vocabulary={term: i for i, term in enumerate(terms)}, **params
+    )
+    return counter.transform(texts)
@@ -0,0 +1,219 @@
+"""
+Incremental ingestion of the raw consumer complaints dump.
+
+The dump is republished in full every day, but only its newest complaints
+are new. A `Watermark` stored next to the outputs records the newest
+(Date received, Complaint ID) already processed, so a refresh only handles
+the rows above it and appends them to the outputs as a new part file (see
+complainer.storage), at a cost proportional to the new rows.
+
+Complaints are sometimes published late, dated days before the newest ones
+already processed. With a lookback window, the watermark also records the
+Complaint IDs of the complaints processed over its last days, and rows
+dated within the window whose IDs it has not seen are taken too.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+DATE_COLUMN = 'Date received'
+ID_COLUMN = 'Complaint ID'
+WATERMARK_FILE = '_watermark.json'
+
+
+def _dates(values):
+    return pd.to_datetime(pd.Series(values)).to_numpy()
+
+
+def _ids_by_date(dates, ids):
+    recent = {}
+    for date, complaint_id in zip(dates, ids):
+        recent.setdefault(pd.Timestamp(date), set()).add(int(complaint_id))
+    return recent
+
+
+class Watermark:
+    """
+    The newest complaint processed so far, ordered by date received and
+    then by complaint ID, and the number of part files written so far.
+
+    Parameters
+    ----------
+    date : string, pandas.Timestamp or None (default=None)
+        Date received of the newest complaint processed. None if nothing
+        has been processed yet.
+    complaint_id : int or None (default=None)
+        Complaint ID of the newest complaint processed.
+    parts : int (default=0)
+        Number of part files written so far, i.e. the number of the next
+        part.
+    since : string, pandas.Timestamp or None (default=None)
+        Start of the lookback window: every complaint processed that was
+        received on or after this date is in `recent`. None without a
+        window.
+    recent : dict or None (default=None)
+        Maps dates received from `since` on to the Complaint IDs processed
+        of that date.
+    """
+
+    def __init__(self,
+        date=None,
+        complaint_id=None,
+        parts=0,
+        since=None,
+        recent=None):
+        self.date = None if date is None else pd.Timestamp(date)
+        self.complaint_id = None if complaint_id is None \
+            else int(complaint_id)
+        self.parts = parts
+        self.since = None if since is None else pd.Timestamp(since)
+        self.recent = {pd.Timestamp(day): set(int(i) for i in ids)
+                       for day, ids in (recent or {}).items()}
+
+    def __repr__(self):
+        return ('Watermark(date={!r}, complaint_id={!r}, parts={!r}, '
+                'since={!r}, recent={} ids)').format(
+            self.date, self.complaint_id, self.parts, self.since,
+            sum(map(len, self.recent.values())))
+
+    def __eq__(self, other):
+        return (isinstance(other, Watermark)
+                and self.date == other.date
+                and self.complaint_id == other.complaint_id
+                and self.parts == other.parts
+                and self.since == other.since
+                and self.recent == other.recent)
+
+    def _replace(self, **changes):
+        params = dict(date=self.date, complaint_id=self.complaint_id,
+                      parts=self.parts, since=self.since, recent=self.recent)
+        params.update(changes)
+        return Watermark(**params)
+
+    @property
+    def earliest(self):
+        """
+        Earliest date received of the complaints that can still be new:
+        the start of the lookback window, if any, otherwise the date of the
+        watermark. None if every complaint is new.
+        """
+        return self.date if self.since is None else self.since
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Load the watermark stored in `directory`, or an empty watermark if
+        there is none.
+        """
+        path = os.path.join(directory, WATERMARK_FILE)
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def save(self, directory):
+        """
+        Store the watermark in `directory`, replacing any previous one
+        atomically.
+        """
+        path = os.path.join(directory, WATERMARK_FILE)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({
+                'date': None if self.date is None
+                else self.date.date().isoformat(),
+                'complaint_id': self.complaint_id,
+                'parts': self.parts,
+                'since': None if self.since is None
+                else self.since.date().isoformat(),
+                'recent': {day.date().isoformat(): sorted(ids)
+                           for day, ids in sorted(self.recent.items())}
+            }, f)
+        os.replace(tmp, path)
+
+    def _after(self, dates, ids):
+        # Rows after the newest complaint, by date and then by ID.
+        if self.date is None:
+            return np.ones(len(dates), dtype=bool)
+        date = self.date.to_datetime64()
+        return (dates > date) | ((dates == date) & (ids > self.complaint_id))
+
+    def newer(self, df):
+        """
+        Boolean mask of the rows of `df` newer than the watermark, or, with
+        a lookback window, received within it and not processed yet.
+        """
+        if self.date is None:
+            return np.ones(len(df), dtype=bool)
+        dates = _dates(df[DATE_COLUMN])
+        ids = np.asarray(df[ID_COLUMN])
+        mask = self._after(dates, ids)
+        if self.since is not None:
+            seen = [i for ids_of_day in self.recent.values()
+                    for i in ids_of_day]
+            mask |= ((dates >= self.since.to_datetime64())
+                     & ~np.isin(ids, seen))
+        return mask
+
+    def advance(self, df, lookback_days=0):
+        """
+        Watermark of the newest complaint of this watermark and `df`,
+        with the same number of parts.
+
+        With `lookback_days`, the watermark also records the Complaint IDs
+        of `df` received in the last `lookback_days` days before its date,
+        so that `newer` takes complaints published late within that window.
+        The window only starts where the IDs of every complaint processed
+        are known, so a watermark without one grows it over the days
+        following its date.
+        """
+        advanced = self._replace()
+        if len(df):
+            dates = _dates(df[DATE_COLUMN])
+            ids = np.asarray(df[ID_COLUMN])
+            latest = dates.max()
+            complaint_id = ids[dates == latest].max()
+            if self._after(np.array([latest]), np.array([complaint_id]))[0]:
+                advanced = self._replace(date=latest,
+                                         complaint_id=complaint_id)
+        if not lookback_days:
+            return advanced._replace(since=None, recent=None)
+        if advanced.date is None:
+            return advanced
+
+        # IDs are known from the start of the current window, or, without
+        # one, for every complaint after the date of this watermark (or
+        # every complaint, if it is empty).
+        if self.since is not None:
+            known = self.since
+        elif self.date is not None:
+            known = self.date + pd.Timedelta(days=1)
+        else:
+            known = None
+        since = advanced.date - pd.Timedelta(days=lookback_days)
+        if known is not None:
+            since = max(since, known)
+
+        recent = {day: set(ids_of_day)
+                  for day, ids_of_day in self.recent.items() if day >= since}
+        if len(df):
+            window = dates >= since.to_datetime64()
+            for day, ids_of_day in _ids_by_date(dates[window],
+                                                ids[window]).items():
+                recent.setdefault(day, set()).update(ids_of_day)
+        return advanced._replace(since=since, recent=recent)
+
+
+def newer_rows(chunks, watermark):
+    """
+    Lazily yield the rows of each chunk newer than `watermark`, skipping
+    chunks with none.
+    """
+    for chunk in chunks:
+        chunk = chunk[watermark.newer(chunk)]
+        if len(chunk):
+            yield chunk
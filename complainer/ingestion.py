@@ -0,0 +1,113 @@
+"""
+Functions for streaming the raw consumer complaints data from disk.
+"""
+
+import pandas as pd
+from pandas.api.types import CategoricalDtype, union_categoricals
+
+
+NARRATIVE_COLUMN = 'Consumer complaint narrative'
+
+
+# Only the columns that downstream jobs actually use are read from the raw
+# dump. Everything else is dropped by the parser before it is materialized.
+raw_dtypes = {
+    'Date received': 'category',
+    'Product': 'category',
+    'Issue': 'category',
+    NARRATIVE_COLUMN: 'object',
+    'Complaint ID': 'int64'
+}
+
+
+def read_complaints_chunked(filename,
+    chunksize=100000,
+    usecols=None,
+    dtype=None):
+    """
+    Lazily read the raw consumer complaints csv in chunks of at most
+    `chunksize` rows, retaining only complaints that have a narrative.
+
+    Parameters
+    ----------
+    filename : string or file-like
+        Path to the raw consumer complaints csv.
+    chunksize : int (default=100000)
+        Maximum number of raw rows parsed into memory at once.
+    usecols : list of strings or None (default=None)
+        Columns to read. Defaults to the keys of `raw_dtypes`.
+    dtype : dict or None (default=None)
+        Column to dtype mapping passed to the parser.
+        Defaults to `raw_dtypes`, restricted to `usecols`.
+    Returns
+    -------
+    chunks : generator of pandas.DataFrame
+        Chunks of the raw data, each containing only complaints with a
+        non-null narrative, and only the `usecols` columns.
+    """
+    if usecols is None:
+        usecols = list(raw_dtypes)
+    if dtype is None:
+        dtype = {col: raw_dtypes[col] for col in usecols if col in raw_dtypes}
+
+    reader = pd.read_csv(filename,
+                         usecols=usecols,
+                         dtype=dtype,
+                         chunksize=chunksize)
+
+    for chunk in reader:
+        chunk = chunk[chunk[NARRATIVE_COLUMN].notnull()]
+        if len(chunk):
+            yield chunk
+
+
+def read_complaints(filename, chunksize=100000, usecols=None, dtype=None):
+    """
+    Read the raw consumer complaints csv into a single pandas.DataFrame,
+    retaining only complaints that have a narrative.
+    Streams the file with `read_complaints_chunked`, so only the retained
+    rows and columns are ever held in memory.
+
+    Parameters
+    ----------
+    As `read_complaints_chunked`.
+    Returns
+    -------
+    df : pandas.DataFrame
+        Complaints with a non-null narrative, and only the `usecols` columns.
+    """
+    chunks = list(read_complaints_chunked(filename,
+                                          chunksize=chunksize,
+                                          usecols=usecols,
+                                          dtype=dtype))
+    if not chunks:
+        return pd.DataFrame(columns=usecols or list(raw_dtypes))
+    return concat_chunks(chunks)
+
+
+def concat_chunks(chunks):
+    """
+    Concatenate DataFrame chunks, keeping categorical columns categorical.
+    Categories usually differ chunk to chunk, in which case `pandas.concat`
+    would fall back to (much larger) object columns.
+
+    Parameters
+    ----------
+    chunks : list of pandas.DataFrame
+        Chunks with identical columns.
+    Returns
+    -------
+    df : pandas.DataFrame
+        All rows of `chunks`, in order, with a fresh RangeIndex.
+    """
+    columns = {}
+    for col in chunks[0].columns:
+        if isinstance(chunks[0][col].dtype, CategoricalDtype):
+            columns[col] = union_categoricals(
+                [chunk[col] for chunk in chunks], sort_categories=True
+            ).remove_unused_categories()
+        else:
+            columns[col] = pd.concat(
+                [chunk[col] for chunk in chunks], ignore_index=True
+            ).values
+    return pd.DataFrame(columns, columns=chunks[0].columns)
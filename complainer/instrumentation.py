@@ -0,0 +1,315 @@
+"""
+Lightweight timing and memory instrumentation for jobs.
+
+A `RunLog` records, for each stage of a job, its wall time, CPU time, peak
+resident memory and the number of rows it processed, as one JSON object per
+line, so that runs can be compared and aggregated with any JSON tooling
+(e.g. `pandas.read_json(path, lines=True)`).
+
+Steps interleaved chunk by chunk (reading, featurizing, predicting,
+writing) are measured as `Stages`, each accumulating the time of all its
+chunks. Work done on worker processes is measured there with `timed`, and
+added to the stages of the main process.
+"""
+
+import collections
+import contextlib
+import datetime
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+
+
+def _reset_peak_rss():
+    # Linux resets the peak resident set size (VmHWM) of a process when "5"
+    # is written to its clear_refs. Elsewhere the peak is since start up.
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """
+    Peak resident set size of this process in bytes: since the last reset
+    where supported (Linux), otherwise since the process started.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class Stage:
+    """
+    Measurements of one stage, as yielded by `RunLog.stage`.
+    Set `rows` (and add to `extra`) inside the stage when they are only known
+    once it has run.
+    """
+
+    def __init__(self, name, rows=None, **extra):
+        self.name = name
+        self.rows = rows
+        self.extra = extra
+        self.seconds = None
+        self.cpu_seconds = None
+        self.peak_rss_bytes = None
+        self.peak_since_start = None
+
+
+@contextlib.contextmanager
+def timed(timings, name):
+    """
+    Context manager adding the wall and CPU seconds of its block to
+    `timings[name]`, a list [seconds, cpu_seconds]. `timings` is a plain
+    dict, so work done on a worker process can be timed there and returned
+    with its result, to be added to `Stages` with `Stages.update`.
+    CPU time is of the calling thread.
+    """
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        total = timings.setdefault(name, [0.0, 0.0])
+        total[0] += time.perf_counter() - wall
+        total[1] += time.thread_time() - cpu
+
+
+class Stages:
+    """
+    Stages entered many times, interleaved, e.g. once per chunk for reading,
+    featurizing and writing it, as yielded by `RunLog.interleaved`.
+    Each stage accumulates the wall time, CPU time and rows of all its
+    entries. A stage entered within another, e.g. reading chunks lazily
+    while splitting them, counts only toward the inner stage.
+    Stages are created when first used, and may be entered from several
+    threads at once (their times then add up to more than the elapsed
+    time).
+    """
+
+    def __init__(self):
+        self.stages = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def add(self, name, seconds, cpu_seconds=0.0, rows=None):
+        """
+        Add `seconds`, `cpu_seconds` and `rows` to the stage `name`, e.g.
+        measured on a worker process. A stage's rows are None until some
+        are added.
+        """
+        with self._lock:
+            if name not in self.stages:
+                stage = Stage(name, entries=0)
+                stage.seconds = stage.cpu_seconds = 0.0
+                self.stages[name] = stage
+            stage = self.stages[name]
+            stage.seconds += seconds
+            stage.cpu_seconds += cpu_seconds
+            if rows is not None:
+                stage.rows = (stage.rows or 0) + rows
+            stage.extra['entries'] += 1
+
+    def update(self, timings, rows=None):
+        """
+        Add the `timings` of `timed` to their stages, with `rows` each.
+        """
+        for name, (seconds, cpu_seconds) in timings.items():
+            self.add(name, seconds, cpu_seconds, rows)
+
+    @contextlib.contextmanager
+    def _timed(self, timings, name):
+        # As `timed`, less the time of the stages entered within the block
+        # on this thread, which is added to the enclosing stage's instead.
+        nested = self._local.__dict__.setdefault('nested', [])
+        nested.append([0.0, 0.0])
+        try:
+            with timed(timings, name):
+                yield
+        finally:
+            inner = nested.pop()
+            seconds, cpu_seconds = timings[name]
+            if nested:
+                nested[-1][0] += seconds
+                nested[-1][1] += cpu_seconds
+            timings[name] = [seconds - inner[0], cpu_seconds - inner[1]]
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        """
+        Context manager adding the time of its block, and `rows`, to the
+        stage `name`. Yields a `Stage` whose `rows` may be set inside the
+        block instead.
+        """
+        stage = Stage(name, rows)
+        timings = {}
+        try:
+            with self._timed(timings, name):
+                yield stage
+        finally:
+            self.update(timings, stage.rows)
+
+    def iterate(self, name, iterable, rows=len):
+        """
+        Yield the items of `iterable` (e.g. chunks read lazily), adding the
+        time taken to produce each, and its `rows` (a function of the item,
+        by default its length, or returning None if unknown), to the stage
+        `name`.
+        """
+        iterator = iter(iterable)
+        while True:
+            timings = {}
+            try:
+                with self._timed(timings, name):
+                    item = next(iterator)
+            except StopIteration:
+                return
+            self.update(timings, rows(item))
+            yield item
+
+
+class RunLog:
+    """
+    Append-only JSON-lines log of one run of a job.
+
+    Parameters
+    ----------
+    path : string or None
+        File to append records to. If None (or empty), nothing is written,
+        but stages are still measured, so jobs can be instrumented
+        unconditionally.
+    job : string
+        Name of the job, recorded on every line.
+    """
+
+    def __init__(self, path, job):
+        self.path = path or None
+        self.job = job
+        self.run = uuid.uuid4().hex
+        self.stages = []
+
+    def write(self, event, **fields):
+        """
+        Append a record of `event` with `fields` to the log.
+        """
+        if self.path is None:
+            return
+        record = {
+            'run': self.run,
+            'job': self.job,
+            'event': event,
+            'time': datetime.datetime.now().isoformat()
+        }
+        record.update(fields)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+
+    def params(self, **params):
+        """
+        Record the params of the run.
+        """
+        self.write('params', params=params)
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None, **extra):
+        """
+        Context manager measuring the stage `name`.
+
+        Example
+        -------
+        >>> with log.stage('read') as stage:
+        ...     df = read_table(path)
+        ...     stage.rows = len(df)
+
+        Records wall time, CPU time of this process, peak resident memory
+        during the stage, rows processed, and any `extra` fields. If the
+        stage raises, the error is recorded too.
+        """
+        stage = Stage(name, rows, **extra)
+        stage.peak_since_start = not _reset_peak_rss()
+        wall, cpu = time.perf_counter(), time.process_time()
+        error = None
+        try:
+            yield stage
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            stage.seconds = time.perf_counter() - wall
+            stage.cpu_seconds = time.process_time() - cpu
+            stage.peak_rss_bytes = peak_rss()
+            self._record(stage, error)
+
+    @contextlib.contextmanager
+    def interleaved(self):
+        """
+        Context manager measuring interleaved stages, e.g. reading,
+        featurizing and writing chunk by chunk.
+
+        Example
+        -------
+        >>> with log.interleaved() as stages:
+        ...     for chunk in stages.iterate('read', iter_table(path)):
+        ...         with stages.stage('featurize', rows=len(chunk)):
+        ...             X = vectorizer.transform(chunk.complaint)
+
+        Records each stage of the yielded `Stages` once the block exits, with
+        its total wall time, CPU time and rows over all its entries, and the
+        number of entries. Peak resident memory is that of the whole block,
+        and so the same for each stage. If the block raises, the error is
+        recorded with every stage.
+        """
+        stages = Stages()
+        peak_since_start = not _reset_peak_rss()
+        error = None
+        try:
+            yield stages
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            peak = peak_rss()
+            for stage in stages.stages.values():
+                stage.peak_rss_bytes = peak
+                stage.peak_since_start = peak_since_start
+                self._record(stage, error)
+
+    def _record(self, stage, error=None):
+        self.stages.append(stage)
+        fields = {
+            'stage': stage.name,
+            'seconds': stage.seconds,
+            'cpu_seconds': stage.cpu_seconds,
+            'peak_rss_bytes': stage.peak_rss_bytes,
+            'peak_rss_since_start': stage.peak_since_start,
+            'rows': stage.rows
+        }
+        if error is not None:
+            fields['error'] = error
+        fields.update(stage.extra)
+        self.write('stage', **fields)
+
+    def summary(self):
+        """
+        One line per measured stage: name, seconds, cpu seconds, peak RSS in
+        MiB and rows.
+        """
+        return '\n'.join(
+            "{:<24} {:>9.3f}s {:>9.3f}s cpu {:>9.1f} MiB {:>10} rows".format(
+                stage.name, stage.seconds, stage.cpu_seconds,
+                stage.peak_rss_bytes / 2 ** 20,
+                '-' if stage.rows is None else stage.rows)
+            for stage in self.stages
+        )
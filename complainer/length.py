@@ -0,0 +1,267 @@
+"""
+Policies bounding the cost of very long complaint narratives.
+
+A few narratives run to tens of thousands of characters. Tokenizing and
+scoring cost grows with the length of a text, so those few dominate the
+worst case latency of featurization and scoring. A `LengthPolicy` truncates
+narratives to a maximum number of characters, keeping their head, their
+tail, or both; complainer.text.TextPolicy applies it in preprocessing and,
+saved with the model, again before scoring. Alternatively, a
+`ChunkPoolVectorizer` featurizes long narratives as windows of bounded
+length and pools the windows' rows, and `length_batches` groups texts of
+similar length into batches of bounded total length.
+
+Texts are cut at whitespace, so no partial words are produced unless a
+single word is longer than the limit.
+"""
+
+import re
+
+import numpy as np
+import scipy.sparse
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+
+KEEP = ['head', 'tail', 'head_tail']
+
+_last_word = re.compile(r'\s\S*$')
+_first_word = re.compile(r'^\S*\s')
+
+
+def _head(text, max_chars):
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    if not text[max_chars].isspace():
+        partial = _last_word.search(cut)
+        if partial is not None:
+            cut = cut[:partial.start()]
+    return cut.rstrip()
+
+
+def _tail(text, max_chars):
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= 0:
+        return ''
+    cut = text[-max_chars:]
+    if not text[-max_chars - 1].isspace():
+        partial = _first_word.search(cut)
+        if partial is not None:
+            cut = cut[partial.end():]
+    return cut.lstrip()
+
+
+def truncate_text(text, max_chars, keep='head'):
+    """
+    Truncate `text` to at most `max_chars` characters, cutting at
+    whitespace. `keep` is "head" (the start of the text), "tail" (its end)
+    or "head_tail" (about half of each, joined by a space).
+    """
+    if keep == 'head':
+        return _head(text, max_chars)
+    if keep == 'tail':
+        return _tail(text, max_chars)
+    if keep == 'head_tail':
+        if len(text) <= max_chars:
+            return text
+        tail_chars = max_chars // 2
+        return ' '.join([_head(text, max_chars - tail_chars - 1),
+                         _tail(text, tail_chars)])
+    raise(ValueError(
+        "keep must be one of {}, got {}".format(', '.join(KEEP), keep)
+    ))
+
+
+class LengthPolicy:
+    """
+    Truncate complaint texts to a maximum length.
+    Usable as a step of complainer.preprocessing.Preprocessor, and to
+    truncate texts before scoring them the same way.
+
+    Parameters
+    ----------
+    max_chars : int or None (default=None)
+        Maximum number of characters of each text. If None, texts are left
+        as they are.
+    keep : "head", "tail" or "head_tail" (default="head")
+        Which part of long texts to keep, as `truncate_text`.
+    column : string (default="complaint")
+        Column holding the texts, when called on a pandas.DataFrame.
+    """
+
+    def __init__(self, max_chars=None, keep='head', column='complaint'):
+        if keep not in KEEP:
+            raise(ValueError(
+                "keep must be one of {}, got {}".format(', '.join(KEEP), keep)
+            ))
+        if max_chars is not None and max_chars < 1:
+            raise(ValueError(
+                "max_chars must be positive, got {}".format(max_chars)
+            ))
+        self.max_chars = max_chars
+        self.keep = keep
+        self.column = column
+
+    def truncate(self, texts):
+        """
+        Truncate each of `texts`. Returns a list of strings.
+        """
+        if self.max_chars is None:
+            return list(texts)
+        return [truncate_text(text, self.max_chars, self.keep)
+                if len(text) > self.max_chars else text
+                for text in texts]
+
+    def __call__(self, df):
+        """
+        Truncate the `column` texts of the pandas.DataFrame `df`.
+        """
+        if self.max_chars is None:
+            return df
+        df = df.copy(deep=False)
+        df[self.column] = self.truncate(df[self.column].fillna(''))
+        return df
+
+    def __repr__(self):
+        return 'LengthPolicy(max_chars={}, keep={!r})'.format(
+            self.max_chars, self.keep)
+
+
+def chunk_texts(texts, max_chars):
+    """
+    Split each of `texts` into windows of whole words, each starting within
+    `max_chars` characters of the previous one's start, so windows are at
+    most `max_chars` long plus the length of one word. Empty texts are one
+    empty window.
+    Returns (windows, owners): the list of windows, in order, and the
+    position in `texts` of the text each window comes from.
+    """
+    windows, owners = [], []
+    for i, text in enumerate(texts):
+        if len(text) <= max_chars:
+            windows.append(text)
+            owners.append(i)
+            continue
+        words = text.split()
+        lengths = np.array([len(word) + 1 for word in words])
+        window_of = (np.cumsum(lengths) - lengths) // max_chars
+        starts = np.flatnonzero(np.r_[True, window_of[1:] != window_of[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(words)]):
+            windows.append(' '.join(words[start:end]))
+            owners.append(i)
+    return windows, np.array(owners, dtype=np.int64)
+
+
+def pool_rows(X, owners, n_rows, how='mean'):
+    """
+    Pool the rows of the sparse matrix `X` that belong to the same owner,
+    given the `owners` of its rows, into a matrix of `n_rows` rows.
+    `how` is "mean" or "max". Rows without any owned row are zero.
+    """
+    owners = np.asarray(owners)
+    if how == 'mean':
+        counts = np.bincount(owners, minlength=n_rows)
+        weights = 1.0 / counts[owners]
+        pooling = scipy.sparse.csr_matrix(
+            (weights.astype(X.dtype), (owners, np.arange(len(owners)))),
+            shape=(n_rows, X.shape[0])
+        )
+        return (pooling @ X).tocsr()
+    if how == 'max':
+        X = scipy.sparse.coo_matrix(X)
+        rows = owners[X.row]
+        order = np.lexsort((X.col, rows))
+        rows, cols, data = rows[order], X.col[order], X.data[order]
+        starts = np.flatnonzero(np.r_[True, (rows[1:] != rows[:-1])
+                                      | (cols[1:] != cols[:-1])])
+        if not len(data):
+            return scipy.sparse.csr_matrix((n_rows, X.shape[1]),
+                                           dtype=X.dtype)
+        return scipy.sparse.csr_matrix(
+            (np.maximum.reduceat(data, starts), (rows[starts], cols[starts])),
+            shape=(n_rows, X.shape[1])
+        )
+    raise(ValueError("how must be mean or max, got {}".format(how)))
+
+
+class ChunkPoolVectorizer(BaseEstimator, TransformerMixin):
+    """
+    Featurize texts by splitting them into windows of about `max_chars`
+    characters (see `chunk_texts`), featurizing each window with
+    `vectorizer`, and pooling the windows' rows back into one row per text.
+
+    Every row passed to `vectorizer` is then of bounded length, and long
+    texts are weighted by the average (or maximum) of their windows rather
+    than by their total term counts.
+
+    Parameters
+    ----------
+    vectorizer : sklearn-style vectorizer or None (default=None)
+        Featurizer of the windows, fitted on windows by `fit`. Defaults to
+        a TfidfVectorizer.
+    max_chars : int (default=2000)
+        Window length.
+    how : "mean" or "max" (default="mean")
+        How window rows are pooled, as `pool_rows`.
+    norm : "l1", "l2" or None (default="l2")
+        Normalization of the pooled rows.
+    """
+
+    def __init__(self,
+        vectorizer=None,
+        max_chars=2000,
+        how='mean',
+        norm='l2'):
+        self.vectorizer = vectorizer
+        self.max_chars = max_chars
+        self.how = how
+        self.norm = norm
+
+    def fit(self, texts, y=None):
+        windows, _ = chunk_texts(list(texts), self.max_chars)
+        self.vectorizer_ = self.vectorizer \
+            if self.vectorizer is not None else TfidfVectorizer()
+        self.vectorizer_.fit(windows)
+        return self
+
+    def transform(self, texts):
+        texts = list(texts)
+        windows, owners = chunk_texts(texts, self.max_chars)
+        X = pool_rows(self.vectorizer_.transform(windows), owners,
+                      len(texts), self.how)
+        if self.norm is not None:
+            X = normalize(X, norm=self.norm, copy=False)
+        return X
+
+
+def length_buckets(lengths, edges=(500, 2000, 10000)):
+    """
+    Bucket of each of `lengths`: 0 for lengths under edges[0], 1 for
+    lengths from edges[0] to under edges[1], and so on.
+    """
+    return np.searchsorted(np.asarray(edges), np.asarray(lengths),
+                           side='right')
+
+
+def length_batches(lengths, batch_chars):
+    """
+    Group rows of similar length into batches of about `batch_chars`
+    characters: rows are ordered by length and a new batch starts at the
+    first row starting past each multiple of `batch_chars`, so a batch
+    exceeds it by less than one row, and a row longer than `batch_chars`
+    is a batch of its own.
+    Returns a list of arrays of row positions, shortest rows first.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if not len(lengths):
+        return []
+    order = np.argsort(lengths, kind='mergesort')
+    ends = np.cumsum(lengths[order])
+    batch_of = (ends - lengths[order]) // batch_chars
+    # Rows longer than a batch start batches of their own.
+    batch_of = batch_of + np.cumsum(lengths[order] > batch_chars)
+    starts = np.flatnonzero(np.r_[True, batch_of[1:] != batch_of[:-1]])
+    return np.split(order, starts[1:])
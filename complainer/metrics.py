@@ -0,0 +1,171 @@
+"""
+Classification metrics accumulated over chunks of predictions.
+
+Every metric is derived from a single confusion matrix (and, optionally,
+per-class score histograms), so evaluating any number of rows takes one pass
+and memory proportional to the number of classes squared.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class StreamingMetrics:
+    """
+    Accumulate a confusion matrix, and optionally score histograms, over
+    chunks of targets and predictions.
+
+    Parameters
+    ----------
+    labels : list
+        Every class label that may appear in targets or predictions.
+    n_bins : int (default=1000)
+        Number of histogram bins for scores, for the score based ROC AUC.
+    score_range : tuple (default=(0, 1))
+        Range of the scores. Scores outside it fall into the outermost bins.
+    """
+
+    def __init__(self, labels, n_bins=1000, score_range=(0, 1)):
+        self.labels = list(labels)
+        self.n_bins = n_bins
+        self.score_range = score_range
+        k = len(self.labels)
+        self._index = pd.Index(self.labels)
+        self.confusion = np.zeros((k, k), dtype=np.int64)
+        # Per class, histograms of the class's score for rows that are
+        # (positive) and are not (negative) of that class.
+        self.positive_scores = np.zeros((k, n_bins), dtype=np.int64)
+        self.negative_scores = np.zeros((k, n_bins), dtype=np.int64)
+        self.scored = False
+
+    def _codes(self, values):
+        codes = self._index.get_indexer(np.asarray(values))
+        if (codes < 0).any():
+            unknown = set(np.asarray(values)[codes < 0])
+            raise(ValueError(
+                "Labels not in `labels`: {}".format(sorted(map(str, unknown)))
+            ))
+        return codes
+
+    def update(self, y_true, y_pred, scores=None):
+        """
+        Add a chunk of targets `y_true` and predictions `y_pred`, and
+        optionally `scores` of shape (rows, len(labels)), one column per
+        label in order.
+        """
+        k = len(self.labels)
+        true = self._codes(y_true)
+        pred = self._codes(y_pred)
+        self.confusion += np.bincount(true * k + pred,
+                                      minlength=k * k).reshape(k, k)
+
+        if scores is not None:
+            self.scored = True
+            low, high = self.score_range
+            bins = ((np.asarray(scores, dtype=np.float64) - low)
+                    / (high - low) * self.n_bins).astype(np.int64)
+            bins = np.clip(bins, 0, self.n_bins - 1)
+            is_positive = true[:, np.newaxis] == np.arange(k)
+            for c in range(k):
+                self.positive_scores[c] += np.bincount(
+                    bins[is_positive[:, c], c], minlength=self.n_bins)
+                self.negative_scores[c] += np.bincount(
+                    bins[~is_positive[:, c], c], minlength=self.n_bins)
+        return self
+
+    def confusion_matrix(self):
+        """
+        Confusion matrix with rows of true labels and columns of predicted
+        labels, in the order of `labels`. As sklearn.metrics.confusion_matrix.
+        """
+        return self.confusion.copy()
+
+    def support(self):
+        """
+        Number of rows of each true label.
+        """
+        return self.confusion.sum(axis=1)
+
+    def _average(self, values, average):
+        if average is None:
+            return values
+        if average == 'weighted':
+            support = self.support()
+            if not support.sum():
+                return 0.0
+            return float(np.average(values, weights=support))
+        if average == 'macro':
+            return float(np.mean(values))
+        raise(ValueError("Unknown average {}".format(average)))
+
+    def precision_recall_fscore_support(self, average='weighted'):
+        """
+        Precision, recall, f-score and support, per label (`average=None`)
+        or averaged ("weighted" by support, or "macro").
+        As sklearn.metrics.precision_recall_fscore_support, with undefined
+        ratios set to zero. Support is None when averaged.
+        """
+        true_positives = np.diag(self.confusion).astype(np.float64)
+        predicted = self.confusion.sum(axis=0)
+        support = self.support()
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(predicted > 0,
+                                 true_positives / predicted, 0.0)
+            recall = np.where(support > 0, true_positives / support, 0.0)
+            fscore = np.where(precision + recall > 0,
+                              2 * precision * recall / (precision + recall),
+                              0.0)
+
+        if average is None:
+            return precision, recall, fscore, support
+        return (self._average(precision, average),
+                self._average(recall, average),
+                self._average(fscore, average),
+                None)
+
+    def roc_auc(self, average='weighted'):
+        """
+        One-vs-rest ROC AUC per label (`average=None`) or averaged over
+        labels that occur ("weighted" by support, or "macro").
+
+        If scores were given to `update`, the AUC is computed from the score
+        histograms (exact up to the bin width). Otherwise it is the AUC of
+        the hard predictions, which is what sklearn.metrics.roc_auc_score
+        gives for label binarized targets and predictions.
+        """
+        k = len(self.labels)
+        n = self.confusion.sum()
+        support = self.support()
+        negatives = n - support
+
+        if self.scored:
+            # P(score of a positive > score of a negative), counting ties
+            # (same bin) as half.
+            negatives_below = (np.cumsum(self.negative_scores, axis=1)
+                               - self.negative_scores)
+            concordant = (self.positive_scores
+                          * (negatives_below + 0.5 * self.negative_scores)
+                          ).sum(axis=1)
+        else:
+            true_positives = np.diag(self.confusion)
+            false_positives = self.confusion.sum(axis=0) - true_positives
+            # Area under the curve through (0, 0), (FPR, TPR) and (1, 1),
+            # times positives * negatives.
+            concordant = (0.5 * (support * negatives
+                                 + true_positives * negatives
+                                 - false_positives * support))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            auc = concordant / (support * negatives)
+
+        defined = (support > 0) & (negatives > 0)
+        if average is None:
+            return np.where(defined, auc, np.nan)
+        if average == 'weighted':
+            if not support[defined].sum():
+                return float('nan')
+            return float(np.average(auc[defined], weights=support[defined]))
+        if average == 'macro':
+            return float(np.mean(auc[defined]))
+        raise(ValueError("Unknown average {}".format(average)))
@@ -0,0 +1,70 @@
+"""
+Utilities for running work over chunks of data in parallel.
+"""
+
+import collections
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def default_workers():
+    """
+    Number of worker processes to use by default: one per available core.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def make_executor(n_workers=None):
+    """
+    Create a process pool with `n_workers` workers (default: one per core),
+    or return None if `n_workers` is 1, meaning run serially.
+    """
+    if n_workers is None:
+        n_workers = default_workers()
+    if n_workers <= 1:
+        return None
+    return ProcessPoolExecutor(max_workers=n_workers)
+
+
+def imap_ordered(func, iterable, executor=None, max_pending=None):
+    """
+    Lazily apply `func` to every item of `iterable`, in parallel on
+    `executor`, yielding results in input order.
+    At most `max_pending` items are submitted but not yet yielded, so memory
+    stays bounded however long `iterable` is.
+    
+    Parameters
+    ----------
+    func : callable
+        Function of one argument. Must be picklable (e.g. defined at module
+        level, or a functools.partial of such) for process pools.
+    iterable : iterable
+        Items to apply `func` to. Consumed lazily.
+    executor : concurrent.futures.Executor or None (default=None)
+        Executor to run on. If None, `func` is applied serially.
+    max_pending : int or None (default=None)
+        Maximum number of in-flight items. Defaults to twice the number of
+        available cores.
+    Returns
+    -------
+    results : generator
+        `func(item)` for each item, in order.
+    """
+    if executor is None:
+        for item in iterable:
+            yield func(item)
+        return
+
+    if max_pending is None:
+        max_pending = 2 * default_workers()
+
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -2,13 +2,55 @@
 Functions for preprocessing mortgage complaints data.
 """
 
+import io
+import time
+
+import numpy as np
 import pandas as pd
 
+from complainer.instrumentation import timed
+
 
-def encode_targets(df, target_column, target_encoding_dict):
+def _encode_values(values, target_encoding_dict, categorical=False,
+                   name='target'):
+    """
+    Map `values` through `target_encoding_dict`, looking up each distinct
+    value once. Returns a numpy object array, or a pandas.Categorical if
+    `categorical`. See `encode_targets`.
+    """
+    codes, uniques = pd.factorize(values)
+
+    unknown = [value for value in uniques if value not in target_encoding_dict]
+    if unknown:
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        unknown_counts = {
+            value: int(count)
+            for value, count in zip(uniques, counts)
+            if value not in target_encoding_dict
+        }
+        raise(KeyError(
+            "{} values of {} are not in the target encoding "
+            "(value: number of rows): {}".format(
+                len(unknown_counts), name, unknown_counts)
+        ))
+
+    encoded_uniques = [target_encoding_dict[value] for value in uniques]
+
+    if categorical:
+        categories = sorted(set(target_encoding_dict.values()))
+        category_codes = pd.Index(categories).get_indexer(encoded_uniques)
+        return pd.Categorical.from_codes(
+            np.append(category_codes, -1)[codes], categories=categories
+        )
+    return np.array(encoded_uniques + [np.nan], dtype=object)[codes]
+
+
+def encode_targets(df, target_column, target_encoding_dict, categorical=False):
     """
     Replaces values in `df` target_column with the corresponding values
-    specified in the encoding_dict
+    specified in the encoding_dict.
+    The dictionary is looked up once per distinct value, rather than once per
+    row, and the original frame's data is not copied.
     
     Parameters
     ----------
@@ -18,15 +60,30 @@ def encode_targets(df, target_column, target_encoding_dict):
         Name of the target column to replace values of
     encoding_dict : string
         Dictionary containing current target value to desired value mapping
+    categorical : bool (default=False)
+        If True, return the target column as a categorical, with the sorted
+        values of `target_encoding_dict` as categories (stored as int8 codes
+        for up to 127 categories).
     Returns
     -------
     df : pandas.DataFrame (or indexable)
-        Input DataFrame, with values of target column replaced
+        Input DataFrame, with values of target column replaced.
+        Missing values remain missing.
+    Raises
+    ------
+    KeyError
+        If any values of the target column are not in `target_encoding_dict`.
+        The message lists every unknown value with its number of rows.
     """
-    df = df.copy() # do not mutate original frame
-    df[target_column] = df[target_column].apply(
-        lambda target: target_encoding_dict[target]
-    )
+    encoded = _encode_values(df[target_column],
+                             target_encoding_dict,
+                             categorical=categorical,
+                             name=target_column)
+
+    # Shallow copy: shares all other columns' data with the original frame,
+    # but assigning the new target column does not mutate the original.
+    df = df.copy(deep=False)
+    df[target_column] = pd.Series(encoded, index=df.index)
     return df
 
 
@@ -59,6 +116,264 @@ def filter_rename_mortgages(df):
     return mortgages
 
 
+def sanitize_csv_text(text):
+    """
+    Remove characters from raw csv text that the pandas C parser cannot
+    handle. Currently that is only NUL, which the C parser treats as the end
+    of the buffer.
+
+    Parameters
+    ----------
+    text : string
+        Raw csv text.
+    Returns
+    -------
+    text : string
+        Sanitized csv text.
+    """
+    return text.replace('\x00', '')
+
+
+def iter_record_blocks(f, chunksize=100000):
+    """
+    Split an open csv file into its header line and blocks of at most
+    `chunksize` complete records, without parsing the fields.
+    A record ends at the first line break outside quotes, so narratives
+    containing line breaks are never split across blocks.
+
+    Parameters
+    ----------
+    f : file-like
+        Text file positioned at the header line.
+        Should be opened with newline='' to keep line breaks within fields.
+    chunksize : int (default=100000)
+        Maximum number of records per block.
+    Returns
+    -------
+    header : string
+        The header line, including its line break.
+    blocks : generator of strings
+        Consecutive blocks of raw csv text, without the header.
+    """
+    header = f.readline()
+
+    def blocks():
+        lines = []
+        records = 0
+        open_quotes = False
+        for line in f:
+            lines.append(line)
+            # Escaped quotes are doubled, so only odd counts toggle state.
+            if line.count('"') % 2:
+                open_quotes = not open_quotes
+            if not open_quotes:
+                records += 1
+                if records == chunksize:
+                    yield ''.join(lines)
+                    lines = []
+                    records = 0
+        if lines:
+            yield ''.join(lines)
+
+    return header, blocks()
+
+
+def parse_block(header, block, **kwargs):
+    """
+    Parse a block of csv records with the fast C engine, falling back to the
+    python engine only if the C engine fails on this block.
+
+    Parameters
+    ----------
+    header : string
+        Header line of the csv.
+    block : string
+        Raw csv text of complete records, without the header.
+    **kwargs
+        Passed to pandas.read_csv.
+    Returns
+    -------
+    df : pandas.DataFrame
+        Parsed records.
+    engine : string
+        The engine that parsed the block, "c" or "python".
+    """
+    text = sanitize_csv_text(header + block)
+    try:
+        return pd.read_csv(io.StringIO(text), engine='c', **kwargs), 'c'
+    except pd.errors.ParserError:
+        return pd.read_csv(io.StringIO(text), engine='python', **kwargs), \
+            'python'
+
+
+def read_csv_robust(filename, chunksize=100000, stats=None, **kwargs):
+    """
+    Lazily read a csv of messy text data in chunks, using the C engine for
+    every chunk it can parse and the python engine only for those it cannot.
+
+    Parameters
+    ----------
+    filename : string
+        Path to the csv.
+    chunksize : int (default=100000)
+        Maximum number of records per chunk.
+    stats : dict or None (default=None)
+        If not None, updated in place with running totals of "rows",
+        "chunks", "fallback_chunks" and "seconds" spent reading, so that
+        callers can report throughput (see `rows_per_second`).
+    **kwargs
+        Passed to pandas.read_csv for every chunk.
+    Returns
+    -------
+    chunks : generator of pandas.DataFrame
+        Parsed chunks of the csv, in order.
+    """
+    if stats is None:
+        stats = {}
+    for key in ['rows', 'chunks', 'fallback_chunks', 'seconds']:
+        stats.setdefault(key, 0)
+
+    with open(filename, newline='', encoding='utf-8', errors='replace') as f:
+        header, blocks = iter_record_blocks(f, chunksize)
+        while True:
+            start = time.perf_counter()
+            block = next(blocks, None)
+            if block is None:
+                break
+            df, engine = parse_block(header, block, **kwargs)
+            stats['seconds'] += time.perf_counter() - start
+            stats['rows'] += len(df)
+            stats['chunks'] += 1
+            stats['fallback_chunks'] += engine != 'c'
+            yield df
+
+
+def preprocess_block(block, header, preprocessor, **kwargs):
+    """
+    Parse a block of raw csv records and preprocess it.
+    Parsing and preprocessing both happen in the calling process, so this
+    can run on a worker process with only the raw text sent to it.
+
+    Parameters
+    ----------
+    block : string
+        Raw csv text of complete records, without the header.
+    header : string
+        Header line of the csv.
+    preprocessor : callable
+        Applied to the parsed block, e.g. a `Preprocessor`.
+    **kwargs
+        Passed to pandas.read_csv.
+    Returns
+    -------
+    processed : pandas.DataFrame
+        Output of `preprocessor`.
+    rows : int
+        Number of records parsed.
+    engine : string
+        The engine that parsed the block, as `parse_block`.
+    timings : dict
+        Wall and CPU seconds of parsing ("parse") and preprocessing
+        ("preprocess"), as complainer.instrumentation.timed.
+    """
+    timings = {}
+    with timed(timings, 'parse'):
+        df, engine = parse_block(header, block, **kwargs)
+    with timed(timings, 'preprocess'):
+        processed = preprocessor(df)
+    return processed, len(df), engine, timings
+
+
+def preprocess_chunk(chunk, preprocessor):
+    """
+    Preprocess a parsed chunk, timing it, as `preprocess_block` does a block
+    of raw records. Returns (processed, rows, timings), the timings having
+    the single stage "preprocess".
+    """
+    timings = {}
+    with timed(timings, 'preprocess'):
+        processed = preprocessor(chunk)
+    return processed, len(chunk), timings
+
+
+def rows_per_second(stats):
+    """
+    Throughput of a `read_csv_robust` read, from its `stats` dict.
+    """
+    if not stats.get('seconds'):
+        return float('nan')
+    return stats['rows'] / stats['seconds']
+
+
+class Preprocessor:
+    """
+    Filter a product's complaints, retain and rename the complaint and issue
+    columns, and encode the issue, in a single pass.
+    This is equivalent to `filter_rename_mortgages` followed by
+    `encode_targets`, but each output column is allocated exactly once,
+    with no intermediate frames.
+    Further preprocessing steps can be composed onto the end.
+    
+    Parameters
+    ----------
+    product : string (default="Mortgage")
+        Value of the "Product" column to retain.
+    target_encoding_dict : dict or None (default=None)
+        Issue to encoded issue mapping. As `encode_targets`.
+        None means this module's `target_encoding_dict`.
+    categorical : bool (default=False)
+        Return the encoded issue as a categorical. As `encode_targets`.
+    steps : list of callables (default=())
+        Functions taking and returning a pandas.DataFrame with "complaint"
+        and "issue" columns, applied in order after the fused step.
+    """
+
+    def __init__(self,
+        product='Mortgage',
+        target_encoding_dict=None,
+        categorical=False,
+        steps=()):
+        self.product = product
+        self.target_encoding_dict = target_encoding_dict
+        self.categorical = categorical
+        self.steps = list(steps)
+
+    def transform(self, df):
+        """
+        Preprocess `df`, which must contain "Product", "Issue", and
+        "Consumer complaint narrative" columns.
+        Returns a new pandas.DataFrame with "complaint" and "issue" columns.
+        """
+        encoding = self.target_encoding_dict
+        if encoding is None:
+            encoding = target_encoding_dict
+
+        # Index the underlying arrays directly, so that only the retained
+        # rows of the two retained columns are ever copied.
+        mask = np.asarray(df['Product'] == self.product)
+
+        processed = pd.DataFrame({
+            'complaint': df['Consumer complaint narrative'].values[mask],
+            'issue': _encode_values(df['Issue'].values[mask],
+                                    encoding,
+                                    categorical=self.categorical,
+                                    name='Issue')
+        }, columns=['complaint', 'issue'])
+
+        for step in self.steps:
+            processed = step(processed)
+        return processed
+
+    __call__ = transform
+
+    def transform_chunks(self, chunks):
+        """
+        Lazily preprocess each pandas.DataFrame in the iterable `chunks`.
+        """
+        for chunk in chunks:
+            yield self.transform(chunk)
+
+
 target_encoding_dict = {
     "Loan servicing, payments, escrow account": "loan_servicing",
     "Loan modification,collection,foreclosure": "loan_modification",
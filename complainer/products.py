@@ -0,0 +1,72 @@
+"""
+The products that have a classifier, and how each encodes its issues.
+
+Every product has its own ontology of issues. `products` maps the value of
+the "Product" column to the encoding of that product's issues, merging
+issues that were renamed over the years of the Consumer Complaint Database
+into one class. To classify a new product, add its encoding here.
+"""
+
+import re
+
+from complainer.preprocessing import Preprocessor, target_encoding_dict
+
+
+student_loan_encoding_dict = {
+    "Dealing with your lender or servicer": "servicing",
+    "Dealing with my lender or servicer": "servicing",
+    "Struggling to repay your loan": "struggling_to_repay",
+    "Can't repay my loan": "struggling_to_repay",
+    "Getting a loan": "getting_a_loan"
+}
+
+debt_collection_encoding_dict = {
+    "Attempts to collect debt not owed": "debt_not_owed",
+    "Cont'd attempts collect debt not owed": "debt_not_owed",
+    "Written notification about debt": "notification",
+    "Disclosure verification of debt": "notification",
+    "Communication tactics": "communication_tactics",
+    "Electronic communications": "communication_tactics",
+    "False statements or representation": "false_statements",
+    "Took or threatened to take negative or legal action": "threats",
+    "Taking/threatening an illegal action": "threats",
+    "Threatened to contact someone or share information improperly":
+        "improper_sharing",
+    "Improper contact or sharing of info": "improper_sharing"
+}
+
+products = {
+    'Mortgage': target_encoding_dict,
+    'Student loan': student_loan_encoding_dict,
+    'Debt collection': debt_collection_encoding_dict
+}
+
+
+def encoding_of(product):
+    """
+    Issue encoding of `product`, a key of `products`.
+    """
+    if product not in products:
+        raise(ValueError(
+            "Unknown product {}, expected one of {}".format(
+                product, ', '.join(products))
+        ))
+    return products[product]
+
+
+def product_slug(product):
+    """
+    Name of `product` safe for paths, e.g. "student_loan".
+    """
+    return re.sub(r'[^a-z0-9]+', '_', product.lower()).strip('_')
+
+
+def product_preprocessor(product, **kwargs):
+    """
+    A complainer.preprocessing.Preprocessor of the complaints about
+    `product`, encoding issues with the product's encoding. Keyword
+    arguments are passed to the Preprocessor.
+    """
+    return Preprocessor(product=product,
+                        target_encoding_dict=encoding_of(product),
+                        **kwargs)
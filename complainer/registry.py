@@ -0,0 +1,283 @@
+"""
+A registry of trained models, one per product.
+
+Each product's vectorizer and model live in their own subdirectory of the
+registry, as written by the train_classifier job (pickles and a compact
+artifact), with a small JSON description. Products are registered
+independently, so models of different products can be trained in parallel
+and replaced one at a time.
+
+Every registration writes a new version directory inside the product's
+subdirectory, then atomically replaces a pointer file naming the current
+version. Readers resolve the pointer once and read that version, so a model
+being replaced stays readable while it is: the previous version is kept
+until the next registration.
+"""
+
+import datetime
+import functools
+import json
+import os
+import shutil
+import time
+
+import joblib
+
+from complainer.artifacts import load_vectorizer_and_model, save_compact
+from complainer.features import TermCounts, tokenization_params
+from complainer.parallel import imap_ordered
+from complainer.products import product_slug
+from complainer.storage import read_table
+from complainer.text import TextPolicy
+from complainer.classifiers import make_classifier
+
+
+METADATA_FILE = 'model.json'
+CURRENT_FILE = 'CURRENT'
+
+
+class ModelRegistry:
+    """
+    Registry of the models of each product, stored in `directory`.
+
+    Parameters
+    ----------
+    directory : string
+        Directory holding the registry. Created if it does not exist.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        # Workers training products in parallel may create it at once.
+        os.makedirs(directory, exist_ok=True)
+
+    def _current(self, product_directory):
+        # Directory of the current version, or None if there is none.
+        try:
+            with open(os.path.join(product_directory, CURRENT_FILE)) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return os.path.join(product_directory, version)
+
+    def path(self, product):
+        """
+        Directory of the current version of the model of `product`.
+        """
+        path = self._current(os.path.join(self.directory,
+                                          product_slug(product)))
+        if path is None:
+            raise(KeyError("No model registered for {}".format(product)))
+        return path
+
+    def products(self):
+        """
+        Products with a registered model, sorted.
+        """
+        products = []
+        for name in sorted(os.listdir(self.directory)):
+            path = self._current(os.path.join(self.directory, name))
+            if path is not None:
+                products.append(_read_metadata(path)['product'])
+        return sorted(products)
+
+    def metadata(self, product):
+        """
+        Description of the registered model of `product`: the product, its
+        classes, whether a compact artifact was saved, when it was
+        registered, the params of its text policy, and any extra metadata
+        given to `register`.
+        """
+        return _read_metadata(self.path(product))
+
+    def register(self,
+        product,
+        vectorizer,
+        model,
+        text_policy=None,
+        **metadata):
+        """
+        Save the fitted `vectorizer` and `model` of `product`, replacing any
+        registered before, with the complainer.text.TextPolicy their
+        training texts were prepared with (default: texts as they are).
+        They are written to a new version directory, then the product's
+        pointer file is atomically replaced to name it, so readers see
+        either the old model or the new one. The previous version is kept
+        for readers still loading it; older ones are removed.
+        Extra `metadata` must be JSON-serializable.
+        """
+        if text_policy is None:
+            text_policy = TextPolicy()
+        product_directory = os.path.join(self.directory,
+                                         product_slug(product))
+        previous = self._current(product_directory)
+        registered = datetime.datetime.now()
+        version = '{:%Y%m%dT%H%M%S%f}-{}'.format(registered, os.getpid())
+        path = os.path.join(product_directory, version)
+        os.makedirs(path)
+
+        joblib.dump(vectorizer, os.path.join(path, 'vectorizer.pkl'))
+        joblib.dump(model, os.path.join(path, 'model.pkl'))
+        text_policy.save(path)
+        try:
+            save_compact(vectorizer, model, os.path.join(path, 'compact'),
+                         text_policy)
+            compact = True
+        except TypeError:
+            compact = False
+
+        description = {
+            'product': product,
+            'classes': [str(label) for label in model.classes_],
+            'compact': compact,
+            'text': text_policy.to_dict(),
+            'registered': registered.isoformat()
+        }
+        description.update(metadata)
+        with open(os.path.join(path, METADATA_FILE), 'w') as f:
+            json.dump(description, f)
+
+        pointer = os.path.join(product_directory, CURRENT_FILE)
+        tmp = '{}.{}.tmp'.format(pointer, version)
+        with open(tmp, 'w') as f:
+            f.write(version)
+        os.replace(tmp, pointer)
+
+        keep = {version, CURRENT_FILE}
+        if previous is not None:
+            keep.add(os.path.basename(previous))
+        for name in os.listdir(product_directory):
+            if name not in keep and os.path.isdir(
+                    os.path.join(product_directory, name)):
+                shutil.rmtree(os.path.join(product_directory, name),
+                              ignore_errors=True)
+        return description
+
+    def load(self, product, compact=True):
+        """
+        Load the vectorizer and model of `product`: the memory mapped
+        compact artifact if there is one and `compact`, otherwise the
+        pickles. Returns (vectorizer, model).
+        """
+        path = self.path(product)
+        if compact and _read_metadata(path)['compact']:
+            return load_vectorizer_and_model(
+                compact_path=os.path.join(path, 'compact')
+            )
+        return load_vectorizer_and_model(
+            os.path.join(path, 'vectorizer.pkl'),
+            os.path.join(path, 'model.pkl')
+        )
+
+    def text_policy(self, product):
+        """
+        The complainer.text.TextPolicy complaints are prepared with before
+        the model of `product` scores them.
+        """
+        return TextPolicy.from_dict(self.metadata(product).get('text', {}))
+
+
+def _read_metadata(path):
+    with open(os.path.join(path, METADATA_FILE)) as f:
+        return json.load(f)
+
+
+def train_product(product,
+    train_path,
+    registry_directory,
+    vectorizer_params=None,
+    classifier='nbsvm',
+    classifier_params=None):
+    """
+    Fit a tf-idf vectorizer and classifier to the preprocessed training data
+    of `product` at `train_path`, and register them, with the text policy
+    the preprocess job saved beside the data.
+    Reads its own data, so that it can run on a worker process.
+
+    Parameters
+    ----------
+    product : string
+        Product the data is about.
+    train_path : string
+        Table of preprocessed training data, with "complaint" and "issue"
+        columns, as complainer.storage.read_table.
+    registry_directory : string
+        Directory of the `ModelRegistry` to register the model in.
+    vectorizer_params : dict or None (default=None)
+        Params of the tf-idf vectorizer, as complainer.features.TermCounts.
+    classifier : string (default="nbsvm")
+        Name of the classifier, as complainer.classifiers.make_classifier.
+    classifier_params : dict or None (default=None)
+        Params of the classifier, with its "n_jobs" as
+        complainer.classifiers.make_classifier.
+    Returns
+    -------
+    summary : dict
+        The registered model's metadata, with the number of training "rows"
+        and the "seconds" taken.
+    """
+    start = time.perf_counter()
+    vectorizer_params = dict(vectorizer_params or {})
+    train = read_table(train_path, columns=['complaint', 'issue'],
+                       memory_map=True)
+
+    tokenization = {name: vectorizer_params[name]
+                    for name in ['ngram_range'] + tokenization_params
+                    if name in vectorizer_params}
+    counts = TermCounts.from_texts(train.complaint, **tokenization)
+    vectorizer, X = counts.tfidf(**vectorizer_params)
+    model = make_classifier(classifier, **(classifier_params or {}))
+    model.fit(X, train.issue)
+
+    summary = ModelRegistry(registry_directory).register(
+        product, vectorizer, model,
+        text_policy=TextPolicy.load(
+            os.path.dirname(os.path.normpath(train_path))),
+        classifier=classifier,
+        rows=len(train)
+    )
+    summary['seconds'] = time.perf_counter() - start
+    return summary
+
+
+def _train_task(task, **kwargs):
+    product, train_path = task
+    return train_product(product, train_path, **kwargs)
+
+
+def train_products(train_paths,
+    registry_directory,
+    executor=None,
+    **kwargs):
+    """
+    Train and register the model of every product, as `train_product`, in
+    parallel on `executor`.
+
+    Parameters
+    ----------
+    train_paths : dict
+        Maps products to the paths of their preprocessed training data.
+    registry_directory : string
+        Directory of the `ModelRegistry` to register the models in.
+    executor : concurrent.futures.Executor or None (default=None)
+        Where products are trained, one per task. If None, serially.
+        On an executor, classifiers fit on one thread each unless
+        "n_jobs" is in the classifier params, as the workers already
+        occupy the cores.
+    **kwargs
+        Passed to `train_product`.
+    Returns
+    -------
+    summaries : list of dicts
+        Summaries of `train_product`, in the order of `train_paths`.
+    """
+    if executor is not None:
+        kwargs['classifier_params'] = dict(
+            {'n_jobs': 1}, **(kwargs.get('classifier_params') or {}))
+    return list(imap_ordered(
+        functools.partial(_train_task,
+                          registry_directory=registry_directory,
+                          **kwargs),
+        list(train_paths.items()),
+        executor
+    ))
@@ -0,0 +1,294 @@
+"""
+Batch scoring of large, unlabeled complaint datasets.
+
+Chunks are scored independently and each is written to its own numbered
+part file, so a crashed run can be resumed by skipping the parts that
+already exist. A manifest stored with the parts identifies the input, its
+chunking and the model they were scored with, so a run is only resumed
+with the same ones.
+"""
+
+import functools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from complainer.artifacts import (
+    compact_digest, load_text_policy, load_vectorizer_and_model
+)
+from complainer.cache import file_digest
+from complainer.instrumentation import Stages, timed
+from complainer.parallel import default_workers, imap_ordered
+from complainer.storage import TableWriter, list_parts, part_path
+
+
+MANIFEST_FILE = 'manifest.json'
+
+class Scorer:
+    """
+    Score a pandas.DataFrame chunk of complaints with a fitted vectorizer
+    and model.
+
+    Parameters
+    ----------
+    vectorizer : sklearn-style vectorizer
+        Fitted vectorizer.
+    model : sklearn-style classifier
+        Fitted classifier, with `decision_function` or `predict_proba`.
+    text_column : string (default="complaint")
+        Name of the column holding the complaint text.
+    id_column : string or None (default=None)
+        Name of a column identifying each complaint, copied to the output.
+    text_policy : complainer.text.TextPolicy or None (default=None)
+        Prepares texts before they are featurized, as the model's training
+        texts were, normalizing them and truncating very long ones, which
+        bounds the cost of scoring them. If None, texts are featurized as
+        they are.
+    """
+
+    def __init__(self,
+        vectorizer,
+        model,
+        text_column='complaint',
+        id_column=None,
+        text_policy=None):
+        self.vectorizer = vectorizer
+        self.model = model
+        self.text_column = text_column
+        self.id_column = id_column
+        self.text_policy = text_policy
+
+    def scores(self, X):
+        """
+        Per-class scores of the feature matrix `X`, shape (rows, classes).
+        """
+        if hasattr(self.model, 'decision_function'):
+            scores = self.model.decision_function(X)
+        else:
+            scores = self.model.predict_proba(X)
+        scores = np.asarray(scores)
+        if scores.ndim == 1:
+            # Binary decision functions score only the positive class.
+            scores = np.column_stack([-scores, scores])
+        return scores
+
+    def score(self, chunk):
+        """
+        Score `chunk`, as `__call__`, timing its featurizing and predicting.
+        Returns (scored, timings), the timings as
+        complainer.instrumentation.timed, for stages "featurize" and
+        "predict".
+        """
+        timings = {}
+        with timed(timings, 'featurize'):
+            texts = chunk[self.text_column].fillna('')
+            if self.text_policy is not None:
+                texts = self.text_policy.apply(texts)
+            X = self.vectorizer.transform(texts)
+        with timed(timings, 'predict'):
+            scores = self.scores(X)
+        classes = np.asarray(self.model.classes_)
+
+        scored = pd.DataFrame(index=range(len(chunk)))
+        if self.id_column is not None:
+            scored[self.id_column] = np.asarray(chunk[self.id_column])
+        scored['issue'] = classes[np.argmax(scores, axis=1)]
+        for i, label in enumerate(classes):
+            scored['score_' + str(label)] = scores[:, i].astype(np.float32)
+        return scored, timings
+
+    def __call__(self, chunk):
+        """
+        Returns a pandas.DataFrame with the id column (if any), the predicted
+        "issue", and a "score_<class>" column per class.
+        """
+        return self.score(chunk)[0]
+
+
+_worker_scorer = None
+
+
+def _init_worker(vectorizer_path, model_path, compact_path, **scorer_kwargs):
+    global _worker_scorer
+    _worker_scorer = Scorer(
+        *load_vectorizer_and_model(vectorizer_path, model_path, compact_path),
+        **scorer_kwargs
+    )
+
+
+def _score_in_worker(chunk):
+    return _worker_scorer.score(chunk)
+
+
+def make_pool(vectorizer_path=None,
+    model_path=None,
+    compact_path=None,
+    n_workers=None,
+    **scorer_kwargs):
+    """
+    Create the process pool and scoring function for `score_to_parts`.
+    Every worker loads the vectorizer and model once, at start up, as
+    complainer.artifacts.load_vectorizer_and_model. Texts are prepared
+    with the model's text policy, as complainer.artifacts.load_text_policy,
+    unless `scorer_kwargs` give another `text_policy`.
+    With `n_workers` of 1, no pool is created and scoring runs serially.
+
+    Returns
+    -------
+    executor : concurrent.futures.Executor or None
+    scorer : callable
+        Scores a chunk, on `executor`, returning the scored chunk and its
+        timings, as `Scorer.score`.
+    """
+    if n_workers is None:
+        n_workers = default_workers()
+    scorer_kwargs.setdefault('text_policy',
+                             load_text_policy(vectorizer_path, compact_path))
+    if n_workers <= 1:
+        return None, Scorer(
+            *load_vectorizer_and_model(vectorizer_path, model_path,
+                                       compact_path),
+            **scorer_kwargs
+        ).score
+    executor = ProcessPoolExecutor(
+        max_workers=n_workers,
+        initializer=functools.partial(_init_worker, **scorer_kwargs),
+        initargs=(vectorizer_path, model_path, compact_path)
+    )
+    return executor, _score_in_worker
+
+
+def scoring_manifest(data,
+    chunksize,
+    vectorizer_path=None,
+    model_path=None,
+    compact_path=None,
+    **settings):
+    """
+    Manifest identifying a scoring run, for `score_to_parts`: the digest of
+    the input `data` (a file or a directory of parts), the `chunksize` it
+    is read in, and the digest of the model, from the compact artifact at
+    `compact_path` if given, else from the vectorizer and model pickles,
+    with the params of its text policy.
+    Any other `settings` changing the output, e.g. the text column, are
+    included as they are.
+    """
+    if compact_path:
+        model = {'compact': compact_digest(compact_path)}
+    else:
+        model = {'vectorizer': file_digest(vectorizer_path),
+                 'model': file_digest(model_path)}
+    model['text'] = load_text_policy(vectorizer_path, compact_path).to_dict()
+    return dict(settings,
+                input=file_digest(data),
+                chunksize=chunksize,
+                model=model)
+
+
+def _check_manifest(directory, manifest):
+    # Record the manifest of a new run, or check that of a resumed one.
+    path = os.path.join(directory, MANIFEST_FILE)
+    manifest = json.loads(json.dumps(manifest))
+    if os.path.exists(path):
+        with open(path) as f:
+            previous = json.load(f)
+        if previous != manifest:
+            raise(ValueError(
+                "{} holds parts scored with a different input, chunking or "
+                "model (differing: {}); score to a new directory".format(
+                    directory,
+                    ', '.join(sorted(
+                        key for key in set(previous) | set(manifest)
+                        if previous.get(key) != manifest.get(key))))
+            ))
+        return
+    if list_parts(directory):
+        raise(ValueError(
+            "{} holds parts without a manifest, which cannot be "
+            "resumed; score to a new directory".format(directory)
+        ))
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def score_to_parts(chunks,
+    scorer,
+    directory,
+    fmt='csv',
+    executor=None,
+    manifest=None,
+    stages=None):
+    """
+    Score every chunk and write it to its own part file in `directory`,
+    skipping chunks whose part file already exists.
+    Part files are written under a temporary name and then renamed, so an
+    interrupted run never leaves a partial part behind, and re-running with
+    the same input and chunking resumes where it stopped.
+
+    Parameters
+    ----------
+    chunks : iterable of pandas.DataFrame
+        Chunks of complaints, in the same order on every run.
+    scorer : callable
+        Maps a chunk to a scored pandas.DataFrame, e.g. a `Scorer`, or to
+        the scored chunk and its timings, as `Scorer.score`.
+        Must be picklable when running on a process pool.
+    directory : string
+        Directory for the part files. Created if necessary.
+    fmt : string (default="csv")
+        Storage format of the part files, as complainer.storage.
+    executor : concurrent.futures.Executor or None (default=None)
+        Scores chunks in parallel if given.
+    manifest : dict or None (default=None)
+        Identifies the run, e.g. as `scoring_manifest`. Stored in
+        `directory` by the first run; a run resuming it raises a ValueError
+        if its manifest differs, or if `directory` holds parts without a
+        manifest.
+    stages : complainer.instrumentation.Stages or None (default=None)
+        If given, the time spent reading chunks and writing parts is added
+        to its "read" and "write" stages, and the timings returned by
+        `scorer`, if any, to theirs.
+    Returns
+    -------
+    parts : dict
+        Numbers of parts "scored" on this run and "skipped" (already done),
+        and "rows" scored on this run.
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    if manifest is not None:
+        _check_manifest(directory, manifest)
+    if stages is None:
+        stages = Stages()
+
+    summary = {'scored': 0, 'skipped': 0, 'rows': 0}
+    todo = []
+
+    def pending():
+        for part, chunk in enumerate(stages.iterate('read', chunks)):
+            if os.path.exists(part_path(directory, part, fmt)):
+                summary['skipped'] += 1
+                continue
+            todo.append(part)
+            yield chunk
+
+    for scored in imap_ordered(scorer, pending(), executor):
+        if isinstance(scored, tuple):
+            scored, timings = scored
+            stages.update(timings, len(scored))
+        part = todo.pop(0)
+        path = part_path(directory, part, fmt)
+        tmp = os.path.join(directory, '.tmp-' + os.path.basename(path))
+        with stages.stage('write', rows=len(scored)):
+            with TableWriter(tmp, columns=list(scored.columns)) as writer:
+                writer.write(scored)
+            os.replace(tmp, path)
+        summary['scored'] += 1
+        summary['rows'] += len(scored)
+
+    return summary
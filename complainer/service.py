@@ -0,0 +1,464 @@
+"""
+A long-lived HTTP service scoring single complaints with a trained model, or
+with the model of each complaint's product from a model registry.
+
+The vectorizer and model are loaded once, with the text policy that
+prepares complaints as the model's training texts were. Concurrent requests
+are gathered into micro-batches, so the model is applied to many complaints
+at once, on a pool of workers behind an asyncio front end.
+"""
+
+import asyncio
+import collections
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from complainer.artifacts import load_text_policy, load_vectorizer_and_model
+from complainer.parallel import default_workers
+from complainer.registry import ModelRegistry
+
+
+class LatencyTracker:
+    """
+    Record request latencies, keeping the most recent `maxlen`.
+    """
+
+    def __init__(self, maxlen=10000):
+        self.latencies = collections.deque(maxlen=maxlen)
+        self.count = 0
+
+    def record(self, seconds):
+        self.latencies.append(seconds)
+        self.count += 1
+
+    def summary(self):
+        """
+        Total number of requests, and the p50 and p99 latency in
+        milliseconds over the recent requests.
+        """
+        if not self.latencies:
+            return {'count': self.count, 'p50_ms': None, 'p99_ms': None}
+        p50, p99 = np.percentile(np.array(self.latencies) * 1000, [50, 99])
+        return {'count': self.count, 'p50_ms': p50, 'p99_ms': p99}
+
+
+class MicroBatcher:
+    """
+    Gather concurrent single predictions into batches.
+
+    Parameters
+    ----------
+    predict_batch : callable
+        Maps a list of complaint texts to a list of predictions.
+    max_batch_size : int (default=64)
+        Maximum number of complaints per batch.
+    max_wait : float (default=0.005)
+        Maximum number of seconds the first complaint of a batch waits for
+        others to join it.
+    executor : concurrent.futures.Executor or None (default=None)
+        Where `predict_batch` runs. None means the event loop's default
+        thread pool.
+    max_concurrency : int (default=1)
+        Maximum number of batches predicted at once, usually the number of
+        workers of `executor`, as given to `make_pool` or
+        `make_registry_pool` by the caller that creates it. Batches keep
+        being gathered while others are predicted.
+    """
+
+    def __init__(self,
+        predict_batch,
+        max_batch_size=64,
+        max_wait=0.005,
+        executor=None,
+        max_concurrency=1):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.batches = 0
+        self.batch_sizes = collections.deque(maxlen=10000)
+        self.in_flight = 0
+        self._queue = None
+        self._task = None
+        self._pending = set()
+
+    def start(self):
+        """
+        Start gathering batches. Must be called from a running event loop.
+        """
+        self._queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        tasks = [self._task] + list(self._pending)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def predict(self, text):
+        """
+        Predict the issue of a single complaint, as part of a batch.
+        """
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _next_batch(self):
+        loop = asyncio.get_event_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(
+                    await asyncio.wait_for(self._queue.get(), timeout)
+                )
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        # Each batch is predicted by a task of its own. A slot is taken
+        # before gathering a batch, so while every slot is busy, requests
+        # queue up and fill the next batch.
+        slots = asyncio.Semaphore(self.max_concurrency)
+        while True:
+            await slots.acquire()
+            try:
+                batch = await self._next_batch()
+            except asyncio.CancelledError:
+                slots.release()
+                raise
+            self.batches += 1
+            self.batch_sizes.append(len(batch))
+            task = asyncio.ensure_future(self._predict(batch, slots))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _predict(self, batch, slots):
+        loop = asyncio.get_event_loop()
+        texts = [text for text, _ in batch]
+        self.in_flight += 1
+        try:
+            predictions = await loop.run_in_executor(
+                self.executor, self.predict_batch, texts
+            )
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        finally:
+            self.in_flight -= 1
+            slots.release()
+        for (_, future), prediction in zip(batch, predictions):
+            if not future.done():
+                future.set_result(prediction)
+
+
+class Predictor:
+    """
+    Predict issues of a list of complaint texts with a fitted vectorizer
+    and model, preparing the texts with `text_policy` (a
+    complainer.text.TextPolicy) first, if given.
+    """
+
+    def __init__(self, vectorizer, model, text_policy=None):
+        self.vectorizer = vectorizer
+        self.model = model
+        self.text_policy = text_policy
+
+    @classmethod
+    def load(cls, vectorizer_path=None, model_path=None, compact_path=None):
+        """
+        Load pickled vectorizer and model files, or, if `compact_path` is
+        given, a memory mapped compact artifact (see complainer.artifacts),
+        and the text policy saved with them.
+        """
+        return cls(*load_vectorizer_and_model(vectorizer_path, model_path,
+                                              compact_path),
+                   text_policy=load_text_policy(vectorizer_path, compact_path))
+
+    def __call__(self, texts):
+        if self.text_policy is not None:
+            texts = self.text_policy.apply(texts)
+        return [str(issue) for issue in
+                self.model.predict(self.vectorizer.transform(texts))]
+
+
+class ProductPredictor:
+    """
+    Predict issues of a list of (product, complaint text) pairs, with the
+    model of each product. Each batch is grouped by product, so every
+    product's model is applied once per batch.
+
+    Parameters
+    ----------
+    predictors : dict
+        Maps products to `Predictor`s.
+    """
+
+    def __init__(self, predictors):
+        self.predictors = predictors
+
+    @classmethod
+    def load(cls, registry_directory, compact=True):
+        """
+        Load the model of every product registered in the
+        complainer.registry.ModelRegistry at `registry_directory`, with its
+        text policy.
+        """
+        registry = ModelRegistry(registry_directory)
+        return cls({
+            product: Predictor(*registry.load(product, compact=compact),
+                               text_policy=registry.text_policy(product))
+            for product in registry.products()
+        })
+
+    def __call__(self, items):
+        predictions = [None] * len(items)
+        by_product = collections.defaultdict(list)
+        for i, (product, _) in enumerate(items):
+            by_product[product].append(i)
+        for product, rows in by_product.items():
+            issues = self.predictors[product]([items[i][1] for i in rows])
+            for i, issue in zip(rows, issues):
+                predictions[i] = issue
+        return predictions
+
+
+_worker_predictor = None
+
+
+def _init_worker(vectorizer_path, model_path, compact_path):
+    global _worker_predictor
+    _worker_predictor = Predictor.load(vectorizer_path, model_path,
+                                       compact_path)
+
+
+def _init_registry_worker(registry_directory):
+    global _worker_predictor
+    _worker_predictor = ProductPredictor.load(registry_directory)
+
+
+def _predict_in_worker(texts):
+    return _worker_predictor(texts)
+
+
+def make_pool(vectorizer_path=None,
+    model_path=None,
+    n_workers=None,
+    processes=False,
+    compact_path=None):
+    """
+    Create the worker pool and batch prediction function for a service,
+    loading the model as `Predictor.load`, with `n_workers` workers (one
+    per core if None): the `max_concurrency` of its `MicroBatcher`.
+
+    With `processes`, every worker process loads the vectorizer and model
+    once, at start up. Pickled models are copied into every worker, while
+    compact artifacts are memory mapped, so all workers share one copy.
+    Otherwise a thread pool shares one copy, which suits models whose
+    prediction releases the GIL.
+
+    Returns
+    -------
+    executor : concurrent.futures.Executor
+    predict_batch : callable
+        Maps a list of texts to a list of predicted issues, on `executor`.
+    """
+    if n_workers is None:
+        n_workers = default_workers()
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=n_workers,
+                                       initializer=_init_worker,
+                                       initargs=(vectorizer_path, model_path,
+                                                 compact_path))
+        return executor, _predict_in_worker
+    predictor = Predictor.load(vectorizer_path, model_path, compact_path)
+    return ThreadPoolExecutor(max_workers=n_workers), predictor
+
+
+def make_registry_pool(registry_directory, n_workers=None, processes=False):
+    """
+    Create the worker pool and batch prediction function for a service
+    dispatching complaints to the model of their product, loading every
+    model of the complainer.registry.ModelRegistry at `registry_directory`
+    as `ProductPredictor.load`. Pools are as `make_pool`.
+
+    Returns
+    -------
+    executor : concurrent.futures.Executor
+    predict_batch : callable
+        Maps a list of (product, text) pairs to a list of predicted issues,
+        on `executor`.
+    products : list of strings
+        Products with a model.
+    """
+    if n_workers is None:
+        n_workers = default_workers()
+    products = ModelRegistry(registry_directory).products()
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=n_workers,
+                                       initializer=_init_registry_worker,
+                                       initargs=(registry_directory,))
+        return executor, _predict_in_worker, products
+    predictor = ProductPredictor.load(registry_directory)
+    return ThreadPoolExecutor(max_workers=n_workers), predictor, products
+
+
+async def _read_request(reader):
+    """
+    Read one HTTP/1.1 request. Returns (method, path, headers, body), or
+    None if the connection was closed.
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+
+def _response(status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    head = (
+        'HTTP/1.1 {}\r\n'
+        'Content-Type: application/json\r\n'
+        'Content-Length: {}\r\n'
+        '\r\n'
+    ).format(status, len(body))
+    return head.encode('latin-1') + body
+
+
+class ScoringService:
+    """
+    HTTP front end for a `MicroBatcher`.
+
+    Parameters
+    ----------
+    batcher : MicroBatcher
+        Batches complaint texts, or, with `products`, (product, text) pairs.
+    products : list of strings or None (default=None)
+        Products with a model, if complaints are dispatched by product
+        (see `make_registry_pool`).
+
+    Endpoints
+    ---------
+    POST /predict
+        Body {"complaint": "..."}, responds {"issue": "..."}.
+        With `products`, the body must also name one of them, as
+        {"product": "...", "complaint": "..."}.
+    GET /stats
+        Request count, p50 and p99 request latency in milliseconds,
+        number of batches and recent mean batch size.
+    GET /health
+        Responds {"status": "ok"}.
+    """
+
+    def __init__(self, batcher, products=None):
+        self.batcher = batcher
+        self.products = products
+        self.latency = LatencyTracker()
+
+    def _parse_predict(self, body):
+        # The product (None without products) and complaint of a /predict
+        # body, or None if it is malformed. Both must be strings, so that a
+        # bad request is rejected before it can fail the batch it joins.
+        try:
+            request = json.loads(body.decode('utf-8'))
+            complaint = request['complaint']
+            product = request['product'] if self.products is not None \
+                else None
+        except (ValueError, KeyError, TypeError):
+            return None
+        if not isinstance(complaint, str):
+            return None
+        if self.products is not None and not isinstance(product, str):
+            return None
+        return product, complaint
+
+    async def handle(self, method, path, body):
+        """
+        Respond to one request. Returns (status, payload).
+        """
+        if method == 'POST' and path == '/predict':
+            start = time.perf_counter()
+            parsed = self._parse_predict(body)
+            if parsed is None:
+                return '400 Bad Request', {
+                    'error': 'expected a JSON body {}'.format(
+                        '{"complaint": "..."}' if self.products is None
+                        else '{"product": "...", "complaint": "..."}')
+                }
+            product, complaint = parsed
+            if self.products is not None:
+                complaint = (product, complaint)
+            if self.products is not None \
+                    and complaint[0] not in self.products:
+                return '404 Not Found', {
+                    'error': 'no model for product {}, expected one of {}'
+                    .format(complaint[0], ', '.join(self.products))
+                }
+            # Failed predictions are timed too, so they count in the
+            # latency percentiles.
+            try:
+                issue = await self.batcher.predict(complaint)
+            finally:
+                self.latency.record(time.perf_counter() - start)
+            return '200 OK', {'issue': issue}
+        if method == 'GET' and path == '/stats':
+            batch_sizes = self.batcher.batch_sizes
+            return '200 OK', {
+                'latency': self.latency.summary(),
+                'batches': self.batcher.batches,
+                'mean_batch_size': (float(np.mean(batch_sizes))
+                                    if batch_sizes else None)
+            }
+        if method == 'GET' and path == '/health':
+            return '200 OK', {'status': 'ok'}
+        return '404 Not Found', {'error': 'unknown endpoint'}
+
+    async def _serve_connection(self, reader, writer):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                try:
+                    status, payload = await self.handle(method, path, body)
+                except Exception as error:
+                    status, payload = '500 Internal Server Error', {
+                        'error': '{}: {}'.format(type(error).__name__, error)
+                    }
+                writer.write(_response(status, payload))
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8000):
+        """
+        Start the batcher and listen on `host`:`port`.
+        Returns the asyncio server.
+        """
+        self.batcher.start()
+        return await asyncio.start_server(self._serve_connection, host, port)
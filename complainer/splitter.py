@@ -2,6 +2,7 @@
 Utility for splitting dataset into train, dev, and test subsets.
 """
 
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 
@@ -10,7 +11,8 @@ def train_dev_test_split(df,
     dev_fraction=0.2,
     test_fraction=0.2,
     stratify=None,
-    random_state=None):
+    random_state=None,
+    groups=None):
     """
     Split a pandas.DataFrame into three subdataframes with distinct samples of
     the data.
@@ -37,6 +39,12 @@ def train_dev_test_split(df,
     random_state : int, RandomState instance or None, optional (default=None)
         Seed for random number generator.
         As sklearn.model_selection.train_test_split.
+    groups : Array-like or None (default=None)
+        If not None, the group of each row (e.g. its cluster of duplicates,
+        see complainer.dedup). Groups rather than rows are split in the
+        given fractions, so all rows of a group land in the same subset.
+        `df` must then support boolean row masks, as pandas.DataFrame and
+        numpy arrays do. Cannot be combined with `stratify`.
     Returns
     -------
     train : pandas.DataFrame (or indexable)
@@ -58,6 +66,18 @@ def train_dev_test_split(df,
             must be less than one.
             """
         ))
+
+    if groups is not None:
+        if stratify is not None:
+            raise(ValueError("`groups` cannot be combined with `stratify`."))
+        groups = np.asarray(groups)
+        return tuple(
+            df[np.isin(groups, subset)]
+            for subset in train_dev_test_split(pd.unique(groups),
+                                               dev_fraction,
+                                               test_fraction,
+                                               random_state=random_state)
+        )
     
     train, rest = train_test_split(
         df,
@@ -73,4 +93,156 @@ def train_dev_test_split(df,
         random_state=random_state
     )
 
-    return train, dev, test
\ No newline at end of file
+    return train, dev, test
+
+
+def hash_fractions(keys, random_state=None):
+    """
+    Map each key to a pseudo-random number in [0, 1), determined only by the
+    key and `random_state`.
+
+    Parameters
+    ----------
+    keys : array-like
+        Keys to hash, e.g. the "Complaint ID" column.
+    random_state : int, RandomState instance or None (default=None)
+        Seed mixed into every hash. None is equivalent to 0.
+        A RandomState instance is used to draw an integer seed.
+    Returns
+    -------
+    fractions : numpy.ndarray of float64
+        One number in [0, 1) per key.
+    """
+    if random_state is None:
+        seed = 0
+    elif isinstance(random_state, np.random.RandomState):
+        seed = random_state.randint(np.iinfo(np.int32).max)
+    else:
+        seed = int(random_state)
+
+    hashes = pd.util.hash_pandas_object(pd.Series(keys), index=False).values
+    # Numeric keys are hashed without a key, so mix the seed in afterwards.
+    hashes = pd.util.hash_array(hashes ^ np.uint64(seed))
+    return (hashes >> np.uint64(11)).astype(np.float64) / 2.0 ** 53
+
+
+def _systematic_assignment(ordinals, dev_fraction, test_fraction):
+    """
+    Assign the row with (zero-based) ordinal `i` to dev, test or train such
+    that any prefix of ordinals 0..n-1 puts floor(n * dev_fraction) rows in
+    dev, and the expected fraction of rows in test is `test_fraction`.
+    Returns an array of split codes: 0 = train, 1 = dev, 2 = test.
+    """
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+    codes = np.zeros(len(ordinals), dtype=np.int8)
+
+    is_dev = (np.floor((ordinals + 1) * dev_fraction)
+              > np.floor(ordinals * dev_fraction))
+    codes[is_dev] = 1
+
+    # Ordinal of each row among rows that were not sent to dev.
+    rest_fraction = test_fraction / (1 - dev_fraction)
+    rest_ordinals = ordinals - np.floor(ordinals * dev_fraction)
+    is_test = ~is_dev & (np.floor((rest_ordinals + 1) * rest_fraction)
+                         > np.floor(rest_ordinals * rest_fraction))
+    codes[is_test] = 2
+    return codes
+
+
+def stream_train_dev_test_split(chunks,
+    key_column,
+    dev_fraction=0.2,
+    test_fraction=0.2,
+    stratify_column=None,
+    random_state=None,
+    group_column=None):
+    """
+    Split a stream of pandas.DataFrame chunks into train, dev and test subsets
+    in a single pass, holding only one chunk in memory at a time.
+
+    Without stratification, each row is assigned by hashing its key, so a row
+    always lands in the same subset for a given `random_state`, regardless of
+    chunking or of which other rows are present.
+    With stratification, rows are ranked by the same hash within each class
+    and dealt to the subsets systematically, so every class is split in the
+    requested proportions (up to rounding) across the whole stream. This is
+    deterministic for a given input and chunking.
+
+    Parameters
+    ----------
+    chunks : iterable of pandas.DataFrame
+        Chunks of the dataset, e.g. from
+        complainer.ingestion.read_complaints_chunked.
+    key_column : string
+        Name of a column uniquely identifying each row, e.g. "Complaint ID".
+    dev_fraction : float (default=0.2)
+        As `train_dev_test_split`.
+    test_fraction : float (default=0.2)
+        As `train_dev_test_split`.
+    stratify_column : string or None (default=None)
+        If not None, data is split in a stratified fashion, using this column
+        as the class labels.
+    random_state : int, RandomState instance or None (default=None)
+        Seed for the key hash. As `hash_fractions`.
+    group_column : string or None (default=None)
+        If not None, rows are assigned by hashing this column rather than
+        `key_column`, so rows of a group (e.g. a cluster of duplicates, see
+        complainer.dedup) always land in the same subset.
+        Cannot be combined with `stratify_column`.
+    Returns
+    -------
+    splits : generator of (train, dev, test) tuples of pandas.DataFrame
+        One tuple per input chunk, each a partition of that chunk.
+    """
+    rest_fraction = dev_fraction + test_fraction
+
+    if rest_fraction > 1:
+        raise(ValueError(
+            """
+            The sum of `dev_fraction` and `test_fraction`
+            must be less than one.
+            """
+        ))
+
+    if group_column is not None:
+        if stratify_column is not None:
+            raise(ValueError(
+                "`group_column` cannot be combined with `stratify_column`."
+            ))
+        key_column = group_column
+
+    if isinstance(random_state, np.random.RandomState):
+        random_state = random_state.randint(np.iinfo(np.int32).max)
+
+    seen = {}  # rows seen so far per class, when stratifying
+
+    for chunk in chunks:
+        fractions = hash_fractions(chunk[key_column], random_state)
+
+        if stratify_column is None:
+            codes = np.zeros(len(chunk), dtype=np.int8)
+            codes[fractions < rest_fraction] = 2
+            codes[fractions < dev_fraction] = 1
+        else:
+            labels = np.asarray(chunk[stratify_column])
+            ranks = (
+                pd.Series(fractions)
+                .groupby(labels)
+                .rank(method='first')
+                .values
+                .astype(np.int64) - 1
+            )
+            offsets = (
+                pd.Series(labels)
+                .map(seen)
+                .fillna(0)
+                .values
+                .astype(np.int64)
+            )
+            codes = _systematic_assignment(ranks + offsets,
+                                           dev_fraction,
+                                           test_fraction)
+            for label, count in pd.Series(labels).value_counts().items():
+                seen[label] = seen.get(label, 0) + count
+
+        yield chunk[codes == 0], chunk[codes == 1], chunk[codes == 2]
@@ -0,0 +1,331 @@
+"""
+Reading and writing tables passed between jobs, as csv, Parquet or Feather.
+
+Parquet and Feather (Arrow IPC) are columnar, so reading the complaint text
+does not require re-tokenizing quoted csv fields, and categorical columns
+(like the issue) are stored dictionary encoded.
+These formats require the optional pyarrow dependency.
+
+A table may also be a directory of numbered part files of one format, read
+in order as a single table, so that tables can grow by appending parts.
+"""
+
+import os
+import time
+
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+from complainer.ingestion import concat_chunks
+from complainer.preprocessing import read_csv_robust
+
+
+extensions = {
+    'csv': '.csv',
+    'parquet': '.parquet',
+    'feather': '.feather'
+}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise(ImportError(
+            """
+            Parquet and Feather storage require pyarrow.
+            Install it with `pip3 install pyarrow`, or use csv.
+            """
+        ))
+    return pyarrow
+
+
+def table_path(directory, name, fmt='csv'):
+    """
+    Path of the table `name` in `directory`, stored in format `fmt`.
+
+    Parameters
+    ----------
+    directory : string
+        Directory containing the table.
+    name : string
+        Name of the table, e.g. "train".
+    fmt : string (default="csv")
+        One of "csv", "parquet" or "feather".
+    Returns
+    -------
+    path : string
+    """
+    if fmt not in extensions:
+        raise(ValueError(
+            "Unknown format {}, expected one of {}".format(
+                fmt, ', '.join(extensions))
+        ))
+    return os.path.join(directory, name + extensions[fmt])
+
+
+def part_path(directory, part, fmt='csv'):
+    """
+    Path of the numbered part file `part` in `directory`.
+    """
+    return os.path.join(directory,
+                        'part-{:05d}{}'.format(part, extensions[fmt]))
+
+
+def list_parts(directory):
+    """
+    Paths of the part files in `directory`, in order.
+    Temporary files of parts being written are ignored.
+    """
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith('part-')
+        and os.path.splitext(name)[1] in extensions.values()
+    )
+
+
+def format_of(path):
+    """
+    Storage format of `path`, inferred from its extension, or from the
+    extensions of its part files if it is a directory.
+    """
+    if os.path.isdir(path):
+        formats = set(format_of(part) for part in list_parts(path))
+        if len(formats) != 1:
+            raise(ValueError(
+                "Expected part files of a single format in {}, found {}"
+                .format(path, ', '.join(sorted(formats)) or 'none')
+            ))
+        return formats.pop()
+    extension = os.path.splitext(path)[1]
+    for fmt, ext in extensions.items():
+        if ext == extension:
+            return fmt
+    raise(ValueError(
+        "Cannot infer table format from extension of {}".format(path)
+    ))
+
+
+def iter_table(path, chunksize=100000, columns=None, stats=None):
+    """
+    Lazily read the table at `path` in chunks of at most `chunksize` rows.
+
+    Parameters
+    ----------
+    path : string
+        Path of a csv, Parquet or Feather table, or of a directory of part
+        files, which are read in order.
+    chunksize : int (default=100000)
+        Maximum number of rows per chunk. Chunks do not span part files.
+    columns : list of strings or None (default=None)
+        Columns to read. Defaults to all columns.
+    stats : dict or None (default=None)
+        If not None, updated in place with running read statistics,
+        as complainer.preprocessing.read_csv_robust.
+    Returns
+    -------
+    chunks : generator of pandas.DataFrame
+    """
+    fmt = format_of(path)
+
+    if os.path.isdir(path):
+        if stats is None:
+            stats = {}
+        for part in list_parts(path):
+            for chunk in iter_table(part, chunksize, columns, stats):
+                yield chunk
+        return
+
+    if fmt == 'csv':
+        for chunk in read_csv_robust(path, chunksize=chunksize, stats=stats,
+                                     usecols=columns):
+            yield chunk
+        return
+
+    if stats is None:
+        stats = {}
+    for key in ['rows', 'chunks', 'fallback_chunks', 'seconds']:
+        stats.setdefault(key, 0)
+
+    if fmt == 'parquet':
+        pa = _import_pyarrow()
+        batches = (
+            pa.Table.from_batches([batch])
+            for batch in pa.parquet.ParquetFile(path).iter_batches(
+                batch_size=chunksize, columns=columns)
+        )
+    else:
+        table = read_arrow_table(path, columns=columns, memory_map=True)
+        batches = (
+            table.slice(offset, chunksize)
+            for offset in range(0, table.num_rows, chunksize)
+        )
+
+    while True:
+        start = time.perf_counter()
+        batch = next(batches, None)
+        if batch is None:
+            break
+        chunk = batch.to_pandas()
+        stats['seconds'] += time.perf_counter() - start
+        stats['rows'] += len(chunk)
+        stats['chunks'] += 1
+        yield chunk
+
+
+def read_arrow_table(path, columns=None, memory_map=False):
+    """
+    Read a Feather table as a pyarrow.Table. With `memory_map`, the table's
+    buffers are views of the mapped file rather than copies.
+    """
+    pa = _import_pyarrow()
+    return pa.feather.read_table(path, columns=columns,
+                                 memory_map=memory_map)
+
+
+def read_table(path, columns=None, memory_map=False):
+    """
+    Read the table at `path` into a pandas.DataFrame.
+
+    Parameters
+    ----------
+    path : string
+        Path of a csv, Parquet or Feather table, or of a directory of part
+        files, which are concatenated in order.
+    columns : list of strings or None (default=None)
+        Columns to read. Defaults to all columns.
+        For columnar formats, other columns are never read from disk.
+    memory_map : bool (default=False)
+        Memory map the file rather than reading it (columnar formats only).
+    Returns
+    -------
+    df : pandas.DataFrame
+    """
+    fmt = format_of(path)
+
+    if os.path.isdir(path):
+        # Categorical columns stay categorical, although every part has its
+        # own categories.
+        return concat_chunks([read_table(part, columns, memory_map)
+                              for part in list_parts(path)])
+
+    if fmt == 'csv':
+        chunks = list(read_csv_robust(path, usecols=columns))
+        if not chunks:
+            return pd.read_csv(path, usecols=columns)
+        return pd.concat(chunks, ignore_index=True)
+    elif fmt == 'parquet':
+        pa = _import_pyarrow()
+        return pa.parquet.read_table(path, columns=columns,
+                                     memory_map=memory_map).to_pandas()
+    else:
+        return read_arrow_table(path, columns, memory_map).to_pandas()
+
+
+class TableWriter:
+    """
+    Write a table incrementally, one pandas.DataFrame chunk at a time.
+    Use as a context manager, so the file is finalized on exit.
+
+    Parameters
+    ----------
+    path : string
+        Destination path. The format is inferred from the extension.
+    categorical : list of strings (default=())
+        Columns to store as categoricals, in addition to columns that are
+        already categorical.
+    columns : list of strings or None (default=None)
+        Columns of the table, used to write an empty table if no chunks are
+        written. Otherwise taken from the first chunk.
+    **csv_kwargs
+        Passed to pandas.DataFrame.to_csv for csv tables.
+    """
+
+    def __init__(self, path, categorical=(), columns=None, **csv_kwargs):
+        self.path = path
+        self.fmt = format_of(path)
+        self.categorical = list(categorical)
+        self.csv_kwargs = csv_kwargs
+        self._writer = None
+        self._schema = None
+        self._categories = {}
+        self._columns = columns
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _encode_categoricals(self, df):
+        # Arrow needs every chunk's dictionary to extend the dictionary
+        # already written, so grow each column's categories in order of
+        # first appearance rather than letting every chunk pick its own.
+        columns = {}
+        for col in df.columns:
+            values = df[col]
+            if (col in self.categorical
+                    or isinstance(values.dtype, CategoricalDtype)):
+                seen = self._categories.setdefault(col, [])
+                known = set(seen)
+                seen.extend(
+                    c for c in pd.unique(values.dropna()) if c not in known
+                )
+                values = pd.Categorical(values, categories=seen)
+            columns[col] = values
+        return pd.DataFrame(columns, columns=df.columns)
+
+    def write(self, df):
+        """
+        Append the rows of `df` to the table.
+        All chunks must have the same columns.
+        """
+        if self._columns is None:
+            self._columns = list(df.columns)
+
+        if self.fmt == 'csv':
+            df.to_csv(self.path,
+                      mode='w' if self._writer is None else 'a',
+                      header=self._writer is None,
+                      index=False,
+                      **self.csv_kwargs)
+            self._writer = 'csv'
+            return
+
+        pa = _import_pyarrow()
+        table = pa.Table.from_pandas(self._encode_categoricals(df),
+                                     schema=self._schema,
+                                     preserve_index=False)
+        if self._writer is None:
+            # Widen dictionary indices so later chunks can add categories.
+            self._schema = pa.schema(
+                [field.with_type(pa.dictionary(pa.int32(),
+                                               field.type.value_type))
+                 if pa.types.is_dictionary(field.type) else field
+                 for field in table.schema],
+                metadata=table.schema.metadata
+            )
+            table = table.cast(self._schema)
+            if self.fmt == 'parquet':
+                self._writer = pa.parquet.ParquetWriter(self.path,
+                                                        self._schema)
+            else:
+                self._writer = pa.ipc.new_file(
+                    self.path,
+                    self._schema,
+                    options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+                )
+        self._writer.write_table(table)
+
+    def close(self):
+        """
+        Finalize the table. A table with no chunks written is still created,
+        with no rows.
+        """
+        if self._writer is None:
+            self.write(pd.DataFrame(columns=self._columns or []))
+        if self._writer != 'csv':
+            self._writer.close()
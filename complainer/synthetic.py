@@ -0,0 +1,224 @@
+"""
+Synthetic consumer complaints, shaped like the raw Consumer Complaint
+Database dump, for benchmarking the pipeline at any scale.
+
+Narratives are built from a fixed pool of sentences: generic ones, with the
+"XXXX" redactions of the real data, and ones with words specific to the
+complaint's issue, so models trained on them learn something. Narrative
+lengths follow a log-normal distribution with a long tail, as in the real
+data, where some narratives run past 10,000 characters.
+"""
+
+import numpy as np
+import pandas as pd
+
+from complainer.ingestion import NARRATIVE_COLUMN
+from complainer.preprocessing import target_encoding_dict
+
+
+# Columns of the raw dump that are generated. The pipeline reads only some
+# of them, but the others make the csv as wide as the real one to parse.
+raw_columns = ['Date received', 'Product', 'Sub-product', 'Issue',
+               NARRATIVE_COLUMN, 'Company', 'State', 'Submitted via',
+               'Complaint ID']
+
+products = {
+    'Mortgage': 0.3,
+    'Debt collection': 0.25,
+    'Credit reporting': 0.25,
+    'Credit card': 0.1,
+    'Student loan': 0.1
+}
+
+issues = {
+    'Mortgage': list(target_encoding_dict),
+    'Debt collection': ['Attempts to collect debt not owed',
+                        'Communication tactics',
+                        'Written notification about debt'],
+    'Credit reporting': ['Incorrect information on your report',
+                         'Improper use of your report'],
+    'Credit card': ['Billing disputes', 'Fees or interest'],
+    'Student loan': ['Dealing with your lender or servicer',
+                     'Struggling to repay your loan']
+}
+
+_words = (
+    'the my i and to a was of they in that for on have with not this bank '
+    'loan payment account called told me would be from an it after had '
+    'received letter company mortgage we did no were paid time but their '
+    'been am at said when which all do our about will months or request '
+    'years has so information any because get also again are can still '
+    'statement balance interest rate fees contacted online phone '
+    'representative advised documents submitted credit report dispute '
+    'servicer lender property home insurance taxes escrow late charge'
+).split()
+
+_redactions = ['XXXX', 'XX/XX/XXXX', '{$0.00}', 'XXXX XXXX']
+
+_states = ['CA', 'TX', 'FL', 'NY', 'GA', 'IL', 'PA', 'OH', 'NC', 'MI']
+_companies = ['Bank {}'.format(c) for c in 'ABCDEFGHIJ']
+_channels = ['Web', 'Referral', 'Phone', 'Postal mail']
+
+
+def _sentences(rng, n, words, min_words=4, max_words=20):
+    # Zipf-like word frequencies, as in natural text.
+    p = 1 / np.arange(1, len(words) + 1)
+    p /= p.sum()
+    sentences = []
+    for _ in range(n):
+        length = rng.randint(min_words, max_words)
+        tokens = list(rng.choice(words, length, p=p))
+        if rng.rand() < 0.3:
+            tokens.insert(rng.randint(length),
+                          _redactions[rng.randint(len(_redactions))])
+        sentence = ' '.join(tokens)
+        sentences.append(sentence[:1].upper() + sentence[1:] + '.')
+    return np.array(sentences, dtype=object)
+
+
+class ComplaintGenerator:
+    """
+    Generate synthetic raw complaints.
+
+    Parameters
+    ----------
+    random_state : int or None (default=None)
+        Seed. The same seed and chunk size generate the same complaints.
+    narrative_fraction : float (default=0.35)
+        Fraction of complaints with a narrative; the rest are null, as in
+        the real data.
+    mean_sentences : float (default=12)
+        Mean number of sentences per narrative. Sentences average about 55
+        characters.
+    sigma : float (default=0.9)
+        Spread of the log-normal distribution of narrative lengths.
+    """
+
+    def __init__(self,
+        random_state=None,
+        narrative_fraction=0.35,
+        mean_sentences=12,
+        sigma=0.9):
+        self.random_state = random_state
+        self.narrative_fraction = narrative_fraction
+        self.mean_sentences = mean_sentences
+        self.sigma = sigma
+
+        rng = np.random.RandomState(random_state)
+        self._generic = _sentences(rng, 2000, _words)
+        # Each issue has its own words, mixed into its own sentences.
+        self._issues = [(product, issue)
+                        for product in products for issue in issues[product]]
+        self._topical = []
+        for _, issue in self._issues:
+            topic_words = issue.lower().replace(',', ' ').split()
+            self._topical.append(
+                _sentences(rng, 50, topic_words + _words[:20])
+            )
+
+    def _narratives(self, rng, issue_codes):
+        n = len(issue_codes)
+        mu = np.log(self.mean_sentences) - self.sigma ** 2 / 2
+        counts = np.maximum(1, rng.lognormal(mu, self.sigma, n).astype(int))
+        starts = np.concatenate([[0], np.cumsum(counts)])
+        total = starts[-1]
+
+        sentences = self._generic[rng.randint(len(self._generic),
+                                              size=total)]
+        topical = rng.rand(total) < 0.3
+        row_of_sentence = np.repeat(np.arange(n), counts)
+        for code in np.unique(issue_codes[row_of_sentence[topical]]):
+            pool = self._topical[code]
+            where = topical & (issue_codes[row_of_sentence] == code)
+            sentences[where] = pool[rng.randint(len(pool),
+                                                size=where.sum())]
+
+        return [' '.join(sentences[start:stop])
+                for start, stop in zip(starts[:-1], starts[1:])]
+
+    def chunk(self, n_rows, chunk_index=0, first_id=1):
+        """
+        Generate a pandas.DataFrame of `n_rows` raw complaints, with
+        Complaint IDs from `first_id`. Chunks with different `chunk_index`
+        are generated from different random streams.
+        """
+        seed = None if self.random_state is None else \
+            [self.random_state, chunk_index]
+        rng = np.random.RandomState(seed)
+
+        product_names = list(products)
+        product_p = np.array([products[p] for p in product_names])
+        product_codes = rng.choice(len(product_names), n_rows, p=product_p)
+
+        issue_codes = np.empty(n_rows, dtype=int)
+        offsets = np.cumsum([0] + [len(issues[p]) for p in product_names])
+        for code, product in enumerate(product_names):
+            rows = product_codes == code
+            issue_codes[rows] = offsets[code] + rng.randint(
+                len(issues[product]), size=rows.sum())
+
+        narratives = np.full(n_rows, np.nan, dtype=object)
+        has_narrative = rng.rand(n_rows) < self.narrative_fraction
+        narratives[has_narrative] = self._narratives(
+            rng, issue_codes[has_narrative]
+        )
+
+        days = rng.randint(0, 8 * 365, n_rows)
+        dates = (pd.Timestamp('2012-01-01')
+                 + pd.to_timedelta(days, unit='D')).strftime('%m/%d/%Y')
+        all_issues = np.array([issue for _, issue in self._issues],
+                              dtype=object)
+
+        return pd.DataFrame({
+            'Date received': dates,
+            'Product': np.array(product_names, dtype=object)[product_codes],
+            'Sub-product': 'Other',
+            'Issue': all_issues[issue_codes],
+            NARRATIVE_COLUMN: narratives,
+            'Company': np.array(_companies, dtype=object)[
+                rng.randint(len(_companies), size=n_rows)],
+            'State': np.array(_states, dtype=object)[
+                rng.randint(len(_states), size=n_rows)],
+            'Submitted via': np.where(has_narrative, 'Web', np.array(
+                _channels, dtype=object)[rng.randint(len(_channels),
+                                                     size=n_rows)]),
+            'Complaint ID': np.arange(first_id, first_id + n_rows)
+        }, columns=raw_columns)
+
+    def chunks(self, n_rows, chunksize=100000):
+        """
+        Lazily generate `n_rows` raw complaints in chunks of at most
+        `chunksize` rows.
+        """
+        for index, start in enumerate(range(0, n_rows, chunksize)):
+            yield self.chunk(min(chunksize, n_rows - start),
+                             chunk_index=index,
+                             first_id=start + 1)
+
+
+def synthetic_complaints(n_rows, random_state=None, **kwargs):
+    """
+    Generate a pandas.DataFrame of `n_rows` synthetic raw complaints.
+    Keyword arguments are passed to `ComplaintGenerator`.
+    """
+    generator = ComplaintGenerator(random_state=random_state, **kwargs)
+    return pd.concat(list(generator.chunks(n_rows)), ignore_index=True) \
+        if n_rows else generator.chunk(0)
+
+
+def write_synthetic_complaints(path,
+    n_rows,
+    chunksize=100000,
+    random_state=None,
+    **kwargs):
+    """
+    Write `n_rows` synthetic raw complaints to a csv at `path`, like the raw
+    dump, generating `chunksize` rows at a time so any scale fits in memory.
+    Keyword arguments are passed to `ComplaintGenerator`.
+    """
+    generator = ComplaintGenerator(random_state=random_state, **kwargs)
+    with open(path, 'w', newline='') as f:
+        for i, chunk in enumerate(generator.chunks(n_rows, chunksize)):
+            chunk.to_csv(f, header=(i == 0), index=False)
+        if n_rows == 0:
+            generator.chunk(0).to_csv(f, index=False)
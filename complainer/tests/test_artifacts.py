@@ -0,0 +1,97 @@
+import pytest
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import MultinomialNB
+
+from complainer.artifacts import (
+    save_compact, load_compact, compact_digest, save_compact_vectorizer,
+    load_compact_vectorizer
+)
+from complainer.features import HashingTfidfVectorizer
+
+
+train = ['escrow payment was late', 'my escrow account is short',
+         'foreclosure after modification', 'they started foreclosure',
+         'closing costs were higher', 'fees at closing were wrong']
+issues = ['servicing', 'servicing', 'modification', 'modification',
+          'closing', 'closing']
+unseen = ['late escrow and closing fees', 'zebra', '']
+
+
+class TestCompactVectorizer:
+    @pytest.mark.parametrize('vectorizer', [
+        TfidfVectorizer(),
+        TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, norm='l1'),
+        TfidfVectorizer(stop_words=['the', 'my'], use_idf=False),
+        HashingTfidfVectorizer(n_features=2 ** 10)
+    ])
+    def test_compact_vectorizer_transforms_as_original(self, tmp_path,
+                                                       vectorizer):
+        vectorizer.fit(train)
+        save_compact_vectorizer(vectorizer, str(tmp_path))
+        compact = load_compact_vectorizer(str(tmp_path))
+        np.testing.assert_allclose(
+            compact.transform(train + unseen).toarray(),
+            vectorizer.transform(train + unseen).toarray(),
+            rtol=1e-5, atol=1e-7
+        )
+
+    def test_compact_vectorizer_without_known_terms(self, tmp_path):
+        vectorizer = TfidfVectorizer().fit(train)
+        save_compact_vectorizer(vectorizer, str(tmp_path))
+        X = load_compact_vectorizer(str(tmp_path)).transform(['zebra', ''])
+        assert X.shape == (2, len(vectorizer.vocabulary_))
+        assert X.nnz == 0
+
+    def test_callable_tokenizer_cannot_be_saved(self, tmp_path):
+        vectorizer = TfidfVectorizer(tokenizer=str.split,
+                                     token_pattern=None).fit(train)
+        with pytest.raises(TypeError):
+            save_compact_vectorizer(vectorizer, str(tmp_path))
+
+
+class TestCompactModel:
+    @pytest.mark.parametrize('model', [
+        MultinomialNB(),
+        SGDClassifier(random_state=0),
+    ])
+    def test_compact_model_predicts_as_original(self, tmp_path, model):
+        vectorizer = TfidfVectorizer().fit(train)
+        model.fit(vectorizer.transform(train), issues)
+        save_compact(vectorizer, model, str(tmp_path))
+        compact_vectorizer, compact_model = load_compact(str(tmp_path))
+        expected = model.predict(vectorizer.transform(train + unseen))
+        predicted = compact_model.predict(compact_vectorizer.transform(
+            train + unseen))
+        assert list(predicted) == list(expected)
+
+    def test_binary_model_predicts_as_original(self, tmp_path):
+        vectorizer = TfidfVectorizer().fit(train)
+        model = SGDClassifier(random_state=0).fit(vectorizer.transform(train),
+                                                  issues[:2] + ['other'] * 4)
+        save_compact(vectorizer, model, str(tmp_path))
+        _, compact_model = load_compact(str(tmp_path))
+        X = vectorizer.transform(train)
+        assert list(compact_model.predict(X)) == list(model.predict(X))
+
+    def test_arrays_are_float32_and_memory_mapped(self, tmp_path):
+        vectorizer = TfidfVectorizer().fit(train)
+        model = MultinomialNB().fit(vectorizer.transform(train), issues)
+        save_compact(vectorizer, model, str(tmp_path))
+        compact_vectorizer, compact_model = load_compact(str(tmp_path))
+        assert isinstance(compact_model.coef_, np.memmap)
+        assert compact_model.coef_.dtype == np.float32
+        assert isinstance(compact_vectorizer.term_hashes, np.memmap)
+
+
+class TestCompactDigest:
+    def test_digest_changes_with_model(self, tmp_path):
+        vectorizer = TfidfVectorizer().fit(train)
+        X = vectorizer.transform(train)
+        save_compact(vectorizer, MultinomialNB().fit(X, issues), str(tmp_path))
+        before = compact_digest(str(tmp_path))
+        save_compact(vectorizer, MultinomialNB(alpha=0.1).fit(X, issues),
+                     str(tmp_path))
+        assert compact_digest(str(tmp_path)) != before
@@ -0,0 +1,82 @@
+import pytest
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from complainer.cache import FeatureCache, file_digest, vectorizer_fingerprint
+
+
+texts = ['the loan was late', 'escrow payment missing', 'the closing fee']
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return FeatureCache(str(tmp_path / 'features'))
+
+
+def no_texts():
+    raise AssertionError('texts should not be read on a cache hit')
+
+
+class TestDigests:
+    def test_file_digest_depends_on_contents(self, tmp_path):
+        a, b = tmp_path / 'a.csv', tmp_path / 'b.csv'
+        a.write_text('x')
+        b.write_text('y')
+        assert file_digest(str(a)) != file_digest(str(b))
+        assert file_digest(str(a)) == file_digest(str(a))
+
+    def test_directory_digest_changes_with_new_parts(self, tmp_path):
+        (tmp_path / 'part-00000.csv').write_text('x')
+        before = file_digest(str(tmp_path))
+        (tmp_path / 'part-00001.csv').write_text('y')
+        assert file_digest(str(tmp_path)) != before
+
+    def test_fingerprint_depends_on_params(self):
+        assert (vectorizer_fingerprint(TfidfVectorizer())
+                != vectorizer_fingerprint(TfidfVectorizer(min_df=2)))
+
+
+class TestFitTransform:
+    def test_miss_then_hit_returns_same_features(self, cache):
+        vectorizer, X = cache.fit_transform(TfidfVectorizer(), texts, 'd1')
+        cached_vectorizer, cached_X = cache.fit_transform(TfidfVectorizer(),
+                                                          no_texts, 'd1')
+        assert (X != cached_X).nnz == 0
+        assert cached_vectorizer.vocabulary_ == vectorizer.vocabulary_
+
+    def test_changed_data_is_a_miss(self, cache):
+        cache.fit_transform(TfidfVectorizer(), texts, 'd1')
+        _, X = cache.fit_transform(TfidfVectorizer(), texts[:2], 'd2')
+        assert X.shape[0] == 2
+
+    def test_changed_params_is_a_miss(self, cache):
+        cache.fit_transform(TfidfVectorizer(), texts, 'd1')
+        vectorizer, _ = cache.fit_transform(
+            TfidfVectorizer(stop_words=['the']), texts, 'd1')
+        assert 'the' not in vectorizer.vocabulary_
+
+
+class TestTransform:
+    def test_miss_then_hit_returns_same_features(self, cache):
+        vectorizer = TfidfVectorizer().fit(texts)
+        X = cache.transform(vectorizer, texts, 'd1', 'v1')
+        cached_X = cache.transform(vectorizer, no_texts, 'd1', 'v1')
+        assert (X != cached_X).nnz == 0
+
+    def test_changed_vectorizer_is_a_miss(self, cache):
+        vectorizer = TfidfVectorizer().fit(texts)
+        cache.transform(vectorizer, texts, 'd1', 'v1')
+        X = cache.transform(vectorizer, texts[:1], 'd1', 'v2')
+        assert X.shape[0] == 1
+
+
+class TestTermCounts:
+    def test_term_counts_are_cached(self, cache):
+        counts = cache.term_counts(texts, data_digest='a', ngram_range=(1, 2))
+        cached = cache.term_counts(lambda: pytest.fail('text was read'),
+                                   data_digest='a', ngram_range=(1, 2))
+        assert list(cached.terms) == list(counts.terms)
+        assert (cached.counts != counts.counts).nnz == 0
+
+        other = cache.term_counts(texts, data_digest='a')
+        assert len(other.terms) < len(counts.terms)
@@ -0,0 +1,24 @@
+import pytest
+
+from sklearn.naive_bayes import MultinomialNB
+
+from complainer.classifiers import make_classifier
+from complainer.nbsvm import NBSVM
+
+
+class TestMakeClassifier:
+    def test_makes_named_classifier_with_params(self):
+        model = make_classifier('nb', alpha=0.5)
+        assert isinstance(model, MultinomialNB)
+        assert model.alpha == 0.5
+        assert isinstance(make_classifier('nbsvm'), NBSVM)
+
+    def test_unknown_classifier_throws(self):
+        with pytest.raises(ValueError):
+            make_classifier('forest')
+
+    def test_n_jobs_only_set_where_taken(self):
+        assert make_classifier('nbsvm', n_jobs=1).n_jobs == 1
+        assert make_classifier('sgd', n_jobs=1).n_jobs == 1
+        assert make_classifier('nbsvm').n_jobs is None
+        assert 'n_jobs' not in make_classifier('nb', n_jobs=1).get_params()
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+import pandas as pd
+
+from complainer.dataset import (
+    PartitionedWriter, iter_dataset, list_partitions, partition_directory,
+    read_dataset
+)
+
+
+@pytest.fixture
+def complaints():
+    return pd.DataFrame({
+        'Product': ['Mortgage', 'Credit card', 'Mortgage',
+                    'Credit reporting, repair', None],
+        'year': [2018, 2019, 2019, 2019, 2019],
+        'Complaint ID': [1, 2, 3, 4, 5]
+    })
+
+
+def write(root, chunks, **kwargs):
+    with PartitionedWriter(root, ['Product', 'year'], **kwargs) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+    return writer
+
+
+class TestPartitionDirectory:
+    def test_partition_directories_are_quoted(self, tmp_path):
+        directory = partition_directory(str(tmp_path), [('Product', 'A, b/c')])
+        assert os.path.basename(directory) == 'Product=A%2C%20b%2Fc'
+
+
+class TestReadDataset:
+    def test_round_trip(self, tmp_path, complaints):
+        root = str(tmp_path)
+        writer = write(root, [complaints.iloc[:2], complaints.iloc[2:]])
+        assert writer.rows == 5
+        assert len(writer.partitions) == 5
+        df = read_dataset(root).sort_values('Complaint ID')
+        assert list(df['Complaint ID']) == [1, 2, 3, 4, 5]
+        assert list(df['Product'].astype(object).fillna('-')) == [
+            'Mortgage', 'Credit card', 'Mortgage',
+            'Credit reporting, repair', '-'
+        ]
+        assert list(df['year'].astype(int)) == [2018, 2019, 2019, 2019, 2019]
+
+    def test_filters_prune_partitions(self, tmp_path, complaints):
+        root = str(tmp_path)
+        write(root, [complaints])
+        partitions = list_partitions(
+            root, {'Product': ['Mortgage'], 'year': lambda y: int(y) >= 2019}
+        )
+        assert [values for values, _ in partitions] == [
+            {'Product': 'Mortgage', 'year': '2019'}
+        ]
+        df = read_dataset(root, columns=['Complaint ID', 'Product'],
+                          filters={'Product': ['Mortgage']})
+        assert list(df.columns) == ['Complaint ID', 'Product']
+        assert sorted(df['Complaint ID']) == [1, 3]
+
+
+class TestPartitionedWriter:
+    def test_new_part_is_appended(self, tmp_path, complaints):
+        root = str(tmp_path)
+        write(root, [complaints.iloc[:3]])
+        write(root, [complaints.iloc[[2]].assign(**{'Complaint ID': 6})],
+              part=1)
+        chunks = list(iter_dataset(root, filters={'Product': ['Mortgage']}))
+        assert [list(chunk['Complaint ID']) for chunk in chunks] == [
+            [1], [3], [6]
+        ]
+
+    def test_interrupted_write_publishes_nothing(self, tmp_path, complaints):
+        root = str(tmp_path)
+        writer = PartitionedWriter(root, ['Product'])
+        writer.write(complaints)
+        assert len(read_dataset(root)) == 0
+        writer.close()
+        assert len(read_dataset(root)) == 5
+
+    def test_replace_removes_other_parts(self, tmp_path, complaints):
+        root = str(tmp_path)
+        write(root, [complaints])
+        write(root, [complaints.iloc[[2]].assign(**{'Complaint ID': 6})],
+              part=1)
+        write(root, [complaints.iloc[:2]], replace=True)
+        df = read_dataset(root).sort_values('Complaint ID')
+        assert list(df['Complaint ID']) == [1, 2]
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from complainer.dedup import (
+    DuplicateDetector, MinHasher, drop_duplicates, duplicate_clusters,
+    exact_duplicate_clusters, near_duplicate_clusters, normalize_complaints,
+    normalize_text
+)
+
+
+narratives = [
+    'I made every monthly payment on my mortgage through the online portal '
+    'but the servicer reported two of them as late to the credit bureaus. '
+    'When I called on XX/XX/2019 they admitted the portal had failed and '
+    'promised a correction that has still not been made.',
+    'My escrow account was analyzed in the spring and the company claimed '
+    'a shortage of several thousand dollars because the county tax bill '
+    'was paid twice. They raised my payment without explaining why and '
+    'refuse to refund the duplicate tax payment to me.',
+    'After applying for a loan modification we sent every document they '
+    'asked for three separate times. Each time a new representative told '
+    'us the file was incomplete, and meanwhile the bank scheduled a '
+    'foreclosure sale of our home for next month.',
+    'At closing the lender charged origination and appraisal fees that '
+    'were far higher than the estimate we signed weeks earlier. Nobody at '
+    'the title company could explain the difference, and the loan officer '
+    'stopped answering my emails after the papers were signed.',
+    'Our loan was sold to another servicer and nobody told us where to '
+    'send the payment for the first month. The old company returned the '
+    'check, the new one charged a late fee, and both say the other is '
+    'responsible for fixing the mistake on our account.'
+]
+
+edited = [narratives[0] + ' Thank you for your help.',
+          narratives[2] + ' Please look into this.']
+
+
+class TestNormalizeText:
+    def test_redaction_runs_and_whitespace_are_normalized(self):
+        texts = ['On XX/XX/2019 I  called XXXX XXXX\n about it. ',
+                 'XXL 12/2019', None]
+        assert list(normalize_text(texts)) == [
+            'On XXXX I called XXXX about it.', 'XXL 12/2019', ''
+        ]
+
+    def test_normalize_complaints_step_keeps_issue(self):
+        df = pd.DataFrame({'complaint': ['a  XXXX XXXX b'], 'issue': ['x']})
+        assert normalize_complaints(df).to_dict('list') == {
+            'complaint': ['a XXXX b'], 'issue': ['x']
+        }
+
+
+class TestExactDuplicates:
+    def test_exact_duplicates_ignore_case_redactions_and_whitespace(self):
+        texts = ['Paid on XX/XX/2019.', 'paid on  XXXX.', 'Paid late.', 'x']
+        assert list(exact_duplicate_clusters(texts)) == [0, 0, 2, 3]
+
+    def test_drop_duplicates_keeps_first_of_each_cluster(self):
+        df = pd.DataFrame({'text': ['a b', 'A  b', 'c']})
+        kept = drop_duplicates(df, duplicate_clusters(df.text))
+        assert list(kept.text) == ['a b', 'c']
+
+    def test_empty_input(self):
+        assert len(duplicate_clusters([])) == 0
+
+
+class TestNearDuplicates:
+    def test_similar_texts_have_similar_signatures(self):
+        hasher = MinHasher(num_perm=128)
+        a = hasher.signatures(narratives[:2])
+        b = hasher.signatures(edited[:1])
+        assert (a[0] == b[0]).mean() > 0.8
+        assert (a[0] == a[1]).mean() < 0.2
+
+    def test_near_duplicates_are_clustered_with_their_original(self):
+        texts = narratives + edited
+        assert list(duplicate_clusters(texts)) == [0, 1, 2, 3, 4, 0, 2]
+        assert list(exact_duplicate_clusters(texts)) == [0, 1, 2, 3, 4, 5, 6]
+
+    def test_detector_over_chunks_agrees_with_one_pass(self):
+        texts = narratives + edited + narratives[3:]
+        detector = DuplicateDetector()
+        for start in range(0, len(texts), 3):
+            detector.update(texts[start:start + 3])
+        assert list(detector.clusters()) == [0, 1, 2, 3, 4, 0, 2, 3, 4]
+        assert (detector.clusters() == duplicate_clusters(texts)).all()
+
+    def test_bands_must_divide_signature_length(self):
+        with pytest.raises(ValueError):
+            near_duplicate_clusters(np.zeros((2, 64), dtype=np.uint32),
+                                    bands=7)
@@ -0,0 +1,181 @@
+import pickle
+
+import pytest
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from complainer.features import HashingTfidfVectorizer, TermCounts
+from complainer.parallel import make_executor
+
+
+texts = ['the loan was late and the bank did not help',
+         'escrow payment missing from my statement',
+         'the closing fee was much higher than quoted',
+         'foreclosure notice sent after loan modification']
+
+
+def pairwise_similarities(X):
+    return (X @ X.T).toarray()
+
+
+class TestHashingTfidfVectorizer:
+    def test_matches_tfidf_similarities_without_collisions(self):
+        hashed = HashingTfidfVectorizer().fit(texts).transform(texts)
+        tfidf = TfidfVectorizer().fit(texts).transform(texts)
+        np.testing.assert_allclose(pairwise_similarities(hashed),
+                                   pairwise_similarities(tfidf),
+                                   rtol=1e-5)
+
+    def test_partial_fit_over_chunks_equals_fit(self):
+        whole = HashingTfidfVectorizer().fit(texts)
+        chunked = HashingTfidfVectorizer()
+        for chunk in [texts[:1], texts[1:3], texts[3:]]:
+            chunked.partial_fit(chunk)
+        assert chunked.n_documents_ == whole.n_documents_
+        np.testing.assert_array_equal(chunked.idf_, whole.idf_)
+
+    def test_unseen_terms_get_no_weight(self):
+        vectorizer = HashingTfidfVectorizer().fit(texts)
+        assert vectorizer.transform(['zebra giraffe']).nnz == 0
+
+    def test_output_is_float32_and_normalized(self):
+        X = HashingTfidfVectorizer().fit_transform(texts)
+        assert X.dtype == np.float32
+        np.testing.assert_allclose(X.multiply(X).sum(axis=1), 1, rtol=1e-5)
+
+    def test_fit_transform_hashes_once(self, monkeypatch):
+        expected = HashingTfidfVectorizer().fit(texts).transform(texts)
+        vectorizer = HashingTfidfVectorizer()
+        calls = []
+        hash_counts = vectorizer._hash_counts
+        monkeypatch.setattr(vectorizer, '_hash_counts',
+                            lambda texts: calls.append(1) or
+                            hash_counts(texts))
+        X = vectorizer.fit_transform(texts)
+        assert len(calls) == 1
+        assert (X != expected).nnz == 0
+
+    def test_idf_is_computed_once_per_fit(self, monkeypatch):
+        vectorizer = HashingTfidfVectorizer()
+        calls = []
+        idf = vectorizer._idf
+        monkeypatch.setattr(vectorizer, '_idf',
+                            lambda: calls.append(1) or idf())
+        X = vectorizer.fit_transform(texts)
+        vectorizer.transform(texts)
+        assert len(calls) == 1
+        expected = HashingTfidfVectorizer().fit(texts)
+        assert (X != expected.transform(texts)).nnz == 0
+        np.testing.assert_array_equal(vectorizer.idf_, expected.idf_)
+
+        # More documents change the weights of the next transform.
+        vectorizer.partial_fit(texts[:1])
+        calls.clear()
+        X = vectorizer.transform(texts)
+        vectorizer.transform(texts)
+        assert len(calls) == 1
+        expected = HashingTfidfVectorizer().fit(texts + texts[:1])
+        assert (X != expected.transform(texts)).nnz == 0
+
+    def test_pickle_round_trip_is_compact(self):
+        vectorizer = HashingTfidfVectorizer().fit(texts)
+        pickled = pickle.dumps(vectorizer)
+        assert len(pickled) < 10000
+        restored = pickle.loads(pickled)
+        X = vectorizer.transform(texts)
+        assert (restored.transform(texts) != X).nnz == 0
+
+
+corpus = ['Escrow payment was late, late again', 'my escrow account is short',
+          'foreclosure after loan modification', 'they started foreclosure',
+          'late escrow payment again and again',
+          'modification denied then foreclosure', 'the loan was sold']
+
+
+class TestTermCounts:
+    @pytest.mark.parametrize('params', [
+        {},
+        {'ngram_range': (1, 2)},
+        {'ngram_range': (2, 3), 'sublinear_tf': True},
+        {'min_df': 2, 'norm': 'l1'},
+        {'max_df': 0.3, 'use_idf': False},
+        {'min_df': 0.2, 'max_df': 3, 'smooth_idf': False},
+        {'max_features': 5, 'ngram_range': (1, 3)},
+        {'max_features': 4, 'binary': True, 'norm': None},
+    ])
+    def test_term_counts_derive_tfidf_vectorizer(self, params):
+        counts = TermCounts.from_texts(corpus, ngram_range=(1, 3))
+        vectorizer, X = counts.tfidf(**params)
+
+        expected_vectorizer = TfidfVectorizer(**params)
+        expected = expected_vectorizer.fit_transform(corpus)
+        assert vectorizer.vocabulary_ == expected_vectorizer.vocabulary_
+        if expected_vectorizer.use_idf:
+            np.testing.assert_array_equal(vectorizer.idf_,
+                                          expected_vectorizer.idf_)
+        # Equal up to the order of summation in normalizing.
+        np.testing.assert_allclose(X.toarray(), expected.toarray(), rtol=1e-12)
+        np.testing.assert_allclose(
+            vectorizer.transform(corpus[:3]).toarray(),
+            expected_vectorizer.transform(corpus[:3]).toarray(),
+            rtol=1e-12
+        )
+
+    def test_term_counts_count_other_texts(self):
+        counts = TermCounts.from_texts(corpus[:4], ngram_range=(1, 2))
+        other = counts.count(corpus[4:])
+        vectorizer, _ = counts.tfidf(ngram_range=(1, 2), binary=True)
+        np.testing.assert_allclose(
+            other.transform(vectorizer).toarray(),
+            vectorizer.transform(corpus[4:]).toarray(),
+            rtol=1e-12
+        )
+
+    def test_term_counts_save_load(self, tmp_path):
+        counts = TermCounts.from_texts(corpus, ngram_range=(1, 2),
+                                       stop_words='english')
+        counts.save(str(tmp_path / 'counts'))
+        loaded = TermCounts.load(str(tmp_path / 'counts'))
+        assert list(loaded.terms) == list(counts.terms)
+        assert (loaded.counts != counts.counts).nnz == 0
+        assert loaded.params == counts.params
+        assert loaded.tfidf(stop_words='english')[1].shape[0] == len(corpus)
+
+    def test_term_counts_reject_other_tokenization(self):
+        counts = TermCounts.from_texts(corpus)
+        with pytest.raises(ValueError):
+            counts.tfidf(lowercase=False)
+        with pytest.raises(ValueError):
+            counts.tfidf(ngram_range=(1, 2))
+
+    @pytest.mark.parametrize('n_shards', [1, 3, 7])
+    def test_term_counts_in_parallel_are_identical(self, n_shards):
+        serial = TermCounts.from_texts(corpus, ngram_range=(1, 2))
+        with make_executor(2) as executor:
+            parallel = TermCounts.from_texts(corpus, ngram_range=(1, 2),
+                                             executor=executor,
+                                             n_shards=n_shards)
+            other = parallel.count(corpus[:4], executor=executor, n_shards=2)
+        assert list(parallel.terms) == list(serial.terms)
+        for a, b in [(parallel.counts, serial.counts),
+                     (other.counts, serial.count(corpus[:4]).counts)]:
+            np.testing.assert_array_equal(a.indptr, b.indptr)
+            np.testing.assert_array_equal(a.indices, b.indices)
+            np.testing.assert_array_equal(a.data, b.data)
+
+        vectorizer, X = parallel.tfidf(ngram_range=(1, 2))
+        expected_vectorizer, expected = serial.tfidf(ngram_range=(1, 2))
+        assert vectorizer.vocabulary_ == expected_vectorizer.vocabulary_
+        np.testing.assert_array_equal(vectorizer.idf_,
+                                      expected_vectorizer.idf_)
+        assert (X != expected).nnz == 0
+
+    def test_term_counts_in_parallel_allow_shards_without_terms(self):
+        texts = ['the', 'escrow was late', 'and the', 'late again']
+        with make_executor(2) as executor:
+            counts = TermCounts.from_texts(texts, stop_words='english',
+                                           executor=executor, n_shards=4)
+        assert list(counts.terms) == ['escrow', 'late']
+        assert counts.counts.toarray().tolist() == [[0, 0], [1, 1], [0, 0],
+                                                    [0, 1]]
@@ -0,0 +1,105 @@
+import pandas as pd
+
+from complainer.incremental import Watermark, newer_rows
+from complainer.ingestion import read_complaints_chunked
+
+
+def complaints(rows):
+    return pd.DataFrame(rows, columns=['Date received', 'Complaint ID'])
+
+
+class TestWatermark:
+    def test_empty_watermark_takes_every_row(self):
+        df = complaints([('01/02/2019', 5), ('01/01/2019', 7)])
+        assert Watermark().newer(df).all()
+
+    def test_newer_orders_by_date_then_id(self):
+        watermark = Watermark('2019-01-02', 5)
+        df = complaints([('01/01/2019', 9), ('01/02/2019', 4),
+                         ('01/02/2019', 5), ('01/02/2019', 6),
+                         ('01/03/2019', 1)])
+        assert list(watermark.newer(df)) == [False, False, False, True, True]
+
+    def test_advance_keeps_the_newest(self):
+        watermark = Watermark('2019-01-02', 5, parts=3)
+        advanced = watermark.advance(complaints([('01/02/2019', 6),
+                                                 ('01/02/2019', 2),
+                                                 ('12/31/2018', 99)]))
+        assert advanced == Watermark('2019-01-02', 6, parts=3)
+        assert advanced.advance(complaints([('01/01/2019', 99)])) == advanced
+        assert advanced.advance(complaints([])) == advanced
+
+    def test_save_and_load_round_trip(self, tmp_path):
+        assert Watermark.load(str(tmp_path)) == Watermark()
+        watermark = Watermark('2019-04-22', 3211765, parts=2)
+        watermark.save(str(tmp_path))
+        assert Watermark.load(str(tmp_path)) == watermark
+
+
+class TestNewerRows:
+    def test_refresh_of_snapshot_takes_only_new_rows(self, tmp_path):
+        snapshot = str(tmp_path / 'complaints.csv')
+        columns = ['Date received', 'Complaint ID',
+                   'Consumer complaint narrative']
+        old = pd.DataFrame([('01/01/2019', 1, 'escrow'),
+                            ('01/02/2019', 3, 'late fee'),
+                            ('01/02/2019', 2, None)], columns=columns)
+        # The next snapshot has newer complaints, one without a narrative.
+        new = pd.DataFrame([('01/02/2019', 4, 'foreclosure'),
+                            ('01/03/2019', 5, None),
+                            ('01/03/2019', 6, 'closing costs')],
+                           columns=columns)
+
+        old.to_csv(snapshot, index=False)
+        watermark = Watermark()
+        for chunk in newer_rows(read_complaints_chunked(snapshot, 2,
+                                                        usecols=columns),
+                                watermark):
+            watermark = watermark.advance(chunk)
+        assert watermark == Watermark('2019-01-02', 3)
+
+        pd.concat([old, new]).to_csv(snapshot, index=False)
+        refreshed = pd.concat(newer_rows(
+            read_complaints_chunked(snapshot, 2, usecols=columns), watermark))
+        assert list(refreshed['Complaint ID']) == [4, 6]
+
+
+class TestLookback:
+    def test_late_complaints_within_the_window_are_taken(self):
+        watermark = Watermark().advance(
+            complaints([('01/01/2019', 1), ('01/05/2019', 3),
+                        ('01/10/2019', 5)]), lookback_days=7)
+        assert watermark.since == pd.Timestamp('2019-01-03')
+        assert watermark.earliest == watermark.since
+        # 2 and 4 were published late; 2 is older than the window.
+        df = complaints([('01/01/2019', 1), ('01/01/2019', 2),
+                         ('01/05/2019', 3), ('01/05/2019', 4),
+                         ('01/10/2019', 5), ('01/11/2019', 6)])
+        assert list(watermark.newer(df)) == [False, False, False, True,
+                                             False, True]
+
+    def test_window_follows_the_watermark(self):
+        watermark = Watermark().advance(
+            complaints([('01/05/2019', 3), ('01/10/2019', 5)]),
+            lookback_days=7)
+        # Late complaints do not move the watermark back.
+        watermark = watermark.advance(complaints([('01/06/2019', 4)]), 7)
+        assert watermark.date == pd.Timestamp('2019-01-10')
+        watermark = watermark.advance(complaints([('01/15/2019', 6)]), 7)
+        assert watermark.since == pd.Timestamp('2019-01-08')
+        assert watermark.recent == {pd.Timestamp('2019-01-10'): {5},
+                                    pd.Timestamp('2019-01-15'): {6}}
+
+    def test_window_starts_after_a_watermark_without_one(self):
+        watermark = Watermark('2019-01-10', 5).advance(
+            complaints([('01/12/2019', 6)]), lookback_days=7)
+        # The IDs of the complaints up to the old watermark are unknown.
+        assert watermark.since == pd.Timestamp('2019-01-11')
+        assert watermark.advance(complaints([]), 0).since is None
+
+    def test_save_and_load_round_trip(self, tmp_path):
+        watermark = Watermark().advance(
+            complaints([('01/05/2019', 3), ('01/10/2019', 5)]),
+            lookback_days=7)
+        watermark.save(str(tmp_path))
+        assert Watermark.load(str(tmp_path)) == watermark
@@ -0,0 +1,65 @@
+import io
+
+import pytest
+
+import pandas as pd
+from pandas.testing import assert_frame_equal, assert_series_equal
+
+from complainer.ingestion import (
+    read_complaints_chunked, read_complaints, concat_chunks
+)
+
+
+@pytest.fixture
+def raw_csv():
+    """A tiny raw dump, with one more column than we care about."""
+    raw = pd.DataFrame(
+      {'Date received': ['2019-01-0{}'.format(i) for i in range(1, 7)],
+       'Product': ['Mortgage', 'Student loan'] * 3,
+       'Sub-product': ['FHA mortgage', 'Private loan'] * 3,
+       'Issue': ['a_mortgage_issue', 'a_loan_issue'] * 3,
+       'Consumer complaint narrative': ['Blah', None, 'Yadda', 'Harumph',
+                                        None, 'Meh'],
+       'Complaint ID': [1, 2, 3, 4, 5, 6]}
+    )
+    return io.StringIO(raw.to_csv(index=False))
+
+
+class TestReadComplaintsChunked:
+    def test_chunks_are_bounded_by_chunksize(self, raw_csv):
+        chunks = list(read_complaints_chunked(raw_csv, chunksize=2))
+        assert all(len(chunk) <= 2 for chunk in chunks)
+
+    def test_rows_without_narrative_are_dropped(self, raw_csv):
+        chunks = list(read_complaints_chunked(raw_csv, chunksize=2))
+        ids = pd.concat(chunks)['Complaint ID']
+        assert list(ids) == [1, 3, 4, 6]
+
+    def test_unused_columns_are_not_read(self, raw_csv):
+        chunk = next(read_complaints_chunked(raw_csv))
+        assert 'Sub-product' not in chunk.columns
+
+    def test_low_cardinality_columns_are_categorical(self, raw_csv):
+        chunk = next(read_complaints_chunked(raw_csv))
+        assert chunk['Product'].dtype == 'category'
+        assert chunk['Issue'].dtype == 'category'
+
+
+class TestReadComplaints:
+    def test_same_result_for_any_chunksize(self, raw_csv):
+        small = read_complaints(raw_csv, chunksize=1)
+        raw_csv.seek(0)
+        large = read_complaints(raw_csv, chunksize=100)
+        assert_frame_equal(small, large)
+
+    def test_concatenation_keeps_categories(self, raw_csv):
+        df = read_complaints(raw_csv, chunksize=1)
+        assert df['Product'].dtype == 'category'
+        assert set(df['Product']) == {'Mortgage', 'Student loan'}
+
+
+class TestConcatChunks:
+    def test_concat_chunks_preserves_order(self):
+        chunks = [pd.DataFrame({'a': [1, 2]}), pd.DataFrame({'a': [3]})]
+        assert_series_equal(concat_chunks(chunks)['a'],
+                            pd.Series([1, 2, 3], name='a'))
@@ -0,0 +1,123 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+from complainer.instrumentation import RunLog, peak_rss, timed
+
+
+def read_log(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+class TestRunLog:
+    def test_stages_are_logged_as_json_lines(self, tmp_path):
+        path = str(tmp_path / 'run.jsonl')
+        log = RunLog(path, 'train')
+        log.params(MODEL_DIRECTORY='models/')
+        with log.stage('read', rows=3):
+            pass
+        with log.stage('fit', model='nb') as stage:
+            stage.rows = 10
+
+        params, read, fit = read_log(path)
+        assert params['event'] == 'params'
+        assert params['params'] == {'MODEL_DIRECTORY': 'models/'}
+        assert read['stage'] == 'read' and read['rows'] == 3
+        assert fit['rows'] == 10 and fit['model'] == 'nb'
+        assert {r['run'] for r in [params, read, fit]} == {log.run}
+        assert all(r['job'] == 'train' for r in [params, read, fit])
+        for record in [read, fit]:
+            assert record['seconds'] >= 0
+            assert record['cpu_seconds'] >= 0
+            assert record['peak_rss_bytes'] > 0
+
+    def test_peak_rss_covers_allocations_in_the_stage(self):
+        log = RunLog(None, 'job')
+        with log.stage('allocate'):
+            a = np.ones(50 * 2 ** 20 // 8)
+        del a
+        assert log.stages[0].peak_rss_bytes >= 50 * 2 ** 20
+        assert peak_rss() > 0
+
+    def test_errors_are_logged_and_raised(self, tmp_path):
+        path = str(tmp_path / 'run.jsonl')
+        log = RunLog(path, 'job')
+        with pytest.raises(KeyError):
+            with log.stage('read'):
+                raise KeyError('issue')
+        assert read_log(path)[0]['error'] == "KeyError('issue')"
+
+    def test_disabled_log_writes_nothing(self, tmp_path):
+        log = RunLog('', 'job')
+        with log.stage('read', rows=1):
+            pass
+        assert list(tmp_path.iterdir()) == []
+        assert 'read' in log.summary()
+
+
+class TestInterleavedStages:
+    def test_interleaved_stages_accumulate_over_chunks(self, tmp_path):
+        path = str(tmp_path / 'run.jsonl')
+        log = RunLog(path, 'score')
+        chunks = [[1, 2], [3], [4, 5, 6]]
+        with log.interleaved() as stages:
+            for chunk in stages.iterate('read', chunks):
+                with stages.stage('predict', rows=len(chunk)):
+                    time.sleep(0.01)
+                stages.update({'write': [0.5, 0.25]}, rows=len(chunk))
+
+        read, predict, write = read_log(path)
+        assert [r['stage'] for r in [read, predict, write]] == [
+            'read', 'predict', 'write']
+        assert all(r['rows'] == 6 and r['entries'] == 3
+                   for r in [read, predict, write])
+        assert predict['seconds'] >= 0.03
+        assert write['seconds'] == 1.5 and write['cpu_seconds'] == 0.75
+        assert len({r['peak_rss_bytes'] for r in [read, predict, write]}) == 1
+        assert 'predict' in log.summary()
+
+    def test_timed_adds_to_timings(self):
+        timings = {}
+        for _ in range(2):
+            with timed(timings, 'parse'):
+                time.sleep(0.01)
+        assert list(timings) == ['parse']
+        assert timings['parse'][0] >= 0.02
+
+    def test_interleaved_errors_are_logged_with_every_stage(self, tmp_path):
+        path = str(tmp_path / 'run.jsonl')
+        log = RunLog(path, 'job')
+        with pytest.raises(KeyError):
+            with log.interleaved() as stages:
+                with stages.stage('read'):
+                    pass
+                with stages.stage('fit'):
+                    raise KeyError('issue')
+        errors = [r['error'] for r in read_log(path)]
+        assert errors == ["KeyError('issue')"] * 2
+
+    def test_nested_stages_count_toward_the_inner_stage(self):
+        log = RunLog(None, 'split')
+        with log.interleaved() as stages:
+            def read():
+                for chunk in [[1, 2], [3]]:
+                    time.sleep(0.02)
+                    yield chunk
+
+            def split(chunks):
+                for chunk in chunks:
+                    yield chunk[:1], chunk[1:]
+
+            splits = stages.iterate(
+                'split', split(stages.iterate('read', read())),
+                rows=lambda subsets: sum(map(len, subsets))
+            )
+            assert len(list(splits)) == 2
+
+        read, split = log.stages
+        assert read.rows == split.rows == 3
+        assert read.seconds >= 0.04
+        assert split.seconds < 0.02
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from complainer.length import (
+    ChunkPoolVectorizer, LengthPolicy, chunk_texts, length_batches,
+    length_buckets, pool_rows, truncate_text
+)
+from complainer.preprocessing import Preprocessor
+
+
+TEXT = 'one two three four five six seven eight'
+
+
+class TestTruncation:
+    def test_truncation_cuts_at_whitespace(self):
+        assert truncate_text(TEXT, 100) == TEXT
+        assert truncate_text(TEXT, 15) == 'one two three'
+        assert truncate_text(TEXT, 13) == 'one two three'
+        assert truncate_text(TEXT, 12, keep='tail') == 'seven eight'
+        assert truncate_text(TEXT, 20, keep='head_tail') == 'one two eight'
+        for keep in ['head', 'tail', 'head_tail']:
+            for max_chars in range(1, len(TEXT)):
+                assert len(truncate_text(TEXT, max_chars, keep)) <= max_chars
+
+    def test_unknown_keep_raises(self):
+        with pytest.raises(ValueError):
+            LengthPolicy(100, keep='middle')
+
+    def test_policy_as_preprocessing_step(self):
+        raw = pd.DataFrame({
+            'Product': ['Mortgage', 'Mortgage'],
+            'Issue': ['Settlement process and costs'] * 2,
+            'Consumer complaint narrative': [TEXT, 'short']
+        })
+        policy = LengthPolicy(max_chars=8)
+        processed = Preprocessor(steps=[policy]).transform(raw)
+        assert list(processed.complaint) == ['one two', 'short']
+        assert LengthPolicy().truncate([TEXT]) == [TEXT]
+
+
+class TestChunkPooling:
+    def test_chunks_cover_every_word(self):
+        texts = [TEXT, '', 'a']
+        windows, owners = chunk_texts(texts, 10)
+        assert list(owners) == [0, 0, 0, 0, 1, 2]
+        assert ' '.join(windows[:4]) == TEXT
+        assert all(len(window) <= 10 + len('three') for window in windows)
+
+    def test_pooling(self):
+        X = scipy.sparse.csr_matrix([[1., 0.], [3., 4.], [0., 2.]])
+        owners = [0, 0, 2]
+        mean = pool_rows(X, owners, 3)
+        assert mean.toarray().tolist() == [[2., 2.], [0., 0.], [0., 2.]]
+        maximum = pool_rows(X, owners, 3, how='max')
+        assert maximum.toarray().tolist() == [[3., 4.], [0., 0.], [0., 2.]]
+
+    def test_chunk_pool_vectorizer_matches_vectorizer_on_short_texts(self):
+        texts = ['the loan was sold', 'my escrow went up', 'the loan']
+        pooled = ChunkPoolVectorizer(TfidfVectorizer(), max_chars=100)
+        X = pooled.fit(texts).transform(texts)
+        expected = TfidfVectorizer().fit_transform(texts)
+        assert np.allclose(X.toarray(), expected.toarray())
+        assert pooled.transform([TEXT * 50]).shape == (1, X.shape[1])
+
+
+class TestLengthBatches:
+    def test_length_buckets_and_batches(self):
+        lengths = [5, 600, 50, 20000, 30, 40]
+        assert list(length_buckets(lengths)) == [0, 1, 0, 3, 0, 0]
+        batches = length_batches(lengths, 100)
+        assert [list(batch) for batch in batches] == [[0, 4, 5, 2], [1], [3]]
+        assert length_batches([], 100) == []
@@ -0,0 +1,76 @@
+import pytest
+
+import numpy as np
+from sklearn.metrics import (
+    roc_auc_score, precision_recall_fscore_support, confusion_matrix
+)
+from sklearn.preprocessing import label_binarize
+
+from complainer.metrics import StreamingMetrics
+
+
+labels = ['a', 'b', 'c', 'd']
+
+
+@pytest.fixture
+def predictions():
+    rng = np.random.RandomState(0)
+    y_true = rng.choice(labels, 500, p=[0.5, 0.3, 0.15, 0.05])
+    scores = rng.dirichlet(np.ones(4), 500)
+    # Make the scores informative.
+    scores[np.arange(500), np.searchsorted(labels, y_true)] += 0.5
+    scores /= scores.sum(axis=1, keepdims=True)
+    y_pred = np.array(labels)[scores.argmax(axis=1)]
+    return y_true, y_pred, scores
+
+
+def streamed(y_true, y_pred, scores=None, chunksize=64):
+    metrics = StreamingMetrics(labels)
+    for i in range(0, len(y_true), chunksize):
+        metrics.update(y_true[i:i + chunksize],
+                       y_pred[i:i + chunksize],
+                       None if scores is None else scores[i:i + chunksize])
+    return metrics
+
+
+class TestStreamingMetrics:
+    def test_confusion_matrix_matches_sklearn(self, predictions):
+        y_true, y_pred, _ = predictions
+        np.testing.assert_array_equal(
+            streamed(y_true, y_pred).confusion_matrix(),
+            confusion_matrix(y_true, y_pred, labels=labels)
+        )
+
+    @pytest.mark.parametrize('average', ['weighted', 'macro', None])
+    def test_prfs_matches_sklearn(self, predictions, average):
+        y_true, y_pred, _ = predictions
+        expected = precision_recall_fscore_support(y_true, y_pred,
+                                                   labels=labels,
+                                                   average=average)
+        result = streamed(y_true, y_pred).precision_recall_fscore_support(
+            average)
+        for a, b in zip(result[:3], expected[:3]):
+            np.testing.assert_allclose(a, b)
+
+    def test_hard_prediction_auc_matches_binarized_sklearn(self, predictions):
+        y_true, y_pred, _ = predictions
+        expected = roc_auc_score(label_binarize(y_true, classes=labels),
+                                 label_binarize(y_pred, classes=labels),
+                                 average='weighted')
+        assert streamed(y_true, y_pred).roc_auc() == pytest.approx(expected)
+
+    def test_score_auc_matches_sklearn(self, predictions):
+        y_true, y_pred, scores = predictions
+        expected = roc_auc_score(label_binarize(y_true, classes=labels),
+                                 scores, average='weighted')
+        auc = streamed(y_true, y_pred, scores).roc_auc()
+        assert auc == pytest.approx(expected, abs=1e-3)
+
+    def test_absent_labels_are_ignored_in_weighted_auc(self):
+        metrics = StreamingMetrics(labels).update(['a', 'b'], ['a', 'b'])
+        assert metrics.roc_auc() == pytest.approx(1.0)
+        assert np.isnan(metrics.roc_auc(average=None)[2])
+
+    def test_unknown_labels_throw(self):
+        with pytest.raises(ValueError):
+            StreamingMetrics(labels).update(['a'], ['z'])
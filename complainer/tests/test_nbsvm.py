@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+import scipy.sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.svm import LinearSVC
+
+from complainer.artifacts import load_compact_model, save_compact_model
+from complainer.nbsvm import NBSVM, log_count_ratios
+from complainer.synthetic import synthetic_complaints
+from complainer.classifiers import make_classifier
+
+
+@pytest.fixture(scope='module')
+def data():
+    raw = synthetic_complaints(3000, random_state=0)
+    raw = raw[raw['Consumer complaint narrative'].notnull()]
+    X = TfidfVectorizer().fit_transform(raw['Consumer complaint narrative'])
+    return X, raw['Issue'].values
+
+
+def reference_binary(X, y, alpha=1, C=1, beta=0.25):
+    # The fastforwardlabs/nbsvm computation of one class against the rest.
+    p = np.asarray(alpha + X[y == 1].sum(axis=0)).flatten()
+    q = np.asarray(alpha + X[y == 0].sum(axis=0)).flatten()
+    r = np.log(p / np.abs(p).sum()) - np.log(q / np.abs(q).sum())
+    b = np.log((y == 1).sum()) - np.log((y == 0).sum())
+    svm = LinearSVC(C=C, fit_intercept=False, max_iter=10000).fit(
+        X @ scipy.sparse.diags(r), y)
+    mean_magnitude = np.abs(svm.coef_).mean()
+    coef = (1 - beta) * mean_magnitude * r + beta * (r * svm.coef_)
+    intercept = (1 - beta) * mean_magnitude * b + beta * svm.intercept_
+    return coef.ravel(), float(np.ravel(intercept)[0])
+
+
+class TestLogCountRatios:
+    def test_log_count_ratios_of_every_class_at_once(self, data):
+        X, issues = data
+        classes, y = np.unique(issues, return_inverse=True)
+        r, b = log_count_ratios(X.astype(np.float32), y)
+        for k in range(len(classes)):
+            p = 1 + np.asarray(X[y == k].sum(axis=0)).ravel()
+            q = 1 + np.asarray(X[y != k].sum(axis=0)).ravel()
+            expected = np.log(p / p.sum()) - np.log(q / q.sum())
+            assert np.allclose(r[k], expected, atol=1e-5)
+            assert np.isclose(b[k], np.log((y == k).sum() / (y != k).sum()))
+
+
+class TestNBSVM:
+    def test_matches_reference_implementation(self, data):
+        X, issues = data
+        model = NBSVM(n_jobs=1).fit(X, issues)
+        assert model.coef_.dtype == np.float32
+        for k, label in enumerate(model.classes_):
+            coef, intercept = reference_binary(
+                X, (issues == label).astype(int))
+            assert np.allclose(model.coef_[k], coef, atol=1e-3)
+            assert np.isclose(model.intercept_[k], intercept, atol=1e-3)
+
+    def test_parallel_fit_equals_serial_fit(self, data):
+        X, issues = data
+        serial = NBSVM(n_jobs=1).fit(X, issues)
+        parallel = NBSVM(n_jobs=3).fit(X, issues)
+        assert np.array_equal(serial.coef_, parallel.coef_)
+        assert (serial.predict(X) == parallel.predict(X)).all()
+        assert serial.score(X, issues) > 0.8
+
+    def test_random_state_makes_fits_reproducible(self, data):
+        X, issues = data
+        first = NBSVM(n_jobs=1, random_state=0).fit(X, issues)
+        second = NBSVM(n_jobs=1, random_state=0).fit(X, issues)
+        assert np.array_equal(first.coef_, second.coef_)
+
+    def test_two_classes_fit_one_model(self):
+        X = scipy.sparse.csr_matrix([[1., 0.], [2., 0.], [0., 1.], [0., 3.]])
+        y = np.array(['late', 'late', 'fee', 'fee'])
+        model = NBSVM().fit(X, y)
+        assert model.coef_.shape == (1, 2)
+        assert model.decision_function(X).shape == (4,)
+        assert list(model.predict(X)) == list(y)
+
+    def test_dense_input_fits_as_sparse(self):
+        X = np.array([[1., 0., 2.], [2., 0., 1.], [0., 1., 0.], [0., 3., 1.]])
+        y = np.array(['late', 'late', 'fee', 'fee'])
+        sparse_r, sparse_b = log_count_ratios(scipy.sparse.csr_matrix(X),
+                                              np.array([1, 1, 0, 0]))
+        dense_r, dense_b = log_count_ratios(X, np.array([1, 1, 0, 0]))
+        assert np.allclose(dense_r, sparse_r)
+        assert np.allclose(dense_b, sparse_b)
+        dense = NBSVM().fit(X, y)
+        sparse = NBSVM().fit(scipy.sparse.csr_matrix(X), y)
+        assert np.array_equal(dense.coef_, sparse.coef_)
+        assert list(dense.predict(X)) == list(y)
+
+    def test_one_class_raises(self):
+        with pytest.raises(ValueError):
+            NBSVM().fit(scipy.sparse.csr_matrix(np.eye(2)), ['a', 'a'])
+
+    def test_compact_model_predicts_the_same(self, tmp_path, data):
+        X, issues = data
+        model = make_classifier('nbsvm').fit(X, issues)
+        assert isinstance(model, NBSVM)
+        save_compact_model(model, str(tmp_path))
+        compact = load_compact_model(str(tmp_path))
+        assert (compact.predict(X) == model.predict(X)).all()
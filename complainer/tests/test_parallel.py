@@ -0,0 +1,33 @@
+import pytest
+
+from complainer.parallel import imap_ordered, make_executor
+
+
+def square(x):
+    return x * x
+
+
+class TestImapOrdered:
+    def test_serial_map_without_executor(self):
+        assert list(imap_ordered(square, range(5))) == [0, 1, 4, 9, 16]
+
+    def test_parallel_map_preserves_order(self):
+        with make_executor(2) as executor:
+            results = list(imap_ordered(square, range(20), executor,
+                                        max_pending=3))
+        assert results == [x * x for x in range(20)]
+
+    def test_single_worker_means_serial(self):
+        assert make_executor(1) is None
+
+    def test_input_is_consumed_lazily(self):
+        consumed = []
+
+        def items():
+            for i in range(10):
+                consumed.append(i)
+                yield i
+
+        results = imap_ordered(square, items())
+        next(results)
+        assert consumed == [0]
@@ -1,9 +1,17 @@
+import csv
+import io
+
 import pytest
 
 import pandas as pd
 from pandas.testing import assert_frame_equal, assert_series_equal
 
-from complainer.preprocessing import encode_targets, filter_rename_mortgages
+from complainer import preprocessing
+from complainer.preprocessing import (
+    encode_targets, filter_rename_mortgages, Preprocessor, sanitize_csv_text,
+    iter_record_blocks, parse_block, preprocess_block, preprocess_chunk,
+    read_csv_robust, rows_per_second
+)
 
 
 @pytest.fixture
@@ -37,6 +45,29 @@ class TestEncodeTargets:
         decoded = encode_targets(encoded, 'fruit', reverse_encoding)
         assert_frame_equal(ff, decoded)
 
+    def test_encoding_does_not_mutate_original(self, ff):
+        encode_targets(ff, 'fruit', target_encoding)
+        assert set(ff['fruit']) == set(target_encoding)
+
+    def test_unknown_values_are_reported_with_counts(self, ff):
+        with pytest.raises(KeyError) as excinfo:
+            encode_targets(ff, 'fruit', {'apple': 'a', 'pear': 'p'})
+        assert "'orange': 25" in str(excinfo.value)
+        assert "'banana': 25" in str(excinfo.value)
+
+    def test_missing_values_remain_missing(self, ff):
+        ff.loc[0, 'fruit'] = None
+        encoded = encode_targets(ff, 'fruit', target_encoding)
+        assert encoded['fruit'].isnull().sum() == 1
+
+    def test_categorical_encoding_has_compact_codes(self, ff):
+        encoded = encode_targets(ff, 'fruit', target_encoding,
+                                 categorical=True)
+        assert encoded['fruit'].dtype == 'category'
+        assert encoded['fruit'].cat.codes.dtype == 'int8'
+        assert list(encoded['fruit'].cat.categories) == ['a', 'b', 'o', 'p']
+        assert list(encoded['fruit'][:4]) == ['a', 'o', 'b', 'p']
+
 
 @pytest.fixture
 def mf():
@@ -60,4 +91,116 @@ class TestFilterAndRenameMortgages:
     def test_filtered_df_has_only_mortgage_issues(self, mf):
         mortgages = filter_rename_mortgages(mf)
         assert set(mortgages.issue) == {'a_mortgage_issue',
-                                        'another_mortgage_issue'}
\ No newline at end of file
+                                        'another_mortgage_issue'}
+
+
+mortgage_encoding = {'a_mortgage_issue': 'a',
+                     'another_mortgage_issue': 'b'}
+
+
+class TestPreprocessor:
+    def test_same_result_as_filter_rename_then_encode(self, mf):
+        expected = encode_targets(filter_rename_mortgages(mf), 'issue',
+                                  mortgage_encoding)
+        processed = Preprocessor(target_encoding_dict=mortgage_encoding)(mf)
+        assert_frame_equal(processed, expected, check_dtype=False)
+
+    def test_categorical_product_column(self, mf):
+        mf['Product'] = mf['Product'].astype('category')
+        processed = Preprocessor(target_encoding_dict=mortgage_encoding)(mf)
+        assert list(processed.issue) == ['a', 'b']
+
+    def test_chunks_are_processed_independently(self, mf):
+        preprocessor = Preprocessor(target_encoding_dict=mortgage_encoding)
+        chunks = [mf.iloc[:2], mf.iloc[2:]]
+        processed = list(preprocessor.transform_chunks(chunks))
+        assert [list(p.complaint) for p in processed] == [['Blah'],
+                                                           ['Harumph']]
+
+    def test_steps_are_applied_in_order(self, mf):
+        preprocessor = Preprocessor(
+            target_encoding_dict=mortgage_encoding,
+            steps=[lambda df: df.iloc[:1],
+                   lambda df: df.assign(complaint=df.complaint.str.upper())]
+        )
+        assert list(preprocessor(mf).complaint) == ['BLAH']
+
+    def test_unknown_issues_throw(self, mf):
+        with pytest.raises(KeyError):
+            Preprocessor(target_encoding_dict={'a_mortgage_issue': 'a'})(mf)
+
+
+@pytest.fixture
+def messy_csv(tmp_path):
+    """Quoted csv with line breaks, quotes and a NUL inside narratives."""
+    df = pd.DataFrame(
+      {'Product': ['Mortgage'] * 5,
+       'Consumer complaint narrative': ['Blah', 'Two\nlines', 'He said "no"',
+                                        'Nul\x00here', 'Yadda'],
+       'Issue': ['a', 'b', 'c', 'd', 'e']}
+    )
+    path = tmp_path / 'messy.csv'
+    df.to_csv(path, index=False, quoting=csv.QUOTE_ALL)
+    return str(path)
+
+
+class TestReadCsvRobust:
+    def test_sanitize_removes_nul(self):
+        assert sanitize_csv_text('a\x00b') == 'ab'
+
+    def test_blocks_never_split_a_quoted_record(self, messy_csv):
+        with open(messy_csv, newline='') as f:
+            header, blocks = iter_record_blocks(f, chunksize=1)
+            blocks = list(blocks)
+        assert len(blocks) == 5
+        assert blocks[1].startswith('"Mortgage","Two')
+
+    def test_chunks_concatenate_to_whole_file(self, messy_csv):
+        df = pd.concat(read_csv_robust(messy_csv, chunksize=2),
+                       ignore_index=True)
+        assert list(df.Issue) == ['a', 'b', 'c', 'd', 'e']
+        assert df['Consumer complaint narrative'][1] == 'Two\nlines'
+        assert df['Consumer complaint narrative'][2] == 'He said "no"'
+        assert df['Consumer complaint narrative'][3] == 'Nulhere'
+
+    def test_stats_count_rows_and_chunks(self, messy_csv):
+        stats = {}
+        list(read_csv_robust(messy_csv, chunksize=2, stats=stats))
+        assert stats['rows'] == 5
+        assert stats['chunks'] == 3
+        assert stats['fallback_chunks'] == 0
+        assert rows_per_second(stats) > 0
+
+    def test_parse_block_falls_back_to_python_engine(self, monkeypatch):
+        read_csv = pd.read_csv
+
+        def c_engine_fails(*args, **kwargs):
+            if kwargs.get('engine') == 'c':
+                raise pd.errors.ParserError('C error')
+            return read_csv(*args, **kwargs)
+
+        monkeypatch.setattr(preprocessing.pd, 'read_csv', c_engine_fails)
+        df, engine = parse_block('a,b\n', '1,2\n')
+        assert engine == 'python'
+        assert list(df.a) == [1]
+
+
+class TestPreprocessWorkerTasks:
+    def test_preprocess_block_parses_then_preprocesses(self, mf):
+        text = mf.to_csv(index=False, quoting=csv.QUOTE_ALL)
+        header, block = text.split('\n', 1)
+        preprocessor = Preprocessor(target_encoding_dict=mortgage_encoding)
+        processed, rows, engine, timings = preprocess_block(block,
+                                                            header + '\n',
+                                                            preprocessor)
+        assert list(processed.issue) == ['a', 'b']
+        assert rows == 3
+        assert engine == 'c'
+        assert list(timings) == ['parse', 'preprocess']
+
+    def test_preprocess_chunk_times_preprocessing(self, mf):
+        preprocessor = Preprocessor(target_encoding_dict=mortgage_encoding)
+        processed, rows, timings = preprocess_chunk(mf, preprocessor)
+        assert list(processed.issue) == ['a', 'b']
+        assert rows == 3
+        assert list(timings) == ['preprocess']
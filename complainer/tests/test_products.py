@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+from complainer.preprocessing import target_encoding_dict
+from complainer.products import (
+    encoding_of, product_preprocessor, product_slug, products
+)
+
+
+@pytest.fixture
+def raw():
+    return pd.DataFrame({
+        'Product': ['Mortgage', 'Student loan', 'Mortgage', 'Debt collection',
+                    'Credit card'],
+        'Issue': ['Loan servicing, payments, escrow account',
+                  'Dealing with your lender or servicer',
+                  'Loan modification,collection,foreclosure',
+                  'Attempts to collect debt not owed',
+                  'Billing disputes'],
+        'Consumer complaint narrative': ['escrow', 'servicer', 'foreclosure',
+                                         'not my debt', 'billing']
+    })
+
+
+class TestProducts:
+    def test_mortgage_uses_the_mortgage_encoding(self):
+        assert encoding_of('Mortgage') is target_encoding_dict
+
+    def test_unknown_product_throws(self):
+        with pytest.raises(ValueError):
+            encoding_of('Payday loan')
+
+    def test_slugs_are_distinct_and_path_safe(self):
+        slugs = [product_slug(product) for product in products]
+        assert len(set(slugs)) == len(slugs)
+        assert product_slug('Credit reporting, repair') == \
+            'credit_reporting_repair'
+
+
+class TestProductPreprocessor:
+    def test_preprocessor_keeps_only_its_product(self, raw):
+        processed = {product: product_preprocessor(product)(raw)
+                     for product in products}
+        assert processed['Mortgage'].to_dict('list') == {
+            'complaint': ['escrow', 'foreclosure'],
+            'issue': ['loan_servicing', 'loan_modification']
+        }
+        assert processed['Student loan'].to_dict('list') == {
+            'complaint': ['servicer'], 'issue': ['servicing']
+        }
+        assert processed['Debt collection'].to_dict('list') == {
+            'complaint': ['not my debt'], 'issue': ['debt_not_owed']
+        }
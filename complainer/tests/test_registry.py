@@ -0,0 +1,134 @@
+import os
+
+import pytest
+
+import pandas as pd
+
+from complainer.artifacts import load_text_policy
+from complainer.registry import ModelRegistry, train_product, train_products
+from complainer.storage import TableWriter, table_path
+from complainer.text import TextPolicy
+
+
+data = {
+    'Mortgage': pd.DataFrame({
+        'complaint': ['escrow payment was late', 'my escrow account is short',
+                      'foreclosure after modification',
+                      'they started foreclosure'],
+        'issue': ['servicing', 'servicing', 'modification', 'modification']
+    }),
+    'Student loan': pd.DataFrame({
+        'complaint': ['my servicer lost my payment', 'servicer never answers',
+                      'cannot afford to repay', 'repay plan too expensive'],
+        'issue': ['servicing', 'servicing', 'repay', 'repay']
+    })
+}
+
+
+@pytest.fixture
+def train_paths(tmp_path):
+    paths = {}
+    for product, df in data.items():
+        paths[product] = table_path(str(tmp_path), product[:4])
+        with TableWriter(paths[product]) as writer:
+            writer.write(df)
+    return paths
+
+
+class TestModelRegistry:
+    def test_register_and_load(self, tmp_path, train_paths):
+        registry_directory = str(tmp_path / 'registry')
+        summary = train_product('Mortgage', train_paths['Mortgage'],
+                                registry_directory, classifier='nb')
+        assert summary['rows'] == 4
+        registry = ModelRegistry(registry_directory)
+        assert registry.products() == ['Mortgage']
+        assert registry.metadata('Mortgage')['classes'] == ['modification',
+                                                            'servicing']
+        for compact in [True, False]:
+            vectorizer, model = registry.load('Mortgage', compact=compact)
+            assert list(model.predict(vectorizer.transform(
+                ['late escrow payment']))) == ['servicing']
+
+    def test_unregistered_product_throws(self, tmp_path):
+        with pytest.raises(KeyError):
+            ModelRegistry(str(tmp_path)).metadata('Mortgage')
+
+    def test_register_replaces_previous_model(self, tmp_path, train_paths):
+        registry_directory = str(tmp_path / 'registry')
+        train_product('Mortgage', train_paths['Mortgage'], registry_directory,
+                      classifier='nb')
+        train_product('Mortgage', train_paths['Student loan'],
+                      registry_directory, classifier='nb')
+        registry = ModelRegistry(registry_directory)
+        assert registry.products() == ['Mortgage']
+        assert registry.metadata('Mortgage')['classes'] == ['repay',
+                                                            'servicing']
+
+    def test_replaced_version_stays_readable(self, tmp_path, train_paths):
+        registry_directory = str(tmp_path / 'registry')
+        registry = ModelRegistry(registry_directory)
+        train_product('Mortgage', train_paths['Mortgage'], registry_directory,
+                      classifier='nb')
+        first = registry.path('Mortgage')
+        train_product('Mortgage', train_paths['Student loan'],
+                      registry_directory, classifier='nb')
+        second = registry.path('Mortgage')
+        assert second != first
+        # A reader that resolved the old version can still load it.
+        assert os.path.exists(os.path.join(first, 'model.pkl'))
+        train_product('Mortgage', train_paths['Mortgage'], registry_directory,
+                      classifier='nb')
+        assert not os.path.exists(first)
+        assert os.path.exists(second)
+        assert sorted(os.listdir(os.path.dirname(first))) == sorted([
+            'CURRENT', os.path.basename(second),
+            os.path.basename(registry.path('Mortgage'))
+        ])
+
+    def test_text_policy_of_the_training_data_is_registered(self,
+                                                            tmp_path,
+                                                            train_paths):
+        registry_directory = str(tmp_path / 'registry')
+        train_product('Mortgage', train_paths['Mortgage'], registry_directory,
+                      classifier='nb')
+        registry = ModelRegistry(registry_directory)
+        assert not registry.text_policy('Mortgage').normalize
+        TextPolicy(normalize=True).save(str(tmp_path))
+        train_product('Mortgage', train_paths['Mortgage'], registry_directory,
+                      classifier='nb')
+        assert registry.metadata('Mortgage')['text']['normalize']
+        assert registry.text_policy('Mortgage').normalize
+        assert load_text_policy(compact_path=os.path.join(
+            registry.path('Mortgage'), 'compact')).normalize
+
+
+class TestTrainProducts:
+    def test_train_products_registers_every_product(self, tmp_path,
+                                                    train_paths):
+        from complainer.parallel import make_executor
+        registry_directory = str(tmp_path / 'registry')
+        executor = make_executor(2)
+        try:
+            summaries = train_products(train_paths, registry_directory,
+                                       executor=executor, classifier='nb')
+        finally:
+            executor.shutdown()
+        assert [summary['product'] for summary in summaries] == list(data)
+        assert ModelRegistry(registry_directory).products() == sorted(data)
+
+    def test_classifiers_on_workers_fit_on_one_thread(self, tmp_path,
+                                                       train_paths):
+        from complainer.parallel import make_executor
+        registry_directory = str(tmp_path / 'registry')
+        executor = make_executor(2)
+        try:
+            train_products(train_paths, registry_directory,
+                           executor=executor, classifier='nbsvm')
+        finally:
+            executor.shutdown()
+        registry = ModelRegistry(registry_directory)
+        for product in data:
+            assert registry.load(product, compact=False)[1].n_jobs == 1
+        train_products(train_paths, registry_directory, classifier='nbsvm')
+        assert registry.load('Mortgage', compact=False)[1].n_jobs is None
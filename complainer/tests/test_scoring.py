@@ -0,0 +1,190 @@
+import os
+
+import pytest
+
+import joblib
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import MultinomialNB
+
+from complainer.instrumentation import Stages
+from complainer.scoring import (
+    MANIFEST_FILE, Scorer, make_pool, part_path, score_to_parts,
+    scoring_manifest
+)
+from complainer.storage import read_table
+from complainer.text import TextPolicy
+
+
+train = ['escrow payment was late', 'my escrow account is short',
+         'foreclosure after modification', 'they started foreclosure',
+         'closing costs were higher', 'fees at closing were wrong']
+issues = ['servicing', 'servicing', 'modification', 'modification',
+          'closing', 'closing']
+
+
+@pytest.fixture
+def scorer():
+    vectorizer = TfidfVectorizer().fit(train)
+    model = SGDClassifier(random_state=0).fit(vectorizer.transform(train),
+                                              issues)
+    return Scorer(vectorizer, model, id_column='id')
+
+
+@pytest.fixture
+def backlog():
+    return pd.DataFrame({'id': range(10),
+                         'complaint': (train * 2)[:9] + [None]})
+
+
+def chunked(df, chunksize):
+    return (df.iloc[i:i + chunksize] for i in range(0, len(df), chunksize))
+
+
+class TestScorer:
+    def test_output_has_id_issue_and_scores(self, scorer, backlog):
+        scored = scorer(backlog)
+        assert list(scored.columns) == ['id', 'issue', 'score_closing',
+                                        'score_modification',
+                                        'score_servicing']
+        assert list(scored.issue[:6]) == issues
+
+    def test_probabilistic_models_are_scored(self, backlog):
+        vectorizer = TfidfVectorizer().fit(train)
+        model = MultinomialNB().fit(vectorizer.transform(train), issues)
+        scored = Scorer(vectorizer, model)(backlog)
+        assert scored.filter(like='score_').sum(axis=1).round(5).eq(1).all()
+
+    def test_binary_models_get_a_score_per_class(self, backlog):
+        vectorizer = TfidfVectorizer().fit(train)
+        model = SGDClassifier(random_state=0).fit(
+            vectorizer.transform(train), ['a', 'a', 'b', 'b', 'b', 'b'])
+        scored = Scorer(vectorizer, model)(backlog)
+        assert {'score_a', 'score_b'} <= set(scored.columns)
+
+    def test_text_policy_prepares_texts_before_scoring(self, backlog):
+        texts = [text + ' XXXX' for text in train]
+        vectorizer = TfidfVectorizer().fit(texts)
+        model = SGDClassifier(random_state=0).fit(
+            vectorizer.transform(texts), issues)
+        policy = TextPolicy(normalize=True)
+        redacted = backlog.assign(complaint=backlog.complaint.fillna('')
+                                  + ' XX/XX/2019 XXXX XXXX')
+        scored = Scorer(vectorizer, model, text_policy=policy)(redacted)
+        expected = Scorer(vectorizer, model)(
+            redacted.assign(complaint=policy.apply(redacted.complaint)))
+        assert scored.equals(expected)
+        assert not Scorer(vectorizer, model)(redacted).equals(expected)
+
+    def test_text_policy_truncates_before_scoring(self, scorer, backlog):
+        policy = TextPolicy(max_chars=12)
+        truncated = Scorer(scorer.vectorizer, scorer.model,
+                           id_column='id', text_policy=policy)
+        expected = scorer(backlog.assign(
+            complaint=policy.apply(backlog.complaint.fillna(''))))
+        assert truncated(backlog).equals(expected)
+        assert not scorer(backlog).equals(expected)
+
+
+class TestScoreToParts:
+    def test_one_part_per_chunk(self, tmp_path, scorer, backlog):
+        summary = score_to_parts(chunked(backlog, 4), scorer, str(tmp_path))
+        assert summary == {'scored': 3, 'skipped': 0, 'rows': 10}
+        parts = [read_table(part_path(str(tmp_path), i)) for i in range(3)]
+        assert list(pd.concat(parts).id) == list(range(10))
+
+    def test_existing_parts_are_skipped(self, tmp_path, scorer, backlog):
+        score_to_parts(chunked(backlog, 4), scorer, str(tmp_path))
+        os.remove(part_path(str(tmp_path), 1))
+        summary = score_to_parts(chunked(backlog, 4), scorer, str(tmp_path))
+        assert summary == {'scored': 1, 'skipped': 2, 'rows': 4}
+        assert list(read_table(part_path(str(tmp_path), 1)).id) == [4, 5, 6, 7]
+
+    def test_no_temporary_files_are_left(self, tmp_path, scorer, backlog):
+        score_to_parts(chunked(backlog, 4), scorer, str(tmp_path))
+        assert sorted(os.listdir(str(tmp_path))) == [
+            'part-00000.csv', 'part-00001.csv', 'part-00002.csv'
+        ]
+
+    def test_resume_needs_the_same_manifest(self, tmp_path, scorer,
+                                            backlog):
+        directory = str(tmp_path / 'parts')
+        score_to_parts(chunked(backlog, 4), scorer, directory,
+                       manifest={'input': 'a', 'chunksize': 4})
+        assert os.path.exists(os.path.join(directory, MANIFEST_FILE))
+        os.remove(part_path(directory, 1))
+        with pytest.raises(ValueError, match='chunksize'):
+            score_to_parts(chunked(backlog, 5), scorer, directory,
+                           manifest={'input': 'a', 'chunksize': 5})
+        assert not os.path.exists(part_path(directory, 1))
+        summary = score_to_parts(chunked(backlog, 4), scorer, directory,
+                                 manifest={'input': 'a', 'chunksize': 4})
+        assert summary == {'scored': 1, 'skipped': 2, 'rows': 4}
+
+    def test_parts_without_manifest_are_not_resumed(self, tmp_path, scorer,
+                                                    backlog):
+        score_to_parts(chunked(backlog, 4), scorer, str(tmp_path))
+        with pytest.raises(ValueError):
+            score_to_parts(chunked(backlog, 4), scorer, str(tmp_path),
+                           manifest={'chunksize': 4})
+
+    def test_manifest_identifies_input_and_model(self, tmp_path, scorer,
+                                                 backlog):
+        data = str(tmp_path / 'backlog.csv')
+        backlog.to_csv(data, index=False)
+        joblib.dump(scorer.vectorizer, str(tmp_path / 'vectorizer.pkl'))
+        joblib.dump(scorer.model, str(tmp_path / 'model.pkl'))
+        manifest = scoring_manifest(data, 4, str(tmp_path / 'vectorizer.pkl'),
+                                    str(tmp_path / 'model.pkl'),
+                                    id_column='id')
+        assert manifest['chunksize'] == 4
+        assert manifest['id_column'] == 'id'
+        backlog.iloc[:5].to_csv(data, index=False)
+        changed = scoring_manifest(data, 4, str(tmp_path / 'vectorizer.pkl'),
+                                   str(tmp_path / 'model.pkl'),
+                                   id_column='id')
+        assert changed['input'] != manifest['input']
+        assert changed['model'] == manifest['model']
+        assert manifest['model']['text'] == {'normalize': False,
+                                             'max_chars': None,
+                                             'keep': 'head'}
+        TextPolicy(normalize=True).save(str(tmp_path))
+        renormalized = scoring_manifest(data, 4,
+                                        str(tmp_path / 'vectorizer.pkl'),
+                                        str(tmp_path / 'model.pkl'),
+                                        id_column='id')
+        assert renormalized['model'] != changed['model']
+
+    def test_stages_are_measured(self, tmp_path, scorer, backlog):
+        stages = Stages()
+        score_to_parts(chunked(backlog, 4), scorer.score, str(tmp_path),
+                       stages=stages)
+        assert list(stages.stages) == ['read', 'featurize', 'predict',
+                                       'write']
+        assert all(stage.rows == 10 and stage.extra['entries'] == 3
+                   for stage in stages.stages.values())
+
+    def test_process_pool_scores_as_serial(self, tmp_path, scorer, backlog):
+        joblib.dump(scorer.vectorizer, str(tmp_path / 'vectorizer.pkl'))
+        joblib.dump(scorer.model, str(tmp_path / 'model.pkl'))
+        executor, pooled = make_pool(str(tmp_path / 'vectorizer.pkl'),
+                                     str(tmp_path / 'model.pkl'),
+                                     n_workers=2, id_column='id')
+        with executor:
+            score_to_parts(chunked(backlog, 4), pooled,
+                           str(tmp_path / 'parts'), executor=executor)
+        parts = [read_table(part_path(str(tmp_path / 'parts'), i))
+                 for i in range(3)]
+        assert list(pd.concat(parts).issue) == list(scorer(backlog).issue)
+
+    def test_pool_prepares_texts_with_the_model_text_policy(self, tmp_path,
+                                                            scorer):
+        joblib.dump(scorer.vectorizer, str(tmp_path / 'vectorizer.pkl'))
+        joblib.dump(scorer.model, str(tmp_path / 'model.pkl'))
+        TextPolicy(normalize=True).save(str(tmp_path))
+        executor, pooled = make_pool(str(tmp_path / 'vectorizer.pkl'),
+                                     str(tmp_path / 'model.pkl'),
+                                     n_workers=1)
+        assert executor is None
+        assert pooled.__self__.text_policy.normalize
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from complainer.service import (
+    LatencyTracker, MicroBatcher, Predictor, ProductPredictor, ScoringService
+)
+from complainer.text import TextPolicy
+
+
+class UpperCasePredictor:
+    """Stands in for a model, recording the batches it sees."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        return [text.upper() for text in texts]
+
+
+def run(coroutine):
+    return asyncio.new_event_loop().run_until_complete(coroutine)
+
+
+class TestLatencyTracker:
+    def test_latency_percentiles(self):
+        tracker = LatencyTracker()
+        for ms in range(1, 101):
+            tracker.record(ms / 1000)
+        summary = tracker.summary()
+        assert summary['count'] == 100
+        assert summary['p50_ms'] == pytest.approx(50.5)
+        assert summary['p99_ms'] == pytest.approx(99.01)
+
+
+class TestMicroBatcher:
+    def test_concurrent_predictions_are_batched(self):
+        predictor = UpperCasePredictor()
+
+        async def scenario():
+            batcher = MicroBatcher(predictor, max_batch_size=4, max_wait=0.05)
+            batcher.start()
+            results = await asyncio.gather(
+                *[batcher.predict(text) for text in 'abcdefghij']
+            )
+            await batcher.stop()
+            return results
+
+        assert run(scenario()) == list('ABCDEFGHIJ')
+        assert [len(batch) for batch in predictor.batches] == [4, 4, 2]
+
+    def test_batches_are_predicted_concurrently(self):
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def slow(texts):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+            return texts
+
+        async def scenario():
+            batcher = MicroBatcher(slow, max_batch_size=1, max_wait=0,
+                                   executor=ThreadPoolExecutor(8),
+                                   max_concurrency=4)
+            batcher.start()
+            results = await asyncio.gather(
+                *[batcher.predict(text) for text in 'abcdefgh']
+            )
+            await batcher.stop()
+            return results
+
+        assert run(scenario()) == list('abcdefgh')
+        assert max(peak) == 4
+
+    def test_errors_are_returned_to_every_caller(self):
+        def broken(texts):
+            raise RuntimeError('model exploded')
+
+        async def scenario():
+            batcher = MicroBatcher(broken, max_wait=0.01)
+            batcher.start()
+            results = await asyncio.gather(batcher.predict('a'),
+                                           batcher.predict('b'),
+                                           return_exceptions=True)
+            await batcher.stop()
+            return results
+
+        assert all(isinstance(r, RuntimeError) for r in run(scenario()))
+
+
+class TestPredictor:
+    def test_predictor_applies_vectorizer_then_model(self):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.naive_bayes import MultinomialNB
+
+        texts = ['escrow payment late', 'foreclosure notice']
+        vectorizer = TfidfVectorizer().fit(texts)
+        model = MultinomialNB().fit(vectorizer.transform(texts),
+                                    ['loan_servicing', 'loan_modification'])
+        predictor = Predictor(vectorizer, model)
+        assert predictor(['late escrow']) == ['loan_servicing']
+
+    def test_predictor_prepares_texts_with_its_text_policy(self):
+        class Echo:
+            def transform(self, texts):
+                return list(texts)
+
+            def predict(self, texts):
+                return texts
+
+        predictor = Predictor(Echo(), Echo(), TextPolicy(normalize=True))
+        assert predictor(['late  XX/XX/2019 XXXX fee']) == ['late XXXX fee']
+        truncating = Predictor(Echo(), Echo(),
+                               TextPolicy(normalize=True, max_chars=10))
+        assert truncating(['late  XX/XX/2019 XXXX fee']) == ['late XXXX']
+
+    def test_product_predictor_dispatches_by_product(self):
+        a, b = UpperCasePredictor(), UpperCasePredictor()
+        predictor = ProductPredictor({'a': a, 'b': b})
+        predictions = predictor([('a', 'x'), ('b', 'y'), ('a', 'z')])
+        assert predictions == ['X', 'Y', 'Z']
+        assert a.batches == [['x', 'z']]
+        assert b.batches == [['y']]
+
+
+async def request(port, method, path, payload=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write(
+        '{} {} HTTP/1.1\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'
+        .format(method, path, len(body)).encode() + body
+    )
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return head.split(b' ')[1].decode(), json.loads(body.decode())
+
+
+class TestScoringService:
+    def test_http_predict_and_stats(self):
+        async def scenario():
+            service = ScoringService(MicroBatcher(UpperCasePredictor()))
+            server = await service.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            predictions = await asyncio.gather(
+                *[request(port, 'POST', '/predict', {'complaint': text})
+                  for text in ['late', 'fee']]
+            )
+            bad = await request(port, 'POST', '/predict', {'text': 'x'})
+            not_text = await asyncio.gather(
+                *[request(port, 'POST', '/predict', {'complaint': complaint})
+                  for complaint in [123, 'late', None]]
+            )
+            stats = await request(port, 'GET', '/stats')
+            server.close()
+            await server.wait_closed()
+            await service.batcher.stop()
+            return predictions, bad, not_text, stats
+
+        predictions, bad, not_text, stats = run(scenario())
+        assert sorted(p[1]['issue'] for p in predictions) == ['FEE', 'LATE']
+        assert bad[0] == '400'
+        assert [status for status, _ in not_text] == ['400', '200', '400']
+        assert not_text[1][1] == {'issue': 'LATE'}
+        assert stats[1]['latency']['count'] == 3
+        assert stats[1]['latency']['p99_ms'] is not None
+
+    def test_http_predict_by_product(self):
+        async def scenario():
+            predictor = ProductPredictor({'Mortgage': UpperCasePredictor()})
+            service = ScoringService(MicroBatcher(predictor),
+                                     products=['Mortgage'])
+            server = await service.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            responses = [
+                await request(port, 'POST', '/predict',
+                              {'product': 'Mortgage', 'complaint': 'late'}),
+                await request(port, 'POST', '/predict', {'complaint': 'late'}),
+                await request(port, 'POST', '/predict',
+                              {'product': 'Payday loan', 'complaint': 'late'}),
+                await request(port, 'POST', '/predict',
+                              {'product': ['Mortgage'], 'complaint': 'late'})
+            ]
+            server.close()
+            await server.wait_closed()
+            await service.batcher.stop()
+            return responses
+
+        ok, missing, unknown, not_text = run(scenario())
+        assert ok == ('200', {'issue': 'LATE'})
+        assert missing[0] == '400'
+        assert unknown[0] == '404'
+        assert not_text[0] == '400'
+
+    def test_failed_predictions_count_in_latency(self):
+        def broken(texts):
+            raise RuntimeError('model exploded')
+
+        async def scenario():
+            service = ScoringService(MicroBatcher(broken, max_wait=0))
+            service.batcher.start()
+            with pytest.raises(RuntimeError):
+                await service.handle('POST', '/predict',
+                                     b'{"complaint": "late"}')
+            await service.batcher.stop()
+            return service.latency.summary()
+
+        summary = run(scenario())
+        assert summary['count'] == 1
+        assert summary['p99_ms'] is not None
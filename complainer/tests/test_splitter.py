@@ -3,7 +3,9 @@ import pytest
 import pandas as pd
 from pandas.testing import assert_frame_equal, assert_series_equal
 
-from complainer.splitter import train_dev_test_split
+from complainer.splitter import (
+    train_dev_test_split, hash_fractions, stream_train_dev_test_split
+)
 
 
 @pytest.fixture
@@ -40,4 +42,107 @@ class TestTrainDevTestSplit:
         
     def test_combined_fractions_greater_than_one_throw(self, df):
         with pytest.raises(ValueError):
-            train_dev_test_split(df, dev_fraction=0.5, test_fraction = 0.51)
\ No newline at end of file
+            train_dev_test_split(df, dev_fraction=0.5, test_fraction = 0.51)
+
+    def test_groups_stay_in_one_split(self, df):
+        groups = df.X // 4
+        splits = train_dev_test_split(df, groups=groups, random_state=0)
+        assert sum(len(split) for split in splits) == len(df)
+        for a in range(3):
+            for b in range(a + 1, 3):
+                assert not set(groups[splits[a].index]) & set(
+                    groups[splits[b].index])
+        assert [len(split) for split in splits] == [60, 20, 20]
+
+@pytest.fixture
+def complaints():
+    return pd.DataFrame({'id': range(1000),
+                         'label': ['a', 'b', 'b', 'c'] * 250})
+
+
+def chunked(df, chunksize):
+    return (df.iloc[i:i + chunksize] for i in range(0, len(df), chunksize))
+
+
+def collect(splits):
+    trains, devs, tests = zip(*splits)
+    return pd.concat(trains), pd.concat(devs), pd.concat(tests)
+
+
+class TestHashFractions:
+    def test_fractions_are_in_unit_interval(self, complaints):
+        fractions = hash_fractions(complaints.id)
+        assert ((fractions >= 0) & (fractions < 1)).all()
+
+    def test_same_key_same_fraction(self, complaints):
+        a = hash_fractions(complaints.id, random_state=42)
+        b = hash_fractions(complaints.id, random_state=42)
+        assert (a == b).all()
+
+    def test_random_state_changes_fractions(self, complaints):
+        a = hash_fractions(complaints.id, random_state=1)
+        b = hash_fractions(complaints.id, random_state=2)
+        assert (a != b).any()
+
+
+class TestStreamTrainDevTestSplit:
+    def test_splits_partition_the_stream(self, complaints):
+        train, dev, test = collect(
+            stream_train_dev_test_split(chunked(complaints, 64), 'id')
+        )
+        ids = pd.concat([train, dev, test]).id
+        assert sorted(ids) == list(complaints.id)
+
+    def test_splits_have_roughly_expected_lengths(self, complaints):
+        train, dev, test = collect(
+            stream_train_dev_test_split(chunked(complaints, 64), 'id',
+                                        dev_fraction=0.2, test_fraction=0.1)
+        )
+        assert abs(len(dev) - 200) < 50
+        assert abs(len(test) - 100) < 50
+
+    def test_assignment_does_not_depend_on_chunking(self, complaints):
+        small = collect(stream_train_dev_test_split(
+            chunked(complaints, 7), 'id', random_state=42))
+        large = collect(stream_train_dev_test_split(
+            chunked(complaints, 500), 'id', random_state=42))
+        for a, b in zip(small, large):
+            assert_frame_equal(a, b)
+
+    def test_stratified_splits_have_exact_class_proportions(self, complaints):
+        train, dev, test = collect(
+            stream_train_dev_test_split(chunked(complaints, 64), 'id',
+                                        dev_fraction=0.2, test_fraction=0.1,
+                                        stratify_column='label')
+        )
+        assert dict(dev.label.value_counts()) == {'b': 100, 'a': 50, 'c': 50}
+        assert dict(test.label.value_counts()) == {'b': 50, 'a': 25, 'c': 25}
+
+    def test_stratified_splits_are_reproducible(self, complaints):
+        a = collect(stream_train_dev_test_split(
+            chunked(complaints, 64), 'id', stratify_column='label',
+            random_state=42))
+        b = collect(stream_train_dev_test_split(
+            chunked(complaints, 64), 'id', stratify_column='label',
+            random_state=42))
+        for x, y in zip(a, b):
+            assert_frame_equal(x, y)
+
+    def test_combined_fractions_greater_than_one_throw(self, complaints):
+        with pytest.raises(ValueError):
+            list(stream_train_dev_test_split(
+                [complaints], 'id', dev_fraction=0.5, test_fraction=0.51))
+
+    def test_groups_stay_in_one_split(self, complaints):
+        complaints = complaints.assign(group=complaints.id // 10)
+        splits = collect(stream_train_dev_test_split(
+            chunked(complaints, 64), 'id', group_column='group'))
+        groups = [set(split.group) for split in splits]
+        assert not (groups[0] & groups[1] or groups[0] & groups[2]
+                    or groups[1] & groups[2])
+
+    def test_groups_with_stratify_throw(self, complaints):
+        with pytest.raises(ValueError):
+            list(stream_train_dev_test_split(
+                [complaints], 'id', stratify_column='label',
+                group_column='label'))
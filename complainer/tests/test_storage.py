@@ -0,0 +1,104 @@
+import pytest
+
+import pandas as pd
+
+from complainer.storage import (
+    table_path, part_path, list_parts, format_of, iter_table, read_table,
+    TableWriter
+)
+
+
+@pytest.fixture
+def chunks():
+    """Two chunks of processed data, the second with an unseen issue."""
+    return [
+        pd.DataFrame({'complaint': ['Blah', 'Yadda "quoted"'],
+                      'issue': ['closing', 'other']}),
+        pd.DataFrame({'complaint': ['Two\nlines', 'Harumph'],
+                      'issue': ['applying', 'closing']})
+    ]
+
+
+def write(path, chunks, **kwargs):
+    with TableWriter(path, **kwargs) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+
+class TestPaths:
+    def test_table_path_adds_extension(self):
+        assert table_path('data', 'train', 'parquet') == 'data/train.parquet'
+
+    def test_format_of_inverts_table_path(self):
+        for fmt in ['csv', 'parquet', 'feather']:
+            assert format_of(table_path('data', 'dev', fmt)) == fmt
+
+    def test_unknown_format_throws(self):
+        with pytest.raises(ValueError):
+            table_path('data', 'train', 'xlsx')
+
+    def test_list_parts_ignores_temporary_files(self, tmp_path, chunks):
+        write(part_path(str(tmp_path), 1), chunks)
+        write(part_path(str(tmp_path), 0), chunks)
+        write(str(tmp_path / '.tmp-part-00002.csv'), chunks)
+        assert list_parts(str(tmp_path)) == [part_path(str(tmp_path), 0),
+                                             part_path(str(tmp_path), 1)]
+
+    def test_format_of_directory_without_parts_throws(self, tmp_path):
+        with pytest.raises(ValueError):
+            format_of(str(tmp_path))
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet', 'feather'])
+class TestRoundTrip:
+    @pytest.fixture(autouse=True)
+    def needs_pyarrow(self, fmt):
+        if fmt != 'csv':
+            pytest.importorskip('pyarrow')
+
+    def test_chunks_round_trip(self, tmp_path, chunks, fmt):
+        path = table_path(str(tmp_path), 'train', fmt)
+        write(path, chunks)
+        df = read_table(path)
+        expected = pd.concat(chunks, ignore_index=True)
+        assert list(df.complaint) == list(expected.complaint)
+        assert list(df.issue) == list(expected.issue)
+
+    def test_read_selected_columns(self, tmp_path, chunks, fmt):
+        path = table_path(str(tmp_path), 'train', fmt)
+        write(path, chunks)
+        assert list(read_table(path, columns=['issue']).columns) == ['issue']
+
+    def test_iter_table_chunks(self, tmp_path, chunks, fmt):
+        path = table_path(str(tmp_path), 'train', fmt)
+        write(path, chunks)
+        read_chunks = list(iter_table(path, chunksize=3))
+        assert [len(chunk) for chunk in read_chunks] == [3, 1]
+
+    def test_directory_of_parts_reads_in_order(self, tmp_path, chunks, fmt):
+        for part, chunk in reversed(list(enumerate(chunks))):
+            write(part_path(str(tmp_path), part, fmt), [chunk],
+                  categorical=['issue'])
+        df = read_table(str(tmp_path))
+        expected = pd.concat(chunks, ignore_index=True)
+        assert list(df.complaint) == list(expected.complaint)
+        assert list(df.issue) == list(expected.issue)
+        read_chunks = list(iter_table(str(tmp_path), chunksize=3))
+        assert [len(chunk) for chunk in read_chunks] == [2, 2]
+        assert format_of(str(tmp_path)) == fmt
+
+    def test_empty_table_is_written(self, tmp_path, fmt):
+        path = table_path(str(tmp_path), 'train', fmt)
+        write(path, [], columns=['complaint', 'issue'])
+        assert len(read_table(path)) == 0
+
+
+class TestColumnarFormats:
+    @pytest.mark.parametrize('fmt', ['parquet', 'feather'])
+    def test_columnar_issue_is_categorical(self, tmp_path, chunks, fmt):
+        pytest.importorskip('pyarrow')
+        path = table_path(str(tmp_path), 'train', fmt)
+        write(path, chunks, categorical=['issue'])
+        df = read_table(path, memory_map=True)
+        assert df.issue.dtype == 'category'
+        assert list(df.issue) == ['closing', 'other', 'applying', 'closing']
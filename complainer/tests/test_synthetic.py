@@ -0,0 +1,44 @@
+import pandas as pd
+
+from complainer.ingestion import read_complaints_chunked
+from complainer.preprocessing import filter_rename_mortgages
+from complainer.synthetic import (
+    ComplaintGenerator, raw_columns, synthetic_complaints,
+    write_synthetic_complaints
+)
+
+
+class TestSyntheticComplaints:
+    def test_synthetic_complaints_are_shaped_like_raw_data(self):
+        df = synthetic_complaints(2000, random_state=0)
+        assert list(df.columns) == raw_columns
+        assert len(df) == 2000
+        assert df['Complaint ID'].is_unique
+        narratives = df['Consumer complaint narrative'].dropna()
+        assert 0.25 < len(narratives) / len(df) < 0.45
+        assert narratives.str.contains('XXXX').any()
+        mortgages = filter_rename_mortgages(df.dropna())
+        assert mortgages.issue.nunique() > 5
+
+    def test_synthetic_complaints_are_reproducible(self):
+        a = synthetic_complaints(300, random_state=1)
+        b = synthetic_complaints(300, random_state=1)
+        pd.testing.assert_frame_equal(a, b)
+        assert not a.equals(synthetic_complaints(300, random_state=2))
+
+    def test_chunks_have_consecutive_ids(self):
+        chunks = list(ComplaintGenerator(random_state=0).chunks(250, 100))
+        assert [len(c) for c in chunks] == [100, 100, 50]
+        ids = pd.concat(chunks)['Complaint ID']
+        assert list(ids) == list(range(1, 251))
+
+    def test_written_complaints_read_like_the_raw_dump(self, tmp_path):
+        path = str(tmp_path / 'complaints.csv')
+        write_synthetic_complaints(path, 500, chunksize=200, random_state=0)
+        expected = pd.concat(
+            ComplaintGenerator(random_state=0).chunks(500, 200)
+        )
+        read = pd.concat(read_complaints_chunked(path, chunksize=128))
+        narratives = expected['Consumer complaint narrative'].dropna()
+        assert len(read) == len(narratives)
+        assert list(read['Consumer complaint narrative']) == list(narratives)
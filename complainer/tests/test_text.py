@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+from complainer.artifacts import load_text_policy, save_compact
+from complainer.preprocessing import Preprocessor
+from complainer.text import TEXT_POLICY_FILE, TextPolicy
+
+
+TEXT = 'On XX/XX/2019  XXXX XXXX sold   my loan'
+
+
+class TestTextPolicy:
+    def test_normalizes_texts(self):
+        policy = TextPolicy(normalize=True)
+        assert policy.apply([TEXT, None]) == ['On XXXX sold my loan', '']
+        assert TextPolicy().apply([TEXT]) == [TEXT]
+
+    def test_truncates_after_normalizing(self):
+        policy = TextPolicy(normalize=True, max_chars=12)
+        assert policy.apply([TEXT]) == ['On XXXX sold']
+        assert TextPolicy(max_chars=12).apply([TEXT]) == ['On']
+        tail = TextPolicy(normalize=True, max_chars=12, keep='tail')
+        assert tail.apply([TEXT]) == ['sold my loan']
+
+    def test_unknown_keep_raises(self):
+        with pytest.raises(ValueError):
+            TextPolicy(max_chars=10, keep='middle')
+
+    def test_as_preprocessing_step(self):
+        raw = pd.DataFrame({
+            'Product': ['Mortgage'],
+            'Issue': ['Settlement process and costs'],
+            'Consumer complaint narrative': [TEXT]
+        })
+        processed = Preprocessor(
+            steps=[TextPolicy(normalize=True)]).transform(raw)
+        assert list(processed.complaint) == ['On XXXX sold my loan']
+        processed = Preprocessor(
+            steps=[TextPolicy(normalize=True, max_chars=8)]).transform(raw)
+        assert list(processed.complaint) == ['On XXXX']
+
+    def test_save_and_load(self, tmp_path):
+        TextPolicy(normalize=True, max_chars=100,
+                   keep='tail').save(str(tmp_path))
+        assert (tmp_path / TEXT_POLICY_FILE).exists()
+        assert TextPolicy.load(str(tmp_path)).to_dict() == {
+            'normalize': True, 'max_chars': 100, 'keep': 'tail'
+        }
+
+    def test_missing_policy_leaves_texts_as_they_are(self, tmp_path):
+        assert TextPolicy.load(str(tmp_path)).to_dict() == {
+            'normalize': False, 'max_chars': None, 'keep': 'head'
+        }
+
+
+class TestModelTextPolicy:
+    def test_loaded_from_compact_artifact_or_beside_pickles(self, tmp_path):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.naive_bayes import MultinomialNB
+
+        texts = ['escrow payment late', 'foreclosure notice']
+        vectorizer = TfidfVectorizer().fit(texts)
+        model = MultinomialNB().fit(vectorizer.transform(texts),
+                                    ['servicing', 'modification'])
+        compact = str(tmp_path / 'compact')
+        save_compact(vectorizer, model, compact, TextPolicy(normalize=True))
+        assert load_text_policy(compact_path=compact).normalize
+        assert not load_text_policy(str(tmp_path / 'vectorizer.pkl')).normalize
+        TextPolicy(normalize=True).save(str(tmp_path))
+        assert load_text_policy(str(tmp_path / 'vectorizer.pkl')).normalize
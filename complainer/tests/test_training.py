@@ -0,0 +1,85 @@
+import pytest
+
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from complainer.features import HashingTfidfVectorizer
+from complainer.instrumentation import Stages
+from complainer.training import incremental_model, fit_incremental
+
+
+@pytest.fixture
+def train():
+    return pd.DataFrame({
+        'complaint': ['escrow payment was late', 'my escrow account is short',
+                      'foreclosure after modification',
+                      'they started foreclosure', 'late escrow payment again',
+                      'modification denied then foreclosure'],
+        'issue': ['loan_servicing', 'loan_servicing', 'loan_modification',
+                  'loan_modification', 'loan_servicing', 'loan_modification']
+    })
+
+
+def chunker(df, chunksize):
+    return lambda: (df.iloc[i:i + chunksize]
+                    for i in range(0, len(df), chunksize))
+
+
+classes = ['loan_modification', 'loan_servicing']
+
+
+class TestFitIncremental:
+    @pytest.mark.parametrize('name', ['sgd', 'nb'])
+    def test_fits_over_chunks_and_predicts(self, train, name):
+        vectorizer, model, rows = fit_incremental(
+            incremental_model(name, **({'random_state': 0} if name == 'sgd'
+                                       else {})),
+            HashingTfidfVectorizer(),
+            chunker(train, 2),
+            classes,
+            n_epochs=5
+        )
+        assert rows == len(train)
+        predictions = model.predict(vectorizer.transform(train.complaint))
+        assert list(predictions) == list(train.issue)
+
+    def test_vectorizer_sees_every_chunk(self, train):
+        vectorizer, _, _ = fit_incremental(incremental_model('nb'),
+                                           HashingTfidfVectorizer(),
+                                           chunker(train, 4),
+                                           classes)
+        assert vectorizer.n_documents_ == len(train)
+
+    def test_prefitted_vectorizer_is_not_refitted(self, train):
+        vectorizer = TfidfVectorizer().fit(train.complaint[:2])
+        fitted, _, _ = fit_incremental(incremental_model('nb'), vectorizer,
+                                       chunker(train, 2), classes,
+                                       fit_vectorizer=False)
+        assert len(fitted.vocabulary_) == len(vectorizer.vocabulary_)
+
+    def test_vectorizer_without_partial_fit_throws(self, train):
+        with pytest.raises(ValueError):
+            fit_incremental(incremental_model('nb'), TfidfVectorizer(),
+                            chunker(train, 2), classes)
+
+    def test_no_epochs_throws(self, train):
+        with pytest.raises(ValueError):
+            fit_incremental(incremental_model('nb'), HashingTfidfVectorizer(),
+                            chunker(train, 2), classes, n_epochs=0)
+
+    def test_stages_are_measured(self, train):
+        stages = Stages()
+        fit_incremental(incremental_model('nb'), HashingTfidfVectorizer(),
+                        chunker(train, 4), classes, n_epochs=2, stages=stages)
+        assert list(stages.stages) == ['read', 'featurize', 'fit']
+        # One pass to fit the vectorizer, and two to fit the classifier.
+        assert stages.stages['read'].rows == 3 * len(train)
+        assert stages.stages['featurize'].rows == 3 * len(train)
+        assert stages.stages['fit'].rows == 2 * len(train)
+        assert stages.stages['fit'].extra['entries'] == 4
+
+
+class TestIncrementalModel:
+    def test_unknown_model_throws(self):
+        with pytest.raises(ValueError):
+            incremental_model('forest')
@@ -0,0 +1,108 @@
+import pytest
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.naive_bayes import MultinomialNB
+
+from complainer.tuning import (
+    candidates, split_params, group_candidates, count_terms,
+    evaluate_candidate, search
+)
+
+
+train_texts = ['escrow payment was late', 'my escrow account is short',
+               'foreclosure after modification', 'they started foreclosure',
+               'late escrow payment again',
+               'modification denied then foreclosure']
+y_train = ['servicing', 'servicing', 'modification', 'modification',
+           'servicing', 'modification']
+dev_texts = ['escrow is late', 'foreclosure and modification']
+y_dev = ['servicing', 'modification']
+
+space = {
+    'ngram_range': [(1, 1), (1, 2)],
+    'sublinear_tf': [False, True],
+    'classifier': ['nb'],
+    'alpha': [0.1, 1.0]
+}
+
+
+class TestCandidates:
+    def test_split_params(self):
+        tokenization, vectorizer, name, params = split_params(
+            {'ngram_range': (1, 2), 'lowercase': False, 'norm': 'l1',
+             'classifier': 'sgd', 'alpha': 0.1}
+        )
+        assert tokenization == {'lowercase': False}
+        assert vectorizer == {'ngram_range': (1, 2), 'norm': 'l1'}
+        assert name == 'sgd'
+        assert params == {'alpha': 0.1}
+
+    def test_candidates_share_tokenization_groups(self):
+        grid = candidates(space)
+        assert len(grid) == 8
+        groups = group_candidates(grid)
+        assert len(groups) == 1
+        tokenization, members = groups[0]
+        assert tokenization['ngram_range'] == (1, 2)
+        assert members == list(range(8))
+
+    def test_random_candidates_are_sampled(self):
+        assert len(candidates(space, n_iter=3, random_state=0)) == 3
+
+
+class TestEvaluateCandidate:
+    def test_candidate_matches_tfidf_vectorizer_pipeline(self):
+        candidate = {'ngram_range': (1, 2), 'sublinear_tf': True, 'min_df': 2,
+                     'classifier': 'nb', 'alpha': 0.5}
+        train_counts, dev_counts = count_terms({'ngram_range': (1, 3)},
+                                               train_texts, dev_texts)
+        result = evaluate_candidate(candidate, train_counts, y_train,
+                                    dev_counts, y_dev, ['modification',
+                                                        'servicing'])
+
+        vectorizer = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True,
+                                     min_df=2)
+        model = MultinomialNB(alpha=0.5).fit(
+            vectorizer.fit_transform(train_texts), y_train)
+        predictions = model.predict(vectorizer.transform(dev_texts))
+        expected = sum(p == y for p, y in zip(predictions, y_dev)) / len(y_dev)
+        assert result['recall'] == pytest.approx(expected)
+
+    def test_single_threaded_classifiers_ignore_n_jobs(self):
+        train_counts, dev_counts = count_terms({}, train_texts, dev_texts)
+        for name in ['nb', 'nbsvm']:
+            result = evaluate_candidate({'classifier': name, 'n_jobs': 1},
+                                        train_counts, y_train, dev_counts,
+                                        y_dev, ['modification', 'servicing'])
+            assert result['recall'] == 1
+
+    def test_unknown_classifier_throws(self):
+        with pytest.raises(ValueError):
+            search([{'classifier': 'forest'}], train_texts, y_train, dev_texts,
+                   y_dev, n_workers=1)
+
+
+class TestSearch:
+    def test_search_is_the_same_in_parallel(self):
+        grid = candidates(space)
+        serial = search(grid, train_texts, y_train, dev_texts, y_dev,
+                        n_workers=1)
+        parallel = search(grid, train_texts, y_train, dev_texts, y_dev,
+                          n_workers=2)
+        assert len(serial) == 8
+        assert list(serial.fscore) == sorted(serial.fscore, reverse=True)
+        cols = ['ngram_range', 'sublinear_tf', 'alpha', 'fscore', 'roc_auc']
+        assert serial[cols].equals(parallel[cols])
+        assert list(parallel.columns) == list(serial.columns)
+
+    def test_serial_search_keeps_classifier_threads(self, monkeypatch):
+        import complainer.tuning as tuning
+        seen = []
+
+        def evaluate(candidate, *args):
+            seen.append(candidate.get('n_jobs'))
+            return {'fscore': 0}
+        monkeypatch.setattr(tuning, 'evaluate_candidate', evaluate)
+        grid = [{'classifier': 'nbsvm'}, {'classifier': 'nbsvm', 'n_jobs': 2}]
+        search(grid, train_texts, y_train, dev_texts, y_dev, n_workers=1)
+        assert seen == [None, 2]
@@ -0,0 +1,110 @@
+"""
+The preparation of complaint texts before they are featurized: normalizing
+their redactions and whitespace, then truncating very long ones.
+
+A model only scores texts well if they are prepared the way its training
+texts were. The preprocess job prepares training data with a `TextPolicy`
+and saves it beside the data; training saves it with the model's artifacts,
+and scoring and serving load it from there and apply it to every text.
+"""
+
+import json
+import os
+
+from complainer.dedup import normalize_text
+from complainer.length import LengthPolicy
+
+
+TEXT_POLICY_FILE = 'text.json'
+
+
+class TextPolicy:
+    """
+    Prepare complaint texts for a model.
+    Usable as a step of complainer.preprocessing.Preprocessor, and to
+    prepare texts before scoring them the same way.
+
+    Parameters
+    ----------
+    normalize : bool (default=False)
+        Whether redactions and whitespace are normalized, as
+        complainer.dedup.normalize_text.
+    max_chars : int or None (default=None)
+        Maximum number of characters of each text, after normalizing, as
+        complainer.length.LengthPolicy. If None, texts are not truncated.
+    keep : "head", "tail" or "head_tail" (default="head")
+        Which part of long texts to keep, as complainer.length.LengthPolicy.
+    column : string (default="complaint")
+        Column holding the texts, when called on a pandas.DataFrame.
+    """
+
+    def __init__(self,
+        normalize=False,
+        max_chars=None,
+        keep='head',
+        column='complaint'):
+        self.normalize = normalize
+        self.length_policy = LengthPolicy(max_chars, keep)
+        self.column = column
+
+    @property
+    def max_chars(self):
+        return self.length_policy.max_chars
+
+    @property
+    def keep(self):
+        return self.length_policy.keep
+
+    def apply(self, texts):
+        """
+        Prepare each of `texts`. Returns a list of strings.
+        """
+        if self.normalize:
+            texts = normalize_text(texts)
+        return self.length_policy.truncate(texts)
+
+    def __call__(self, df):
+        """
+        Prepare the `column` texts of the pandas.DataFrame `df`.
+        """
+        if not self.normalize and self.max_chars is None:
+            return df
+        df = df.copy(deep=False)
+        df[self.column] = self.apply(df[self.column].fillna(''))
+        return df
+
+    def to_dict(self):
+        """
+        Params of the policy, as saved with data and models.
+        """
+        return {'normalize': self.normalize,
+                'max_chars': self.max_chars,
+                'keep': self.keep}
+
+    @classmethod
+    def from_dict(cls, params):
+        return cls(**params)
+
+    def save(self, directory):
+        """
+        Save the policy to `directory`, beside the data or model it
+        prepared texts for.
+        """
+        with open(os.path.join(directory, TEXT_POLICY_FILE), 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Load the policy saved to `directory`. Data and models saved without
+        one had their texts left as they are.
+        """
+        path = os.path.join(directory, TEXT_POLICY_FILE)
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def __repr__(self):
+        return 'TextPolicy(normalize={}, max_chars={}, keep={!r})'.format(
+            self.normalize, self.max_chars, self.keep)
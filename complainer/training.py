@@ -0,0 +1,124 @@
+"""
+Functions for training classifiers on data too large to fit in memory.
+"""
+
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import MultinomialNB
+
+from complainer.instrumentation import Stages
+
+
+def incremental_model(name, **params):
+    """
+    Create an unfitted classifier that supports `partial_fit`.
+
+    Parameters
+    ----------
+    name : string
+        "sgd" for a linear SVM trained by stochastic gradient descent (the
+        closest incremental relative of NBSVM's linear SVM), or "nb" for
+        multinomial naive bayes.
+    **params
+        Passed to the classifier.
+    Returns
+    -------
+    model : sklearn classifier
+    """
+    models = {
+        'sgd': SGDClassifier,
+        'nb': MultinomialNB
+    }
+    if name not in models:
+        raise(ValueError(
+            "Unknown incremental model {}, expected one of {}".format(
+                name, ', '.join(models))
+        ))
+    return models[name](**params)
+
+
+def fit_incremental(model,
+    vectorizer,
+    chunks,
+    classes,
+    text_column='complaint',
+    target_column='issue',
+    fit_vectorizer=True,
+    n_epochs=1,
+    stages=None):
+    """
+    Fit a vectorizer and classifier over a stream of data chunks, holding
+    only one chunk (and its features) in memory at a time.
+    The vectorizer is fitted in a first pass over the chunks, and the
+    classifier in `n_epochs` further passes.
+
+    Every pass reads the chunks in the same order: shuffling their order
+    would need random access to them, or all of them in memory, which is
+    what streaming avoids. Classifiers fitted by stochastic gradient descent
+    weigh the last chunks most, so if the data is ordered (e.g. by date),
+    shuffle its rows once when writing it.
+
+    Parameters
+    ----------
+    model : sklearn classifier
+        Classifier supporting `partial_fit`, e.g. from `incremental_model`.
+    vectorizer : sklearn-style vectorizer
+        Vectorizer supporting `partial_fit` (e.g. a
+        complainer.features.HashingTfidfVectorizer), or an already fitted
+        vectorizer if `fit_vectorizer` is False.
+    chunks : callable
+        Called with no arguments at the start of every pass, and must return
+        an iterable of pandas.DataFrame chunks, in the same order each time.
+        For example, `lambda: complainer.storage.iter_table(path)`.
+    classes : list
+        Every class that may appear in the target column.
+    text_column : string (default="complaint")
+        Name of the feature column.
+    target_column : string (default="issue")
+        Name of the target column.
+    fit_vectorizer : bool (default=True)
+        Whether to fit the vectorizer in a first pass.
+    n_epochs : int (default=1)
+        Number of passes over the chunks to fit the classifier, at least 1.
+    stages : complainer.instrumentation.Stages or None (default=None)
+        If given, the time spent reading chunks, featurizing them (fitting
+        and applying the vectorizer) and fitting the classifier is added to
+        its "read", "featurize" and "fit" stages.
+    Returns
+    -------
+    vectorizer : sklearn-style vectorizer
+        The fitted vectorizer.
+    model : sklearn classifier
+        The fitted classifier.
+    rows : int
+        Number of training rows in one pass.
+    """
+    if n_epochs < 1:
+        raise(ValueError(
+            "n_epochs must be at least 1, got {}".format(n_epochs)
+        ))
+    if stages is None:
+        stages = Stages()
+
+    if fit_vectorizer:
+        if not hasattr(vectorizer, 'partial_fit'):
+            raise(ValueError(
+                """
+                Incremental training needs a vectorizer with `partial_fit`,
+                e.g. complainer.features.HashingTfidfVectorizer,
+                or an already fitted vectorizer and `fit_vectorizer=False`.
+                """
+            ))
+        for chunk in stages.iterate('read', chunks()):
+            with stages.stage('featurize', rows=len(chunk)):
+                vectorizer.partial_fit(chunk[text_column])
+
+    for epoch in range(n_epochs):
+        rows = 0
+        for chunk in stages.iterate('read', chunks()):
+            with stages.stage('featurize', rows=len(chunk)):
+                X = vectorizer.transform(chunk[text_column])
+            with stages.stage('fit', rows=len(chunk)):
+                model.partial_fit(X, chunk[target_column], classes=classes)
+            rows += len(chunk)
+
+    return vectorizer, model, rows
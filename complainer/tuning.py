@@ -0,0 +1,261 @@
+"""
+Hyperparameter search over tf-idf and classifier settings.
+
+Candidates are grouped by their tokenization params. Each group's text is
+tokenized into term counts once, and every candidate of the group derives its
+tf-idf vectorizer (n-gram range, document frequency limits, idf, norm,
+sublinear tf) from those counts, which is cheap compared to tokenizing (see
+complainer.features.TermCounts). Candidates are fitted and scored on a
+process pool, whose workers receive the texts and labels once, at start up,
+and share each group's counts through files.
+"""
+
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from sklearn.model_selection import ParameterGrid, ParameterSampler
+
+from complainer.classifiers import make_classifier
+from complainer.features import TermCounts, tokenization_params
+from complainer.metrics import StreamingMetrics
+from complainer.parallel import default_workers, imap_ordered
+
+
+# Candidate params of the tf-idf vectorizer that are derived from term
+# counts. Candidates agreeing on all tokenization params share one term count
+# matrix, counted over the widest n-gram range any of them uses.
+vectorizer_params = ['ngram_range', 'min_df', 'max_df', 'max_features',
+                     'binary', 'norm', 'use_idf', 'smooth_idf',
+                     'sublinear_tf']
+
+
+def candidates(space, n_iter=None, random_state=None):
+    """
+    Candidate params from a search `space`.
+
+    Parameters
+    ----------
+    space : dict or list of dicts
+        Maps param names to lists of values (or distributions, for random
+        search), as sklearn.model_selection.ParameterGrid.
+        Params are tokenization params (see
+        complainer.features.tokenization_params), other TfidfVectorizer
+        params (see `vectorizer_params`), "classifier" (a name accepted by
+        complainer.classifiers.make_classifier, default "nbsvm"), and
+        params of the classifier.
+    n_iter : int or None (default=None)
+        If None, every combination of the grid. Otherwise, `n_iter` random
+        samples from the space.
+    random_state : int or None (default=None)
+        Seed for random search.
+    Returns
+    -------
+    candidates : list of dicts
+    """
+    if n_iter is None:
+        return list(ParameterGrid(space))
+    return list(ParameterSampler(space, n_iter, random_state=random_state))
+
+
+def split_params(candidate):
+    """
+    Split candidate params into (tokenization, vectorizer, classifier name,
+    classifier params) dicts.
+    """
+    candidate = dict(candidate)
+    tokenization = {name: candidate.pop(name) for name in tokenization_params
+                    if name in candidate}
+    vectorizer = {name: candidate.pop(name) for name in vectorizer_params
+                  if name in candidate}
+    name = candidate.pop('classifier', 'nbsvm')
+    return tokenization, vectorizer, name, candidate
+
+
+def _tokenization_key(candidate):
+    tokenization = split_params(candidate)[0]
+    return repr(sorted(tokenization.items()))
+
+
+def group_candidates(candidates):
+    """
+    Group candidates by their tokenization params.
+    Returns a list of (tokenization params, [candidate indices]) in order of
+    first appearance. The tokenization params include the "ngram_range"
+    spanning every candidate of the group.
+    """
+    groups = {}
+    for i, candidate in enumerate(candidates):
+        key = _tokenization_key(candidate)
+        if key not in groups:
+            groups[key] = (split_params(candidate)[0], [])
+        groups[key][1].append(i)
+
+    for tokenization, members in groups.values():
+        ranges = [tuple(candidates[i].get('ngram_range', (1, 1)))
+                  for i in members]
+        tokenization['ngram_range'] = (min(low for low, _ in ranges),
+                                       max(high for _, high in ranges))
+    return list(groups.values())
+
+
+def count_terms(tokenization, train_texts, dev_texts):
+    """
+    Tokenize train and dev texts once with `tokenization` params.
+    Returns (train counts, dev counts), complainer.features.TermCounts over
+    the terms of the train texts.
+    """
+    train_counts = TermCounts.from_texts(train_texts, **tokenization)
+    return train_counts, train_counts.count(dev_texts)
+
+
+def evaluate_candidate(candidate, train_counts, y_train, dev_counts, y_dev,
+                       labels):
+    """
+    Derive the vectorizer of `candidate` from train counts, fit its
+    classifier, and score it on dev counts.
+    Returns a dict of weighted roc auc, precision, recall and f-score, and
+    the fit time in seconds.
+    """
+    _, vectorizer_params, name, params = split_params(candidate)
+    start = time.perf_counter()
+    vectorizer, X = train_counts.tfidf(**vectorizer_params)
+    model = make_classifier(name, **params)
+    model.fit(X, y_train)
+    seconds = time.perf_counter() - start
+
+    metrics = StreamingMetrics(labels)
+    metrics.update(y_dev, model.predict(dev_counts.transform(vectorizer)))
+    precision, recall, fscore, _ = metrics.precision_recall_fscore_support()
+    return {
+        'roc_auc': metrics.roc_auc(),
+        'precision': precision,
+        'recall': recall,
+        'fscore': fscore,
+        'fit_seconds': seconds
+    }
+
+
+_worker_data = None
+_worker_counts = (None, None)
+
+
+def _init_worker(train_texts, y_train, dev_texts, y_dev, labels):
+    global _worker_data, _worker_counts
+    _worker_data = (train_texts, y_train, dev_texts, y_dev, labels)
+    _worker_counts = (None, None)
+
+
+def _count_in_worker(task):
+    # Count a group's terms and save them for the workers evaluating it.
+    global _worker_counts
+    tokenization, directory = task
+    train_texts, _, dev_texts, _, _ = _worker_data
+    counts = count_terms(tokenization, train_texts, dev_texts)
+    counts[0].save(os.path.join(directory, 'train'))
+    counts[1].save(os.path.join(directory, 'dev'))
+    _worker_counts = (directory, counts)
+
+
+def _evaluate_in_worker(task):
+    # Candidates arrive grouped, so each worker loads a group's counts once.
+    global _worker_counts
+    candidate, directory = task
+    if _worker_counts[0] != directory:
+        _worker_counts = (directory,
+                          (TermCounts.load(os.path.join(directory, 'train')),
+                           TermCounts.load(os.path.join(directory, 'dev'))))
+    _, y_train, _, y_dev, labels = _worker_data
+    train_counts, dev_counts = _worker_counts[1]
+    return evaluate_candidate(candidate, train_counts, y_train, dev_counts,
+                              y_dev, labels)
+
+
+def search(candidates,
+    train_texts,
+    y_train,
+    dev_texts,
+    y_dev,
+    n_workers=None,
+    scoring='fscore'):
+    """
+    Fit every candidate on the train data and score it on the dev data.
+
+    Parameters
+    ----------
+    candidates : list of dicts
+        Candidate params, e.g. from `candidates`.
+    train_texts, dev_texts : sequences of strings
+        Train and dev documents.
+    y_train, y_dev : sequences
+        Train and dev targets.
+    n_workers : int or None (default=None)
+        Number of worker processes fitting candidates (default: one per
+        core; 1 fits them serially). Texts and targets are sent to each
+        worker once, and the term counts of each tokenization group are
+        saved to a temporary directory, which workers read them from.
+        With several workers, classifiers fit on one thread each unless
+        the candidate sets "n_jobs".
+    scoring : string (default="fscore")
+        Metric to rank candidates by: "roc_auc", "precision", "recall" or
+        "fscore".
+    Returns
+    -------
+    results : pandas.DataFrame
+        One row per candidate, its params and dev metrics, best first.
+    """
+    data = (list(train_texts), list(y_train), list(dev_texts), list(y_dev))
+    labels = sorted(set(data[1]) | set(data[3]))
+    groups = group_candidates(candidates)
+    if n_workers is None:
+        n_workers = default_workers()
+
+    with tempfile.TemporaryDirectory() as directory:
+        directories = [os.path.join(directory, str(g))
+                       for g in range(len(groups))]
+        # Workers already occupy the cores, so their classifiers fit on
+        # one thread.
+        threads = {'n_jobs': 1} if n_workers > 1 else {}
+        tasks, order = [], []
+        for (_, members), group_directory in zip(groups, directories):
+            for i in members:
+                tasks.append((dict(threads, **candidates[i]),
+                              group_directory))
+                order.append(i)
+
+        executor = None
+        if n_workers > 1:
+            executor = ProcessPoolExecutor(max_workers=n_workers,
+                                           initializer=_init_worker,
+                                           initargs=data + (labels,))
+        else:
+            _init_worker(*data, labels)
+        try:
+            # Tokenize each group once, then derive every candidate of the
+            # group from its counts.
+            list(imap_ordered(
+                _count_in_worker,
+                [(tokenization, group_directory)
+                 for (tokenization, _), group_directory
+                 in zip(groups, directories)],
+                executor
+            ))
+            scores = list(imap_ordered(_evaluate_in_worker, tasks, executor))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            else:
+                _init_worker(None, None, None, None, None)
+
+    rows = [None] * len(candidates)
+    for i, score in zip(order, scores):
+        row = {name: repr(value) if isinstance(value, tuple) else value
+               for name, value in candidates[i].items()}
+        row.update(score)
+        rows[i] = row
+
+    return (pd.DataFrame(rows)
+            .sort_values(scoring, ascending=False, kind='mergesort')
+            .reset_index(drop=True))
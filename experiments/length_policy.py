@@ -0,0 +1,175 @@
+# # Narrative length policies
+
+# The prototype found mortgage complaints longer than 10,000 characters.
+# Tokenizing and scoring cost grows with the length of a complaint, so a few
+# huge ones set the worst case latency of featurization and scoring.
+# Here we compare the length policies of complainer.length on throughput,
+# worst case latency and accuracy:
+# * truncating to MAX_CHARS, keeping the head, the tail, or both,
+# * chunking long complaints into windows and pooling the windows' features,
+# * and, for batch scoring, batching complaints of similar length together.
+
+# ## Imports
+
+import os
+import time
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics import accuracy_score, f1_score
+from complainer.length import (
+    ChunkPoolVectorizer, LengthPolicy, length_batches, length_buckets
+)
+from complainer.preprocessing import Preprocessor
+from complainer.splitter import train_dev_test_split
+from complainer.storage import read_table
+from complainer.synthetic import synthetic_complaints
+from complainer.classifiers import make_classifier
+
+# ## Data
+
+# Set PROCESSED_DIRECTORY to the output of the preprocess job to use its
+# train and dev tables. Otherwise we generate synthetic complaints, whose
+# narrative lengths have a similar long tail.
+
+PROCESSED_DIRECTORY = os.environ.get('PROCESSED_DIRECTORY')
+CLASSIFIER = os.environ.get('CLASSIFIER', 'sgd')
+
+if PROCESSED_DIRECTORY:
+    train = read_table(os.path.join(PROCESSED_DIRECTORY, 'train.csv'))
+    dev = read_table(os.path.join(PROCESSED_DIRECTORY, 'dev.csv'))
+else:
+    raw = synthetic_complaints(100000, random_state=0)
+    mortgages = Preprocessor().transform(
+        raw[raw['Consumer complaint narrative'].notnull()]
+    ).reset_index(drop=True)
+    train, dev, _ = train_dev_test_split(mortgages, random_state=0)
+
+train = train.assign(complaint=train.complaint.fillna('').astype(str))
+dev = dev.assign(complaint=dev.complaint.fillna('').astype(str))
+
+# How long are the complaints?
+# Most fit in a couple of thousand characters, but the longest bucket holds
+# a large share of the text.
+
+lengths = dev.complaint.str.len()
+print(lengths.describe())
+
+buckets = pd.DataFrame({'bucket': length_buckets(lengths),
+                        'length': lengths})
+print(buckets.groupby('bucket').length.agg(['count', 'sum', 'max']))
+
+# ## Policies
+
+# Every policy is applied to both the training and the dev complaints, as
+# the preprocess and score jobs would.
+
+def truncating(max_chars, keep):
+    policy = LengthPolicy(max_chars, keep=keep)
+    return policy.truncate, TfidfVectorizer()
+
+
+def chunk_pooling(max_chars, how):
+    return list, ChunkPoolVectorizer(TfidfVectorizer(), max_chars, how=how)
+
+
+policies = {'none': (list, TfidfVectorizer())}
+for max_chars in [1000, 2000, 5000]:
+    for keep in ['head', 'tail', 'head_tail']:
+        policies['{}_{}'.format(keep, max_chars)] = truncating(max_chars,
+                                                               keep)
+for how in ['mean', 'max']:
+    policies['chunk_pool_{}_2000'.format(how)] = chunk_pooling(2000, how)
+
+# ## Evaluate
+
+# For each policy we measure:
+# * fit_s, the time to featurize the training set and fit the classifier,
+# * dev_rows_per_s, the throughput of featurizing and scoring dev,
+# * worst_ms, the time to score the slowest of the longest dev complaints
+#   one at a time, which is the worst case latency of serving,
+# * nnz_mean and nnz_max, the density of the feature rows,
+# * accuracy and macro F1 on dev.
+
+longest = dev.complaint[lengths.sort_values().index[-20:]]
+
+
+def evaluate(apply_policy, vectorizer):
+    start = time.perf_counter()
+    X_train = vectorizer.fit_transform(apply_policy(train.complaint))
+    model = make_classifier(CLASSIFIER).fit(X_train, train.issue)
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    X_dev = vectorizer.transform(apply_policy(dev.complaint))
+    predictions = model.predict(X_dev)
+    dev_seconds = time.perf_counter() - start
+
+    worst = 0
+    for text in longest:
+        start = time.perf_counter()
+        model.predict(vectorizer.transform(apply_policy([text])))
+        worst = max(worst, time.perf_counter() - start)
+
+    nnz = np.diff(X_dev.tocsr().indptr)
+    return {
+        'fit_s': fit_seconds,
+        'dev_rows_per_s': len(dev) / dev_seconds,
+        'worst_ms': 1000 * worst,
+        'nnz_mean': nnz.mean(),
+        'nnz_max': nnz.max(),
+        'accuracy': accuracy_score(dev.issue, predictions),
+        'macro_f1': f1_score(dev.issue, predictions, average='macro')
+    }
+
+
+results = pd.DataFrame({name: evaluate(*policy)
+                        for name, policy in policies.items()}).T
+print(results.round(3).to_string())
+
+# Truncation bounds the worst case: a complaint costs no more than one of
+# MAX_CHARS characters, whatever its length. Chunk-and-pool featurizes
+# every window, so it bounds the cost of each vectorizer call but not of a
+# complaint, and is slower overall; it only pays off if its pooled features
+# are more accurate.
+
+# ## Length bucketing for batch scoring
+
+# Batches of a fixed number of complaints, in arrival order, vary in cost
+# with the lengths of the complaints that happen to be in them. Batches of
+# about the same number of characters, grouped by length, should cost about
+# the same. We score dev both ways with the untruncated model and compare
+# the spread of batch latencies. With tf-idf features, cost is close to
+# linear in the number of characters whichever way complaints are batched,
+# so bucketing matters less than truncation does.
+
+vectorizer = TfidfVectorizer()
+model = make_classifier(CLASSIFIER).fit(
+    vectorizer.fit_transform(train.complaint), train.issue)
+
+batch_size = 64
+batch_chars = int(lengths.mean() * batch_size)
+batchings = {
+    'fixed_rows': np.array_split(np.arange(len(dev)),
+                                 max(len(dev) // batch_size, 1)),
+    'length_batches': length_batches(lengths, batch_chars)
+}
+
+
+def batch_latencies(batches):
+    seconds = []
+    for batch in batches:
+        start = time.perf_counter()
+        model.predict(vectorizer.transform(dev.complaint.values[batch]))
+        seconds.append(time.perf_counter() - start)
+    return 1000 * np.array(seconds)
+
+
+latencies = {name: batch_latencies(batches)
+             for name, batches in batchings.items()}
+print(pd.DataFrame({
+    name: {'batches': len(ms), 'total_ms': ms.sum(),
+           'p50_ms': np.percentile(ms, 50), 'p99_ms': np.percentile(ms, 99),
+           'max_ms': ms.max()}
+    for name, ms in latencies.items()
+}).T.round(2))
@@ -10,11 +10,11 @@ import joblib
 import pandas as pd
 import numpy as np
 import seaborn as sns
-from sklearn.preprocessing import label_binarize
-from sklearn.metrics import (
-    roc_auc_score, precision_recall_fscore_support, confusion_matrix
-)
-from complainer.preprocessing import target_encoding_dict
+from complainer.artifacts import load_compact, compact_digest
+from complainer.cache import FeatureCache, file_digest
+from complainer.instrumentation import RunLog
+from complainer.metrics import StreamingMetrics
+from complainer.storage import iter_table
 
 # ## Params
 
@@ -24,46 +24,96 @@ DATA = os.environ['DATA']
 VECTORIZER = os.environ['VECTORIZER']
 MODEL = os.environ['MODEL']
 
+# Optional params.
+# Set COMPACT_MODEL to the directory of a compact artifact to load the
+# vectorizer and model from it (memory mapped) instead of the pickles.
 
-# ## Read data
+COMPACT_MODEL = os.environ.get('COMPACT_MODEL')
 
-data = pd.read_csv(DATA)
+# Featurized data is cached here, keyed by the contents of the data and of
+# the vectorizer file. Set to an empty string to disable.
 
+FEATURE_CACHE = os.environ.get(
+    'FEATURE_CACHE', os.path.join(os.path.dirname(VECTORIZER), 'features')
+)
 
-# ## Read vectorizer and model
+# Rows featurized and scored at a time. Memory use is bounded by this,
+# not by the size of the data.
 
-vectorizer = joblib.load(VECTORIZER)
-model = joblib.load(MODEL)
+CHUNKSIZE = int(os.environ.get('CHUNKSIZE', 100000))
 
+# Set RUN_LOG to a file to append the time and memory use of each stage to,
+# as JSON lines.
 
-# ## Featurize
+RUN_LOG = os.environ.get('RUN_LOG')
+log = RunLog(RUN_LOG, 'evaluate')
 
-features = vectorizer.transform(data.complaint)
-target = data.issue
 
+# ## Read vectorizer and model
 
-# ## Predict (batch score)
+with log.stage('load'):
+    if COMPACT_MODEL:
+        vectorizer, model = load_compact(COMPACT_MODEL)
+        vectorizer_digest = compact_digest(COMPACT_MODEL)
+    else:
+        vectorizer = joblib.load(VECTORIZER)
+        model = joblib.load(MODEL)
+        vectorizer_digest = file_digest(VECTORIZER)
+
+
+# ## Featurize, predict and accumulate metrics
+
+# The data is read in chunks (the storage format, csv, parquet or feather,
+# is inferred from the extension). Each chunk is featurized, scored, and
+# added to a single confusion matrix, from which every metric below is
+# derived, so evaluation is one pass in memory independent of the number of
+# rows.
+# Re-evaluating the same data with the same vectorizer reuses the cached
+# features of each chunk rather than tokenizing again.
+
+# The confusion matrix covers the model's classes and every issue in the
+# data, which are collected first from the issue column alone.
+
+data_labels = set()
+for chunk in iter_table(DATA, chunksize=CHUNKSIZE, columns=['issue']):
+    data_labels.update(chunk.issue.astype(str))
+labels = sorted(data_labels | set(model.classes_))
+metrics = StreamingMetrics(labels)
+
+cache = FeatureCache(FEATURE_CACHE) if FEATURE_CACHE else None
+data_digest = file_digest(DATA) if cache else None
+
+# Reading, featurizing and predicting are interleaved chunk by chunk, and
+# each is measured as its own stage, accumulated over the chunks.
+
+with log.interleaved() as stages:
+    chunks = iter_table(DATA, chunksize=CHUNKSIZE,
+                        columns=['complaint', 'issue'])
+    for i, chunk in enumerate(stages.iterate('read', chunks)):
+        with stages.stage('featurize', rows=len(chunk)):
+            if cache:
+                features = cache.transform(
+                    vectorizer,
+                    chunk.complaint,
+                    data_digest='{}:{}:{}'.format(data_digest, CHUNKSIZE, i),
+                    vectorizer_digest=vectorizer_digest
+                )
+            else:
+                features = vectorizer.transform(chunk.complaint)
+        with stages.stage('predict', rows=len(chunk)):
+            predictions = model.predict(features)
+        metrics.update(chunk.issue.astype(str), predictions)
 
-predictions = model.predict(features)
 
 # ## Metrics
 
 # Calculate a measure of goodness.
 # We'll use the area under the ROC curve (true positive vs false positive
 # rate), with a weighted average over the multiple classes.
-# To do this we must binarize the labels (because that's what the sklearn
-# method wants).
-
-labels = [x for x in set(target_encoding_dict.values())]
+# Computed from the hard predictions, one class against the rest, this is
+# (true positive rate + true negative rate) / 2 for each class.
 
-binary_target = label_binarize(target, classes=labels)
-binary_predictions = label_binarize(predictions, classes=labels)
-
-roc = roc_auc_score(
-    binary_target,
-    binary_predictions,
-    average='weighted'
-)
+roc = metrics.roc_auc(average='weighted')
 
 
 print(
@@ -75,15 +125,14 @@ print(
 # Let's also take a look at the precision, recall, f-score and support,
 # again weighted by class imbalances.
 
-prfs = precision_recall_fscore_support(
-    binary_target,
-    binary_predictions,
-    average='weighted'
-)
+prfs = metrics.precision_recall_fscore_support(average='weighted')
 
 
 # ## Print metrics
-# It would be good to log these somewhere persistent too.
+# They are also written to the run log, if there is one.
+
+log.write('metrics', roc_auc=roc, precision=prfs[0], recall=prfs[1],
+          fscore=prfs[2])
 
 print(
     """
@@ -103,12 +152,15 @@ print(
 # Let's look at a confusion matrix to understand what's going on
 # in more detail.
 
-cm = confusion_matrix(target, predictions, labels=model.classes_)
+classes = [str(c) for c in model.classes_]
+cm = (pd.DataFrame(metrics.confusion_matrix(), index=labels, columns=labels)
+      .loc[classes, classes].values)
 
 # Normalize by class imbalance
 norm_cm = cm.astype('float') / cm.sum(axis=1)[:, np.newaxis]
 
-norm_cm_df = pd.DataFrame(norm_cm, index=model.classes_, columns=model.classes_)
+norm_cm_df = pd.DataFrame(norm_cm, index=model.classes_,
+                          columns=model.classes_)
 
 # Show result
 def plot_confusion_matrix(df):
@@ -120,7 +172,19 @@ plot_confusion_matrix(norm_cm_df)
 
 # ## Print log
 
+log.params(DATA=DATA,
+           VECTORIZER=VECTORIZER,
+           MODEL=MODEL,
+           COMPACT_MODEL=COMPACT_MODEL,
+           FEATURE_CACHE=FEATURE_CACHE,
+           CHUNKSIZE=CHUNKSIZE)
+print(log.summary())
+
 print("JOB PARAMS:")
 print("DATA: {}".format(DATA))
 print("VECTORIZER: {}".format(VECTORIZER))
-print("MODEL: {}".format(MODEL))
\ No newline at end of file
+print("MODEL: {}".format(MODEL))
+print("COMPACT_MODEL: {}".format(COMPACT_MODEL))
+print("FEATURE_CACHE: {}".format(FEATURE_CACHE))
+print("CHUNKSIZE: {}".format(CHUNKSIZE))
+print("RUN_LOG: {}".format(RUN_LOG))
@@ -0,0 +1,127 @@
+# # Ingest the raw complaints into a partitioned dataset
+
+# This job reads the raw dump and writes the complaints with a narrative to
+# a dataset partitioned by Product (and optionally by year received), e.g.
+# data/raw/complaints/Product=Mortgage/year=2019/part-00000.csv.
+# Later jobs then read only the partitions they need.
+
+# ## Imports
+
+import os
+import csv
+import pandas as pd
+from complainer.dataset import PartitionedWriter
+from complainer.incremental import Watermark, newer_rows
+from complainer.ingestion import read_complaints_chunked
+from complainer.instrumentation import RunLog
+
+# ## Params
+
+# The following should be set as environment variables in the CDSW job.
+
+INPUT_FILE = os.environ['INPUT_FILE']
+TARGET_DIRECTORY = os.environ['TARGET_DIRECTORY']
+
+# Optional params.
+# Set PARTITION_BY_YEAR to 1 to partition every product by the year of
+# Date received too.
+
+PARTITION_BY_YEAR = os.environ.get('PARTITION_BY_YEAR', '0') == '1'
+
+# Storage format of the part files: csv (default), parquet or feather.
+
+DATA_FORMAT = os.environ.get('DATA_FORMAT', 'csv')
+
+# Set INCREMENTAL to 1 to add only the complaints newer than the watermark
+# stored in TARGET_DIRECTORY by the previous incremental run, as a new part
+# in each partition they fall in.
+
+INCREMENTAL = os.environ.get('INCREMENTAL', '0') == '1'
+
+# Complaints are sometimes published days after the newest ones processed,
+# dated earlier. Set LOOKBACK_DAYS to re-read the complaints received over
+# that many days before the watermark in incremental runs, adding those not
+# processed yet, as recorded by their Complaint IDs in the watermark. With
+# 0 (the default), late complaints dated before the watermark are skipped.
+
+LOOKBACK_DAYS = int(os.environ.get('LOOKBACK_DAYS', 0))
+
+CHUNKSIZE = int(os.environ.get('CHUNKSIZE', 100000))
+
+# Set RUN_LOG to a file to append the time and memory use of each stage to,
+# as JSON lines.
+
+RUN_LOG = os.environ.get('RUN_LOG')
+log = RunLog(RUN_LOG, 'ingest')
+
+# ## Read raw data
+# Stream the raw dump in chunks, keeping only the columns we use and only
+# the rows containing complaints.
+
+chunks = read_complaints_chunked(INPUT_FILE, chunksize=CHUNKSIZE)
+
+if not os.path.exists(TARGET_DIRECTORY):
+    os.makedirs(TARGET_DIRECTORY)
+
+watermark = Watermark.load(TARGET_DIRECTORY) if INCREMENTAL else Watermark()
+latest = watermark
+if INCREMENTAL:
+    chunks = newer_rows(chunks, watermark)
+
+# ## Write partitioned dataset
+# Each chunk is split by partition as it is read and appended to that
+# partition's part. A full (not incremental) ingest replaces the whole
+# dataset: once its parts are in place, every other part, including the
+# parts added by earlier incremental runs, is removed.
+
+partition_by = ['Product', 'year'] if PARTITION_BY_YEAR else ['Product']
+
+with log.stage('read_partition_write', rows=0) as stage:
+    with PartitionedWriter(TARGET_DIRECTORY,
+                           partition_by,
+                           fmt=DATA_FORMAT,
+                           part=watermark.parts,
+                           replace=not INCREMENTAL,
+                           quoting=csv.QUOTE_ALL) as writer:
+        for chunk in chunks:
+            if PARTITION_BY_YEAR:
+                chunk = chunk.assign(
+                    year=pd.to_datetime(chunk['Date received']).dt.year
+                )
+            writer.write(chunk)
+            latest = latest.advance(chunk, LOOKBACK_DAYS)
+    stage.rows = writer.rows
+    stage.extra['partitions'] = len(writer.partitions)
+
+# ## Advance the watermark
+# Only once every part is in place, so an interrupted run is simply re-run.
+# A full ingest starts the watermark over from the rows it wrote, so the
+# next incremental run adds part 1.
+
+if writer.rows or not INCREMENTAL:
+    latest.parts = watermark.parts + (1 if writer.rows else 0)
+    latest.save(TARGET_DIRECTORY)
+
+print("{} rows written to {} partitions".format(writer.rows,
+                                                len(writer.partitions)))
+
+# ## Print log
+
+log.params(INPUT_FILE=INPUT_FILE,
+           TARGET_DIRECTORY=TARGET_DIRECTORY,
+           PARTITION_BY_YEAR=PARTITION_BY_YEAR,
+           DATA_FORMAT=DATA_FORMAT,
+           INCREMENTAL=INCREMENTAL,
+           LOOKBACK_DAYS=LOOKBACK_DAYS,
+           CHUNKSIZE=CHUNKSIZE)
+print(log.summary())
+
+print("JOB PARAMS:")
+print("INPUT_FILE: {}".format(INPUT_FILE))
+print("TARGET_DIRECTORY: {}".format(TARGET_DIRECTORY))
+print("PARTITION_BY_YEAR: {}".format(PARTITION_BY_YEAR))
+print("DATA_FORMAT: {}".format(DATA_FORMAT))
+print("INCREMENTAL: {}".format(INCREMENTAL))
+print("LOOKBACK_DAYS: {}".format(LOOKBACK_DAYS))
+print("CHUNKSIZE: {}".format(CHUNKSIZE))
+print("RUN_LOG: {}".format(RUN_LOG))
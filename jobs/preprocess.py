@@ -1,18 +1,28 @@
 # # Preprocess
 
-# This job takes an input directory containing train.csv, dev.csv and test.csv
-# and performs some preprocessing.
+# This job takes an input directory containing train, dev and test tables
+# and performs some preprocessing, for each product to classify.
 # Prep is encoding the target variable, retaining only the relevant columns,
 # and renaming those columns. Then persist to disk.
 
 # ## Imports
 
 import os
-import csv
+import json
+import time
+import functools
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from complainer.instrumentation import RunLog
+from complainer.parallel import make_executor, imap_ordered
 from complainer.preprocessing import (
-  filter_rename_mortgages, encode_targets, target_encoding_dict
+  iter_record_blocks, preprocess_block, preprocess_chunk, rows_per_second
 )
+from complainer.products import product_preprocessor, product_slug
+from complainer.storage import (
+  table_path, extensions, list_parts, iter_table, TableWriter
+)
+from complainer.text import TextPolicy
 
 # ## Params
 
@@ -21,45 +31,229 @@ from complainer.preprocessing import (
 INPUT_DIRECTORY = os.environ['INPUT_DIRECTORY']
 TARGET_DIRECTORY = os.environ['TARGET_DIRECTORY']
 
+# Storage format of the output tables: csv (default), parquet or feather,
+# and of the input tables (defaults to the output format).
+
+DATA_FORMAT = os.environ.get('DATA_FORMAT', 'csv')
+INPUT_FORMAT = os.environ.get('INPUT_FORMAT', DATA_FORMAT)
+
+# Number of worker processes (default: one per core; 1 runs serially),
+# and the maximum number of rows handed to a worker at once.
+
+N_WORKERS = int(os.environ.get('N_WORKERS', 0)) or None
+CHUNKSIZE = int(os.environ.get('CHUNKSIZE', 100000))
+
+# Set INCREMENTAL to 1 when the input subsets are directories of part files,
+# as written by the split job in incremental mode. Each part is preprocessed
+# into a part of the same name, and parts that already exist in the output
+# are skipped, so a daily refresh only handles the new ones.
+
+INCREMENTAL = os.environ.get('INCREMENTAL', '0') == '1'
+
+# Set PRODUCTS to a JSON list of products (see complainer.products) to
+# preprocess each of them, with its own issue encoding, into a subdirectory
+# of TARGET_DIRECTORY named after it, e.g. student_loan/train.csv.
+# By default only mortgages are preprocessed, into TARGET_DIRECTORY itself.
+
+PRODUCTS = json.loads(os.environ['PRODUCTS']) \
+    if os.environ.get('PRODUCTS') else None
+
+# Set NORMALIZE_TEXT to 1 to replace every run of redactions (XXXX,
+# XX/XX/2019, ...) in the narratives with a single XXXX and collapse their
+# whitespace. The setting is saved with the processed data, as text.json,
+# and with the models trained on it, which prepare complaints the same way
+# when they are scored.
+
+NORMALIZE_TEXT = os.environ.get('NORMALIZE_TEXT', '0') == '1'
+
+# Set MAX_CHARS to truncate narratives longer than that many characters,
+# bounding the cost of featurizing the few very long ones, keeping their
+# start, or, with TRUNCATE set to tail or head_tail, their end or both.
+# Truncation follows NORMALIZE_TEXT, and is saved with it.
+
+MAX_CHARS = int(os.environ.get('MAX_CHARS', 0)) or None
+TRUNCATE = os.environ.get('TRUNCATE', 'head')
+
+# Set RUN_LOG to a file to append the time and memory use of each stage to,
+# as JSON lines.
+
+RUN_LOG = os.environ.get('RUN_LOG')
+log = RunLog(RUN_LOG, 'preprocess')
+
 # ## Define procedure for reading, processing and writing
-# Use python parsing engine, since messy string data can contain characters
-# that the C engine does not like.
+# Messy string data can contain characters that the C engine does not like,
+# so csv is split into blocks of records which are parsed with the C engine,
+# sanitizing the text and falling back to the python engine only for blocks
+# the C engine cannot parse.
+# Filtering, renaming and encoding happen in a single pass over each chunk.
+# Chunks are parsed and processed in parallel on a pool of worker processes,
+# and appended to the output in order as they complete.
+
+if PRODUCTS is None:
+    targets = {'Mortgage': TARGET_DIRECTORY}
+else:
+    targets = {product: os.path.join(TARGET_DIRECTORY, product_slug(product))
+               for product in PRODUCTS}
+
+text_policy = TextPolicy(normalize=NORMALIZE_TEXT,
+                         max_chars=MAX_CHARS,
+                         keep=TRUNCATE)
+steps = [text_policy]
+preprocessors = {product: product_preprocessor(product,
+                                               categorical=True,
+                                               steps=steps)
+                 for product in targets}
+
+def preprocess_table(source, target, preprocessor, stats, stages):
+
+    writer = TableWriter(target,
+                         categorical=['issue'],
+                         columns=['complaint', 'issue'])
+
+    if INPUT_FORMAT == 'csv':
+        # Only raw text is sent to the workers, which do the parsing.
+        with open(source, newline='', encoding='utf-8',
+                  errors='replace') as f:
+            header, blocks = iter_record_blocks(f, CHUNKSIZE)
+            task = functools.partial(
+                preprocess_block,
+                header=header,
+                preprocessor=preprocessor,
+                usecols=['Product', 'Issue', 'Consumer complaint narrative']
+            )
+            # Rows are only known once the workers parse the blocks.
+            results = imap_ordered(task, stages.iterate('read', blocks,
+                                                        rows=lambda _: None),
+                                   executor)
+            for mortgages, rows, engine, timings in results:
+                stages.update(timings, rows)
+                with stages.stage('write', rows=len(mortgages)):
+                    writer.write(mortgages)
+                stats['rows'] += rows
+                stats['chunks'] += 1
+                stats['fallback_chunks'] += engine != 'c'
+    else:
+        chunks = iter_table(source,
+                            chunksize=CHUNKSIZE,
+                            columns=['Product', 'Issue',
+                                     'Consumer complaint narrative'],
+                            stats=stats)
+        task = functools.partial(preprocess_chunk,
+                                 preprocessor=preprocessor)
+        for mortgages, rows, timings in imap_ordered(
+                task, stages.iterate('read', chunks), executor):
+            stages.update(timings, rows)
+            with stages.stage('write', rows=len(mortgages)):
+                writer.write(mortgages)
+
+    with stages.stage('write'):
+        writer.close()
+
+def preprocess(task, stages):
+
+    product, split = task
+    preprocessor = preprocessors[product]
+    stats = {'rows': 0, 'chunks': 0, 'fallback_chunks': 0, 'parts': 0}
+    start = time.perf_counter()
+
+    if not INCREMENTAL:
+        preprocess_table(table_path(INPUT_DIRECTORY, split, INPUT_FORMAT),
+                         table_path(targets[product], split, DATA_FORMAT),
+                         preprocessor,
+                         stats,
+                         stages)
+    else:
+        target_directory = os.path.join(targets[product], split)
+        if not os.path.exists(target_directory):
+            os.mkdir(target_directory)
+        for source in list_parts(os.path.join(INPUT_DIRECTORY, split)):
+            name = (os.path.splitext(os.path.basename(source))[0]
+                    + extensions[DATA_FORMAT])
+            target = os.path.join(target_directory, name)
+            if os.path.exists(target):
+                continue
+            # Renamed once complete, so a part is never half written.
+            tmp = os.path.join(target_directory, '.tmp-' + name)
+            preprocess_table(source, tmp, preprocessor, stats, stages)
+            os.replace(tmp, target)
+            stats['parts'] += 1
+
+    stats['seconds'] = time.perf_counter() - start
+
+    return stats
+
+# ## Run
+# Worker processes re-import this job when they are spawned rather than
+# forked (the default on macOS, and on Linux from Python 3.14), so the pool
+# is only created, and the job only run, in the main process.
+
+if __name__ == '__main__':
+
+    executor = make_executor(N_WORKERS)
 
-def preprocess(split):
+    # ## Create target directory
+    # If necessary, and save the text policy in it.
 
-    df = pd.read_csv(INPUT_DIRECTORY + '/' + split + '.csv',
-                     delimiter=',',
-                     engine='python',
-                     quoting=csv.QUOTE_ALL)
+    for directory in targets.values():
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        text_policy.save(directory)
 
-    # Filter and rename columns
+    # ## Read, process and write processed data to disk
+    # The splits of every product are processed concurrently, sharing the
+    # pool of workers. Reading (the raw csv records, or the chunks of other
+    # formats), parsing csv records, preprocessing (filtering, renaming
+    # and encoding) and writing are each measured as a stage, accumulated
+    # over the chunks of every split; parsing and preprocessing run on the
+    # workers, and are measured there.
 
-    mortgages = filter_rename_mortgages(df)
-    mortgages = encode_targets(
-        mortgages,
-        target_column='issue',
-        target_encoding_dict=target_encoding_dict
-    )
-    
-    mortgages.to_csv(TARGET_DIRECTORY + '/' + split + '.csv',
-                     index=False)
-    
-    return None
+    tasks = [(product, split) for product in targets
+             for split in ['train', 'dev', 'test']]
 
-# ## Create target directory
-# If necessary.
+    with log.interleaved() as stages:
+        with ThreadPoolExecutor(max_workers=len(tasks)) as split_executor:
+            split_stats = dict(zip(tasks, split_executor.map(
+                functools.partial(preprocess, stages=stages), tasks)))
 
-if not os.path.exists(TARGET_DIRECTORY):
-    os.mkdir(TARGET_DIRECTORY)
+    if executor is not None:
+        executor.shutdown()
 
-# ## Read, process and write processed data to disk
+    for (product, split), stats in split_stats.items():
+        if INCREMENTAL:
+            print("{} {}: {} new parts".format(product, split,
+                                               stats['parts']))
+        print(
+            "{} {} complete: {} rows read at {:.0f} rows/sec "
+            "({} of {} chunks needed the python engine)"
+            .format(product, split, stats['rows'], rows_per_second(stats),
+                    stats['fallback_chunks'], stats['chunks'])
+        )
 
-for split in ['train', 'dev', 'test']:
-    preprocess(split)
-    print(split + ' complete')
+    # ## Print log
 
-# ## Print log
+    log.params(INPUT_DIRECTORY=INPUT_DIRECTORY,
+               TARGET_DIRECTORY=TARGET_DIRECTORY,
+               DATA_FORMAT=DATA_FORMAT,
+               INPUT_FORMAT=INPUT_FORMAT,
+               N_WORKERS=N_WORKERS,
+               CHUNKSIZE=CHUNKSIZE,
+               INCREMENTAL=INCREMENTAL,
+               PRODUCTS=PRODUCTS,
+               NORMALIZE_TEXT=NORMALIZE_TEXT,
+               MAX_CHARS=MAX_CHARS,
+               TRUNCATE=TRUNCATE)
+    print(log.summary())
 
-print("JOB PARAMS:")
-print("INPUT_DIRECTORY: {}".format(INPUT_DIRECTORY))
-print("TARGET_DIRECTORY: {}".format(TARGET_DIRECTORY))
\ No newline at end of file
+    print("JOB PARAMS:")
+    print("INPUT_DIRECTORY: {}".format(INPUT_DIRECTORY))
+    print("TARGET_DIRECTORY: {}".format(TARGET_DIRECTORY))
+    print("DATA_FORMAT: {}".format(DATA_FORMAT))
+    print("INPUT_FORMAT: {}".format(INPUT_FORMAT))
+    print("N_WORKERS: {}".format(N_WORKERS))
+    print("CHUNKSIZE: {}".format(CHUNKSIZE))
+    print("INCREMENTAL: {}".format(INCREMENTAL))
+    print("PRODUCTS: {}".format(PRODUCTS))
+    print("NORMALIZE_TEXT: {}".format(NORMALIZE_TEXT))
+    print("MAX_CHARS: {}".format(MAX_CHARS))
+    print("TRUNCATE: {}".format(TRUNCATE))
+    print("RUN_LOG: {}".format(RUN_LOG))
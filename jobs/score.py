@@ -0,0 +1,135 @@
+# # Score
+
+# This job batch scores a (possibly very large) table of new, unlabeled
+# complaints with a pre-trained classifier.
+# The table is streamed in chunks, and each scored chunk is written to its
+# own part file, holding the predicted issue and a score per issue.
+# If the job is interrupted, re-running it with the same params skips the
+# parts that were already written. A manifest written with the parts
+# records the input, chunking and model, and the job refuses to resume
+# into a TARGET_DIRECTORY scored with different ones.
+
+# ## Imports
+
+import os
+from complainer.instrumentation import RunLog
+from complainer.scoring import make_pool, score_to_parts, scoring_manifest
+from complainer.storage import iter_table
+
+# ## Params
+
+# The following should be set as environment variables in the CDSW job:
+# DATA, TARGET_DIRECTORY, and VECTORIZER and MODEL, unless COMPACT_MODEL is
+# set.
+
+DATA = os.environ['DATA']
+TARGET_DIRECTORY = os.environ['TARGET_DIRECTORY']
+VECTORIZER = os.environ.get('VECTORIZER')
+MODEL = os.environ.get('MODEL')
+
+# Optional params.
+# Set COMPACT_MODEL to the directory of a compact artifact to load the
+# vectorizer and model from it instead of the pickles.
+# TEXT_COLUMN holds the complaint text, and ID_COLUMN (if set) is copied to
+# the output to identify each complaint.
+# Rows per chunk (and part file), number of worker processes (default: one
+# per core; 1 runs serially), and output format (csv, parquet or feather).
+
+COMPACT_MODEL = os.environ.get('COMPACT_MODEL')
+TEXT_COLUMN = os.environ.get('TEXT_COLUMN', 'complaint')
+ID_COLUMN = os.environ.get('ID_COLUMN') or None
+CHUNKSIZE = int(os.environ.get('CHUNKSIZE', 100000))
+N_WORKERS = int(os.environ.get('N_WORKERS', 0)) or None
+DATA_FORMAT = os.environ.get('DATA_FORMAT', 'csv')
+
+if not COMPACT_MODEL and not (VECTORIZER and MODEL):
+    raise(ValueError("Set VECTORIZER and MODEL, or COMPACT_MODEL"))
+
+# Set RUN_LOG to a file to append the time and memory use of each stage to,
+# as JSON lines.
+
+RUN_LOG = os.environ.get('RUN_LOG')
+log = RunLog(RUN_LOG, 'score')
+
+# ## Run
+# Scoring workers re-import this job when they are spawned rather than
+# forked (the default on macOS, and on Linux from Python 3.14), so the job
+# only runs, and only starts the workers, in the main process.
+
+if __name__ == '__main__':
+
+    # ## Stream data
+
+    # Only the needed columns are read.
+    # The chunking must not change between a run and its resumption.
+
+    columns = [TEXT_COLUMN] + ([ID_COLUMN] if ID_COLUMN else [])
+    chunks = iter_table(DATA, chunksize=CHUNKSIZE, columns=columns)
+
+    # ## Identify the run
+
+    # Digests of the input and the model, which read them through once.
+
+    with log.stage('digest'):
+        manifest = scoring_manifest(DATA, CHUNKSIZE, VECTORIZER, MODEL,
+                                    COMPACT_MODEL,
+                                    text_column=TEXT_COLUMN,
+                                    id_column=ID_COLUMN)
+
+    # ## Load model and start workers
+
+    # Complaints are prepared with the text policy saved with the model, as its
+    # training data was by the preprocess job: normalized, if it was, and
+    # truncated to the same length, which bounds the cost of very long ones.
+
+    with log.stage('load'):
+        executor, scorer = make_pool(VECTORIZER, MODEL, COMPACT_MODEL,
+                                     n_workers=N_WORKERS,
+                                     text_column=TEXT_COLUMN,
+                                     id_column=ID_COLUMN)
+
+    # ## Score and write parts
+
+    # Reading, featurizing, predicting and writing are interleaved part by
+    # part, and each is measured as its own stage, accumulated over the parts.
+    # Featurizing and predicting run on the workers, and are measured there.
+
+    with log.interleaved() as stages:
+        summary = score_to_parts(chunks, scorer, TARGET_DIRECTORY,
+                                 fmt=DATA_FORMAT, executor=executor,
+                                 manifest=manifest, stages=stages)
+
+    if executor is not None:
+        executor.shutdown()
+
+    print(
+        "Scored {rows} rows into {scored} new parts "
+        "({skipped} parts already done)".format(**summary)
+    )
+
+    # ## Print log
+
+    log.params(DATA=DATA,
+               TARGET_DIRECTORY=TARGET_DIRECTORY,
+               VECTORIZER=VECTORIZER,
+               MODEL=MODEL,
+               COMPACT_MODEL=COMPACT_MODEL,
+               TEXT_COLUMN=TEXT_COLUMN,
+               ID_COLUMN=ID_COLUMN,
+               CHUNKSIZE=CHUNKSIZE,
+               N_WORKERS=N_WORKERS,
+               DATA_FORMAT=DATA_FORMAT)
+    print(log.summary())
+
+    print("JOB PARAMS:")
+    print("DATA: {}".format(DATA))
+    print("TARGET_DIRECTORY: {}".format(TARGET_DIRECTORY))
+    print("VECTORIZER: {}".format(VECTORIZER))
+    print("MODEL: {}".format(MODEL))
+    print("COMPACT_MODEL: {}".format(COMPACT_MODEL))
+    print("TEXT_COLUMN: {}".format(TEXT_COLUMN))
+    print("ID_COLUMN: {}".format(ID_COLUMN))
+    print("CHUNKSIZE: {}".format(CHUNKSIZE))
+    print("N_WORKERS: {}".format(N_WORKERS))
+    print("DATA_FORMAT: {}".format(DATA_FORMAT))
+    print("RUN_LOG: {}".format(RUN_LOG))
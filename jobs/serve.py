@@ -0,0 +1,128 @@
+# # Serve
+
+# This job runs a long-lived HTTP service that classifies single complaints,
+# e.g. as submitted via the web form.
+# The vectorizer and model are loaded once, and concurrent requests are
+# scored together in micro-batches on a pool of workers.
+
+# Classify a complaint with:
+# `curl -X POST localhost:8000/predict -d '{"complaint": "..."}'`
+# or, when serving a model registry, with the complaint's product:
+# `curl -X POST localhost:8000/predict \
+#   -d '{"product": "Student loan", "complaint": "..."}'`
+# and see request latency percentiles with:
+# `curl localhost:8000/stats`
+
+# ## Imports
+
+import os
+import asyncio
+from complainer.instrumentation import RunLog
+from complainer.parallel import default_workers
+from complainer.service import (
+  MicroBatcher, ScoringService, make_pool, make_registry_pool
+)
+
+# ## Params
+
+# The following should be set as environment variables in the CDSW job:
+# VECTORIZER and MODEL, or REGISTRY, the directory of a model registry
+# written by the train_products job, to serve the model of every product in
+# it and dispatch each complaint to the model of its product.
+
+VECTORIZER = os.environ.get('VECTORIZER')
+MODEL = os.environ.get('MODEL')
+REGISTRY = os.environ.get('REGISTRY')
+
+# Optional params.
+# Set COMPACT_MODEL to the directory of a compact artifact to load the
+# vectorizer and model from it instead of the pickles. It is memory mapped,
+# so worker processes start in milliseconds and share one copy.
+# Batches hold up to MAX_BATCH_SIZE complaints, and the first complaint in a
+# batch waits at most MAX_WAIT_MS for others to join it.
+# Batches are predicted on N_WORKERS workers (default: one per core), up to
+# N_WORKERS at once.
+# Set WORKER_PROCESSES=1 to score on N_WORKERS processes (each loading its
+# own model copy) rather than threads sharing one copy.
+
+COMPACT_MODEL = os.environ.get('COMPACT_MODEL')
+HOST = os.environ.get('HOST', '127.0.0.1')
+PORT = int(os.environ.get('PORT', 8000))
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 64))
+MAX_WAIT_MS = float(os.environ.get('MAX_WAIT_MS', 5))
+N_WORKERS = int(os.environ.get('N_WORKERS', 0)) or default_workers()
+WORKER_PROCESSES = os.environ.get('WORKER_PROCESSES', '0') == '1'
+
+# Set RUN_LOG to a file to append the time and memory use of start up to,
+# as JSON lines. Request latencies are served at /stats.
+
+RUN_LOG = os.environ.get('RUN_LOG')
+log = RunLog(RUN_LOG, 'serve')
+
+# ## Run
+# With WORKER_PROCESSES, workers re-import this job when they are spawned
+# rather than forked (the default on macOS, and on Linux from Python 3.14),
+# so the service and its workers only start in the main process.
+
+if __name__ == '__main__':
+
+    # ## Print log
+    # Before serving, since serving never returns.
+
+    print("JOB PARAMS:")
+    print("VECTORIZER: {}".format(VECTORIZER))
+    print("MODEL: {}".format(MODEL))
+    print("REGISTRY: {}".format(REGISTRY))
+    print("COMPACT_MODEL: {}".format(COMPACT_MODEL))
+    print("HOST: {}".format(HOST))
+    print("PORT: {}".format(PORT))
+    print("MAX_BATCH_SIZE: {}".format(MAX_BATCH_SIZE))
+    print("MAX_WAIT_MS: {}".format(MAX_WAIT_MS))
+    print("N_WORKERS: {}".format(N_WORKERS))
+    print("WORKER_PROCESSES: {}".format(WORKER_PROCESSES))
+    print("RUN_LOG: {}".format(RUN_LOG))
+
+    log.params(VECTORIZER=VECTORIZER,
+               MODEL=MODEL,
+               REGISTRY=REGISTRY,
+               COMPACT_MODEL=COMPACT_MODEL,
+               HOST=HOST,
+               PORT=PORT,
+               MAX_BATCH_SIZE=MAX_BATCH_SIZE,
+               MAX_WAIT_MS=MAX_WAIT_MS,
+               N_WORKERS=N_WORKERS,
+               WORKER_PROCESSES=WORKER_PROCESSES)
+
+    # ## Load model and start workers
+
+    # Complaints are prepared with the text policy saved with each model, as
+    # its training data was by the preprocess job: normalized, if it was, and
+    # truncated to the same length, which bounds the latency of very long ones.
+
+    with log.stage('load'):
+        if REGISTRY:
+            executor, predict_batch, products = make_registry_pool(
+                REGISTRY, n_workers=N_WORKERS, processes=WORKER_PROCESSES
+            )
+            print("Serving models of: {}".format(', '.join(products)))
+        else:
+            executor, predict_batch = make_pool(VECTORIZER, MODEL,
+                                                n_workers=N_WORKERS,
+                                                processes=WORKER_PROCESSES,
+                                                compact_path=COMPACT_MODEL)
+            products = None
+
+    # ## Serve
+
+    async def serve():
+        batcher = MicroBatcher(predict_batch,
+                               max_batch_size=MAX_BATCH_SIZE,
+                               max_wait=MAX_WAIT_MS / 1000,
+                               executor=executor,
+                               max_concurrency=N_WORKERS)
+        service = ScoringService(batcher, products)
+        server = await service.start(HOST, PORT)
+        print("Serving on {}:{}".format(HOST, PORT))
+        await server.serve_forever()
+
+    asyncio.run(serve())
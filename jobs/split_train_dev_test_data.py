@@ -6,29 +6,162 @@
 
 import os
 import csv
+import json
+import numpy as np
 import pandas as pd
-from complainer.splitter import train_dev_test_split
+from complainer.dataset import iter_dataset
+from complainer.dedup import DuplicateDetector
+from complainer.incremental import Watermark, newer_rows
+from complainer.ingestion import read_complaints_chunked, raw_dtypes, \
+    NARRATIVE_COLUMN
+from complainer.instrumentation import RunLog
+from complainer.splitter import stream_train_dev_test_split
+from complainer.storage import table_path, part_path, TableWriter
 
 # ## Params
 
 # The following should be set as environment variables in the CDSW job.
 
-INPUT_FILE = os.environ['INPUT_FILE']
 TARGET_DIRECTORY = os.environ['TARGET_DIRECTORY']
 
+# Either INPUT_FILE, the raw dump, or INPUT_DATASET, the raw complaints
+# partitioned by Product (see the ingest job). From a dataset, only the
+# partitions of PRODUCTS (a JSON list of product names) are read.
+
+INPUT_FILE = os.environ.get('INPUT_FILE')
+INPUT_DATASET = os.environ.get('INPUT_DATASET')
+PRODUCTS = json.loads(os.environ.get('PRODUCTS', '["Mortgage"]'))
+
+# Optional params.
+# Rows are assigned to splits by hashing their Complaint ID with this seed,
+# so re-running with the same seed reproduces the same split.
+# Set STRATIFY to a column name (e.g. Issue) for a stratified split.
+
+RANDOM_STATE = int(os.environ.get('RANDOM_STATE', 0))
+STRATIFY = os.environ.get('STRATIFY') or None
+
+# Storage format of the subsets: csv (default), parquet or feather.
+
+DATA_FORMAT = os.environ.get('DATA_FORMAT', 'csv')
+
+# Set INCREMENTAL to 1 for a daily refresh: only complaints newer than the
+# watermark stored in TARGET_DIRECTORY by the previous incremental run are
+# split, and each subset gets them as a new part file in a directory of its
+# own (e.g. train/part-00003.csv). The first incremental run takes every
+# complaint. Downstream jobs read such directories as single tables.
+
+INCREMENTAL = os.environ.get('INCREMENTAL', '0') == '1'
+
+# Complaints are sometimes published days after the newest ones processed,
+# dated earlier. Set LOOKBACK_DAYS to re-read the complaints received over
+# that many days before the watermark in incremental runs, adding those not
+# processed yet, as recorded by their Complaint IDs in the watermark. With
+# 0 (the default), late complaints dated before the watermark are skipped.
+
+LOOKBACK_DAYS = int(os.environ.get('LOOKBACK_DAYS', 0))
+
+# Set DEDUPLICATE to find complaints whose narratives are exact or near
+# duplicates of each other (after normalizing redactions, whitespace and
+# case) and either keep each cluster of duplicates within one subset
+# (group), so none leak from train to dev or test, or keep only the first
+# complaint of each cluster (drop). Not set by default. Grouping cannot be
+# combined with STRATIFY. In incremental mode, only the new complaints are
+# compared with each other.
+
+DEDUPLICATE = os.environ.get('DEDUPLICATE') or None
+if DEDUPLICATE not in [None, 'group', 'drop']:
+    raise(ValueError(
+        "DEDUPLICATE must be group or drop, got {}".format(DEDUPLICATE)
+    ))
+if DEDUPLICATE == 'group' and STRATIFY:
+    raise(ValueError("DEDUPLICATE=group cannot be combined with STRATIFY"))
+
+# Set RUN_LOG to a file to append the time and memory use of each stage to,
+# as JSON lines.
+
+RUN_LOG = os.environ.get('RUN_LOG')
+log = RunLog(RUN_LOG, 'split_train_dev_test_data')
+
 # ## Read raw data
+# Stream the raw dump in chunks, keeping only the columns we use and only
+# the rows containing complaints, so the full dump is never in memory.
+
+# From a dataset, partitions of other products are never opened, nor, in
+# incremental mode, those of years before the watermark (or its lookback
+# window).
+
+if INCREMENTAL:
+    watermark = Watermark.load(TARGET_DIRECTORY)
+    latest = watermark
 
-df = pd.read_csv(INPUT_FILE)
+def read_chunks():
+    if INPUT_DATASET:
+        filters = {'Product': PRODUCTS}
+        if INCREMENTAL and watermark.earliest is not None:
+            filters['year'] = \
+                lambda year: int(year) >= watermark.earliest.year
+        chunks = iter_dataset(INPUT_DATASET,
+                              columns=list(raw_dtypes),
+                              filters=filters)
+    else:
+        chunks = read_complaints_chunked(INPUT_FILE)
+    # In incremental mode, skip every complaint up to the watermark.
+    if INCREMENTAL:
+        chunks = newer_rows(chunks, watermark)
+    return chunks
 
-# ## Filter to data containing complaints only
+chunks = read_chunks()
 
-df = df[df['Consumer complaint narrative'].notnull()]
+# ## Find duplicates
+# Optional. A first pass over the input clusters the duplicate narratives,
+# keeping only a short MinHash signature per distinct narrative in memory.
+# The second pass, which is split, labels each complaint with the Complaint
+# ID of the first complaint of its cluster; non-duplicates get their own.
+# Grouped splits hash this label instead of the Complaint ID, so duplicates
+# land together and every other complaint lands where it would without
+# deduplication. The watermark is advanced over every complaint read,
+# dropped or not.
+
+def with_clusters(chunks, cluster_ids):
+    start = 0
+    for chunk in chunks:
+        labels = cluster_ids[start:start + len(chunk)]
+        start += len(chunk)
+        if DEDUPLICATE == 'drop':
+            yield chunk[labels == chunk['Complaint ID'].values]
+        else:
+            yield chunk.assign(cluster=labels)
+
+if DEDUPLICATE:
+    with log.stage('find_duplicates', rows=0) as stage:
+        detector = DuplicateDetector()
+        ids = []
+        for chunk in chunks:
+            detector.update(chunk[NARRATIVE_COLUMN])
+            ids.append(chunk['Complaint ID'].values)
+            if INCREMENTAL:
+                latest = latest.advance(chunk, LOOKBACK_DAYS)
+        ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+        cluster_ids = ids[detector.clusters()]
+        stage.rows = detector.rows
+        stage.extra['duplicates'] = int((cluster_ids != ids).sum())
+    print("{} of {} complaints are duplicates".format(
+        stage.extra['duplicates'], stage.rows))
+    chunks = with_clusters(read_chunks(), cluster_ids)
 
 # ## Split data into train, dev and test subsets
+# Each chunk is split as it is read.
 
-train, dev, test = train_dev_test_split(
-  df, dev_fraction=0.2, test_fraction=0.1
-)
+def split(chunks):
+    return stream_train_dev_test_split(
+      chunks,
+      key_column='Complaint ID',
+      group_column='cluster' if DEDUPLICATE == 'group' else None,
+      dev_fraction=0.2,
+      test_fraction=0.1,
+      stratify_column=STRATIFY,
+      random_state=RANDOM_STATE
+    )
 
 # ## Create target directory
 # If necessary.
@@ -37,13 +170,87 @@ if not os.path.exists(TARGET_DIRECTORY):
     os.mkdir(TARGET_DIRECTORY)
 
 # ## Write subsets to disk
-# Quote all fields to avoid weird character shenanigans.
+# Append each split chunk to its subset table as it is produced.
+# For csv, quote all fields to avoid weird character shenanigans.
+# Reading, splitting and writing are interleaved chunk by chunk, and each
+# is measured as its own stage, accumulated over the chunks.
+# In incremental mode, the new rows go to part files, written under a
+# temporary name and renamed once complete. The watermark is only advanced
+# after every part is in place, so an interrupted run is simply re-run,
+# rewriting the same parts.
+
+def subset_path(split):
+    if not INCREMENTAL:
+        return table_path(TARGET_DIRECTORY, split, DATA_FORMAT)
+    directory = os.path.join(TARGET_DIRECTORY, split)
+    if not os.path.exists(directory):
+        os.mkdir(directory)
+    path = part_path(directory, watermark.parts, DATA_FORMAT)
+    return os.path.join(directory, '.tmp-' + os.path.basename(path))
 
-train.to_csv(TARGET_DIRECTORY+'/train.csv', quoting=csv.QUOTE_ALL)
-dev.to_csv(TARGET_DIRECTORY+'/dev.csv', quoting=csv.QUOTE_ALL)
-test.to_csv(TARGET_DIRECTORY+'/test.csv', quoting=csv.QUOTE_ALL)
+writers = {
+    split: TableWriter(subset_path(split), quoting=csv.QUOTE_ALL)
+    for split in ['train', 'dev', 'test']
+}
+
+rows = 0
+with log.interleaved() as stages:
+    splits = split(stages.iterate('read', chunks))
+    for train, dev, test in stages.iterate(
+            'split', splits, rows=lambda subsets: sum(map(len, subsets))):
+        with stages.stage('write', rows=len(train) + len(dev) + len(test)):
+            writers['train'].write(train)
+            writers['dev'].write(dev)
+            writers['test'].write(test)
+        rows += len(train) + len(dev) + len(test)
+        if INCREMENTAL and not DEDUPLICATE:
+            for subset in [train, dev, test]:
+                latest = latest.advance(subset, LOOKBACK_DAYS)
+
+    with stages.stage('write'):
+        for writer in writers.values():
+            writer.close()
+
+# ## Publish new parts and advance the watermark
+# A refresh without new complaints adds no parts.
+
+if INCREMENTAL:
+    new_parts = rows > 0
+    for split, writer in writers.items():
+        if new_parts:
+            os.replace(writer.path, part_path(
+                os.path.join(TARGET_DIRECTORY, split), watermark.parts,
+                DATA_FORMAT))
+        else:
+            os.remove(writer.path)
+    if new_parts:
+        latest.parts = watermark.parts + 1
+        latest.save(TARGET_DIRECTORY)
+    print("Watermark: {} (was {})".format(latest, watermark))
 
 # ## Print log
+
+log.params(INPUT_FILE=INPUT_FILE,
+           INPUT_DATASET=INPUT_DATASET,
+           PRODUCTS=PRODUCTS,
+           TARGET_DIRECTORY=TARGET_DIRECTORY,
+           RANDOM_STATE=RANDOM_STATE,
+           STRATIFY=STRATIFY,
+           DATA_FORMAT=DATA_FORMAT,
+           INCREMENTAL=INCREMENTAL,
+           LOOKBACK_DAYS=LOOKBACK_DAYS,
+           DEDUPLICATE=DEDUPLICATE)
+print(log.summary())
+
 print("JOB PARAMS:")
 print("INPUT_FILE: {}".format(INPUT_FILE))
-print("TARGET_DIRECTORY: {}".format(TARGET_DIRECTORY))
\ No newline at end of file
+print("INPUT_DATASET: {}".format(INPUT_DATASET))
+print("PRODUCTS: {}".format(PRODUCTS))
+print("TARGET_DIRECTORY: {}".format(TARGET_DIRECTORY))
+print("RANDOM_STATE: {}".format(RANDOM_STATE))
+print("STRATIFY: {}".format(STRATIFY))
+print("DATA_FORMAT: {}".format(DATA_FORMAT))
+print("INCREMENTAL: {}".format(INCREMENTAL))
+print("LOOKBACK_DAYS: {}".format(LOOKBACK_DAYS))
+print("DEDUPLICATE: {}".format(DEDUPLICATE))
+print("RUN_LOG: {}".format(RUN_LOG))
@@ -5,11 +5,20 @@
 # ## Imports
 
 import os
+import json
 import joblib
 import pandas as pd
-from nbsvm import NBSVM
 from sklearn.naive_bayes import MultinomialNB
-from sklearn.feature_extraction.text import TfidfVectorizer
+from complainer.cache import FeatureCache, file_digest
+from complainer.artifacts import save_compact
+from complainer.nbsvm import NBSVM
+from complainer.instrumentation import RunLog
+from complainer.parallel import make_executor
+from complainer.features import (
+    HashingTfidfVectorizer, TermCounts, tokenization_params
+)
+from complainer.storage import read_table
+from complainer.text import TextPolicy
 
 # ## Params
 
@@ -18,48 +27,154 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 TRAIN_DATA = os.environ['TRAIN_DATA']
 MODEL_DIRECTORY = os.environ['MODEL_DIRECTORY']
 
+# Optional params.
+# Featurized training data is cached here, keyed by the contents of the
+# training data and the vectorizer params. Set to an empty string to disable.
 
-# ## Read data
+FEATURE_CACHE = os.environ.get('FEATURE_CACHE', MODEL_DIRECTORY + 'features')
 
-train = pd.read_csv(TRAIN_DATA)
+# Featurizer: tfidf (default) for scikit's tf-idf, or hashing for tf-idf
+# over hashed terms, which needs no vocabulary and pickles to a tiny file.
 
+FEATURIZER = os.environ.get('FEATURIZER', 'tfidf')
 
-# ## Featurize
+# Params of the featurizer, as JSON, e.g. '{"ngram_range": [1, 2]}'
+# (from the results of the tune job).
 
-# We need a computable representation of text.
-# For topic classification (which is what we're doing here),
-# keywords usually work great, at least as a baseline.
-# We'll use scikit's tf-idf.
+VECTORIZER_PARAMS = json.loads(os.environ.get('VECTORIZER_PARAMS', '{}'))
+if 'ngram_range' in VECTORIZER_PARAMS:
+    VECTORIZER_PARAMS['ngram_range'] = tuple(VECTORIZER_PARAMS['ngram_range'])
 
-vectorizer = TfidfVectorizer()
-X = vectorizer.fit_transform(train.complaint)
-y = train.issue
+# Worker processes for tokenizing, and threads fitting the classifier, one
+# per core by default. Set N_WORKERS=1 to tokenize and fit serially.
 
+N_WORKERS = os.environ.get('N_WORKERS')
 
-# ## Train a classifier
+# Set RUN_LOG to a file to append the time and memory use of each stage to,
+# as JSON lines.
 
-# We'll try a simple multinomial naive bayes classifier.
-# Technically this should use integer counts (because that's what a multinomial
-# distribution represents), but it works with td-idf in practice too.
+RUN_LOG = os.environ.get('RUN_LOG')
+log = RunLog(RUN_LOG, 'train_classifier')
 
-model = NBSVM()
-model.fit(X, y)
 
+# ## Run
+# Tokenizing workers re-import this job when they are spawned rather than
+# forked (the default on macOS, and on Linux from Python 3.14), so the job
+# only runs, and only starts the workers, in the main process.
 
-# ## Persist model
+if __name__ == '__main__':
 
-# Create target directory if necessary.
+    # ## Read data
 
-if not os.path.exists(MODEL_DIRECTORY):
-    os.mkdir(MODEL_DIRECTORY)
+    # The storage format (csv, parquet or feather) is inferred from the
+    # extension. Columnar formats are memory mapped.
 
-# And persist vectorizer and classifier objects.
-
-joblib.dump(vectorizer, MODEL_DIRECTORY + 'vectorizer.pkl')
-joblib.dump(model, MODEL_DIRECTORY + 'model.pkl')
-
-# ## Print log
-
-print("JOB PARAMS:")
-print("TRAIN_DATA: {}".format(TRAIN_DATA))
-print("MODEL_DIRECTORY: {}".format(MODEL_DIRECTORY))
\ No newline at end of file
+    with log.stage('read') as stage:
+        train = read_table(TRAIN_DATA, columns=['complaint', 'issue'],
+                           memory_map=True)
+        stage.rows = len(train)
+
+
+    # ## Featurize
+
+    # We need a computable representation of text.
+    # For topic classification (which is what we're doing here),
+    # keywords usually work great, at least as a baseline.
+    # We'll use scikit's tf-idf.
+    # Tokenizing is the expensive part, so the training set is tokenized into
+    # term counts once, and cached. The tf-idf vectorizer is derived from the
+    # counts, so changing its n-gram range (within the counted one), document
+    # frequency limits or weighting does not tokenize the training set again.
+    # Shards of the training set are tokenized in parallel, and their
+    # vocabularies merged, with the same result as tokenizing serially.
+
+    with log.stage('featurize', rows=len(train)):
+        if FEATURIZER == 'tfidf':
+            tokenization = {
+                name: VECTORIZER_PARAMS[name]
+                for name in ['ngram_range'] + tokenization_params
+                if name in VECTORIZER_PARAMS
+            }
+            executor = make_executor(int(N_WORKERS) if N_WORKERS else None)
+            if FEATURE_CACHE:
+                counts = FeatureCache(FEATURE_CACHE).term_counts(
+                    train.complaint, data_digest=file_digest(TRAIN_DATA),
+                    executor=executor, **tokenization
+                )
+            else:
+                counts = TermCounts.from_texts(train.complaint,
+                                               executor=executor,
+                                               **tokenization)
+            if executor is not None:
+                executor.shutdown()
+            vectorizer, X = counts.tfidf(**VECTORIZER_PARAMS)
+        else:
+            vectorizer = HashingTfidfVectorizer(**VECTORIZER_PARAMS)
+            if FEATURE_CACHE:
+                vectorizer, X = FeatureCache(FEATURE_CACHE).fit_transform(
+                    vectorizer, train.complaint,
+                    data_digest=file_digest(TRAIN_DATA)
+                )
+            else:
+                X = vectorizer.fit_transform(train.complaint)
+        y = train.issue
+
+
+    # ## Train a classifier
+
+    # NBSVM: a linear SVM on tf-idf features scaled by naive bayes log-count
+    # ratios. It fits one SVM per issue, concurrently on N_WORKERS threads, on
+    # float32 features.
+
+    with log.stage('fit', rows=len(train)):
+        model = NBSVM(n_jobs=int(N_WORKERS) if N_WORKERS else None)
+        model.fit(X, y)
+
+
+    # ## Persist model
+
+    # Create target directory if necessary.
+
+    if not os.path.exists(MODEL_DIRECTORY):
+        os.mkdir(MODEL_DIRECTORY)
+
+    # And persist vectorizer and classifier objects, with the text policy the
+    # preprocess job prepared the training data with (saved beside it), so
+    # complaints are prepared the same way when they are scored.
+
+    text_policy = TextPolicy.load(
+        os.path.dirname(os.path.normpath(TRAIN_DATA)))
+
+    with log.stage('write'):
+        joblib.dump(vectorizer, MODEL_DIRECTORY + 'vectorizer.pkl')
+        joblib.dump(model, MODEL_DIRECTORY + 'model.pkl')
+        text_policy.save(MODEL_DIRECTORY)
+
+        # Also persist them as a compact artifact of float32 arrays, which
+        # loads in milliseconds by memory mapping, and is shared between
+        # processes.
+
+        try:
+            save_compact(vectorizer, model, MODEL_DIRECTORY + 'compact',
+                         text_policy)
+        except TypeError as error:
+            print("No compact artifact saved: {}".format(error))
+
+    # ## Print log
+
+    log.params(TRAIN_DATA=TRAIN_DATA,
+               MODEL_DIRECTORY=MODEL_DIRECTORY,
+               FEATURE_CACHE=FEATURE_CACHE,
+               FEATURIZER=FEATURIZER,
+               VECTORIZER_PARAMS=VECTORIZER_PARAMS,
+               N_WORKERS=N_WORKERS)
+    print(log.summary())
+
+    print("JOB PARAMS:")
+    print("TRAIN_DATA: {}".format(TRAIN_DATA))
+    print("MODEL_DIRECTORY: {}".format(MODEL_DIRECTORY))
+    print("FEATURE_CACHE: {}".format(FEATURE_CACHE))
+    print("FEATURIZER: {}".format(FEATURIZER))
+    print("VECTORIZER_PARAMS: {}".format(VECTORIZER_PARAMS))
+    print("N_WORKERS: {}".format(N_WORKERS))
+    print("RUN_LOG: {}".format(RUN_LOG))
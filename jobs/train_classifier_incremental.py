@@ -0,0 +1,122 @@
+# # Train classifier incrementally
+
+# This job trains a ML algorithm out-of-core and persists it to disk.
+# Unlike the train classifier job, the training data is never all in memory:
+# it is streamed in chunks, so the training set size is not limited by RAM.
+
+# ## Imports
+
+import os
+import joblib
+from complainer.artifacts import save_compact
+from complainer.features import HashingTfidfVectorizer
+from complainer.instrumentation import RunLog
+from complainer.preprocessing import target_encoding_dict
+from complainer.storage import iter_table
+from complainer.text import TextPolicy
+from complainer.training import incremental_model, fit_incremental
+
+# ## Params
+
+# The following should be set as environment variables in the CDSW job.
+
+TRAIN_DATA = os.environ['TRAIN_DATA']
+MODEL_DIRECTORY = os.environ['MODEL_DIRECTORY']
+
+# Optional params.
+# Classifier: sgd (default) for a linear SVM trained by stochastic gradient
+# descent, or nb for multinomial naive bayes.
+# Rows per chunk, and passes over the data to fit the classifier.
+
+INCREMENTAL_MODEL = os.environ.get('INCREMENTAL_MODEL', 'sgd')
+CHUNKSIZE = int(os.environ.get('CHUNKSIZE', 100000))
+N_EPOCHS = int(os.environ.get('N_EPOCHS', 5))
+
+# Set RUN_LOG to a file to append the time and memory use of each stage to,
+# as JSON lines.
+
+RUN_LOG = os.environ.get('RUN_LOG')
+log = RunLog(RUN_LOG, 'train_classifier_incremental')
+
+
+# ## Stream data
+
+# Each pass over the training data reads it afresh, one chunk at a time.
+# The storage format (csv, parquet or feather) is inferred from the extension.
+
+def chunks():
+    return iter_table(TRAIN_DATA,
+                      chunksize=CHUNKSIZE,
+                      columns=['complaint', 'issue'])
+
+
+# ## Featurize and train
+
+# Scikit's tf-idf must hold the vocabulary of the whole corpus, so use
+# tf-idf over hashed terms, whose document frequencies are learned in one
+# streaming pass.
+# Then update the classifier chunk by chunk.
+# Every class must be declared up front, since any chunk may lack some.
+
+classes = sorted(set(target_encoding_dict.values()))
+
+# Every pass reads the data afresh. Reading, featurizing and fitting are
+# interleaved chunk by chunk, and each is measured as its own stage,
+# accumulated over the chunks of every pass.
+
+with log.interleaved() as stages:
+    vectorizer, model, rows = fit_incremental(
+        incremental_model(INCREMENTAL_MODEL),
+        HashingTfidfVectorizer(),
+        chunks,
+        classes,
+        n_epochs=N_EPOCHS,
+        stages=stages
+    )
+
+print("Trained on {} rows".format(rows))
+
+
+# ## Persist model
+
+# Create target directory if necessary.
+
+if not os.path.exists(MODEL_DIRECTORY):
+    os.mkdir(MODEL_DIRECTORY)
+
+# And persist vectorizer and classifier objects, with the text policy the
+# preprocess job prepared the training data with (saved beside it), so
+# complaints are prepared the same way when they are scored.
+
+text_policy = TextPolicy.load(os.path.dirname(os.path.normpath(TRAIN_DATA)))
+
+with log.stage('write'):
+    joblib.dump(vectorizer, MODEL_DIRECTORY + 'vectorizer.pkl')
+    joblib.dump(model, MODEL_DIRECTORY + 'model.pkl')
+    text_policy.save(MODEL_DIRECTORY)
+
+    # Also persist them as a compact artifact of float32 arrays, which loads
+    # in milliseconds by memory mapping, and is shared between processes.
+
+    try:
+        save_compact(vectorizer, model, MODEL_DIRECTORY + 'compact',
+                     text_policy)
+    except TypeError as error:
+        print("No compact artifact saved: {}".format(error))
+
+# ## Print log
+
+log.params(TRAIN_DATA=TRAIN_DATA,
+           MODEL_DIRECTORY=MODEL_DIRECTORY,
+           INCREMENTAL_MODEL=INCREMENTAL_MODEL,
+           CHUNKSIZE=CHUNKSIZE,
+           N_EPOCHS=N_EPOCHS)
+print(log.summary())
+
+print("JOB PARAMS:")
+print("TRAIN_DATA: {}".format(TRAIN_DATA))
+print("MODEL_DIRECTORY: {}".format(MODEL_DIRECTORY))
+print("INCREMENTAL_MODEL: {}".format(INCREMENTAL_MODEL))
+print("CHUNKSIZE: {}".format(CHUNKSIZE))
+print("N_EPOCHS: {}".format(N_EPOCHS))
+print("RUN_LOG: {}".format(RUN_LOG))
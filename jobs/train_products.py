@@ -0,0 +1,115 @@
+# # Train a classifier per product
+
+# This job trains one classifier per product, each on its own product's
+# preprocessed training data (see the PRODUCTS param of the preprocess job),
+# and registers them in a model registry that the serve job can dispatch
+# complaints to by product.
+
+# ## Imports
+
+import os
+import json
+from complainer.instrumentation import RunLog
+from complainer.parallel import make_executor
+from complainer.products import products, product_slug
+from complainer.registry import train_products
+from complainer.storage import table_path
+
+# ## Params
+
+# The following should be set as environment variables in the CDSW job.
+
+PROCESSED_DIRECTORY = os.environ['PROCESSED_DIRECTORY']
+REGISTRY_DIRECTORY = os.environ['REGISTRY_DIRECTORY']
+
+# Optional params.
+# Products to train, as a JSON list (default: every product of
+# complainer.products). The training data of each is read from
+# PROCESSED_DIRECTORY/<product>/train.<DATA_FORMAT>, e.g.
+# student_loan/train.csv.
+
+PRODUCTS = json.loads(os.environ['PRODUCTS']) \
+    if os.environ.get('PRODUCTS') else list(products)
+DATA_FORMAT = os.environ.get('DATA_FORMAT', 'csv')
+
+# Params of the tf-idf vectorizer and of the classifier, as JSON, shared
+# by every product, e.g. '{"ngram_range": [1, 2]}'.
+
+VECTORIZER_PARAMS = json.loads(os.environ.get('VECTORIZER_PARAMS', '{}'))
+if 'ngram_range' in VECTORIZER_PARAMS:
+    VECTORIZER_PARAMS['ngram_range'] = tuple(VECTORIZER_PARAMS['ngram_range'])
+CLASSIFIER = os.environ.get('CLASSIFIER', 'nbsvm')
+CLASSIFIER_PARAMS = json.loads(os.environ.get('CLASSIFIER_PARAMS', '{}'))
+
+# Products are trained in parallel on N_WORKERS worker processes (default:
+# one per core; 1 trains serially).
+
+N_WORKERS = int(os.environ.get('N_WORKERS', 0)) or None
+
+# Set RUN_LOG to a file to append the time and memory use of each stage to,
+# as JSON lines.
+
+RUN_LOG = os.environ.get('RUN_LOG')
+log = RunLog(RUN_LOG, 'train_products')
+
+# ## Run
+# Training workers re-import this job when they are spawned rather than
+# forked (the default on macOS, and on Linux from Python 3.14), so the job
+# only runs, and only starts the workers, in the main process.
+
+if __name__ == '__main__':
+
+    # ## Train and register
+    # Each worker reads its product's data, fits, and registers the model
+    # itself, so only file paths and a short summary pass between processes.
+    # Products are registered independently, so a failure of one leaves the
+    # others' models in place.
+
+    train_paths = {
+        product: table_path(
+            os.path.join(PROCESSED_DIRECTORY, product_slug(product)),
+            'train', DATA_FORMAT)
+        for product in PRODUCTS
+    }
+
+    executor = make_executor(N_WORKERS)
+
+    with log.stage('train_register') as stage:
+        summaries = train_products(train_paths,
+                                   REGISTRY_DIRECTORY,
+                                   executor=executor,
+                                   vectorizer_params=VECTORIZER_PARAMS,
+                                   classifier=CLASSIFIER,
+                                   classifier_params=CLASSIFIER_PARAMS)
+        stage.rows = sum(summary['rows'] for summary in summaries)
+
+    if executor is not None:
+        executor.shutdown()
+
+    for summary in summaries:
+        log.write('model', **summary)
+        print("{product}: {rows} rows, {n} classes, {seconds:.1f}s".format(
+            n=len(summary['classes']), **summary))
+
+    # ## Print log
+
+    log.params(PROCESSED_DIRECTORY=PROCESSED_DIRECTORY,
+               REGISTRY_DIRECTORY=REGISTRY_DIRECTORY,
+               PRODUCTS=PRODUCTS,
+               DATA_FORMAT=DATA_FORMAT,
+               VECTORIZER_PARAMS=VECTORIZER_PARAMS,
+               CLASSIFIER=CLASSIFIER,
+               CLASSIFIER_PARAMS=CLASSIFIER_PARAMS,
+               N_WORKERS=N_WORKERS)
+    print(log.summary())
+
+    print("JOB PARAMS:")
+    print("PROCESSED_DIRECTORY: {}".format(PROCESSED_DIRECTORY))
+    print("REGISTRY_DIRECTORY: {}".format(REGISTRY_DIRECTORY))
+    print("PRODUCTS: {}".format(PRODUCTS))
+    print("DATA_FORMAT: {}".format(DATA_FORMAT))
+    print("VECTORIZER_PARAMS: {}".format(VECTORIZER_PARAMS))
+    print("CLASSIFIER: {}".format(CLASSIFIER))
+    print("CLASSIFIER_PARAMS: {}".format(CLASSIFIER_PARAMS))
+    print("N_WORKERS: {}".format(N_WORKERS))
+    print("RUN_LOG: {}".format(RUN_LOG))
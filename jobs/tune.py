@@ -0,0 +1,131 @@
+# # Tune
+
+# This job searches tf-idf and classifier params, fitting each candidate on
+# the train set and scoring it on the dev set.
+# The prototype scored poorly with all default params, so this is how to
+# pick better ones for the train classifier job.
+
+# ## Imports
+
+import os
+from complainer.instrumentation import RunLog
+from complainer.storage import read_table
+from complainer.tuning import candidates, search
+
+# ## Params
+
+# The following should be set as environment variables in the CDSW job.
+
+TRAIN_DATA = os.environ['TRAIN_DATA']
+DEV_DATA = os.environ['DEV_DATA']
+RESULTS = os.environ['RESULTS']
+
+# Optional params.
+# N_ITER random candidates are sampled from the search space.
+# Set to 0 to try every combination instead.
+# Worker processes default to one per core; set N_WORKERS=1 to run serially.
+
+N_ITER = int(os.environ.get('N_ITER', 0))
+RANDOM_STATE = int(os.environ.get('RANDOM_STATE', 42))
+N_WORKERS = os.environ.get('N_WORKERS')
+SCORING = os.environ.get('SCORING', 'fscore')
+
+# Set RUN_LOG to a file to append the time and memory use of each stage to,
+# as JSON lines.
+
+RUN_LOG = os.environ.get('RUN_LOG')
+log = RunLog(RUN_LOG, 'tune')
+
+
+# ## Search space
+
+# Tokenization params (lowercase, token_pattern, stop_words) are the
+# expensive ones: each distinct combination means tokenizing the data again.
+# Other vectorizer params (ngram_range, min_df, sublinear_tf, ...) and
+# classifier params are derived from the term counts of their tokenization,
+# so they are cheap to vary.
+
+space = [
+    {
+        'ngram_range': [(1, 1), (1, 2)],
+        'min_df': [1, 5],
+        'sublinear_tf': [False, True],
+        'norm': ['l2'],
+        'classifier': ['nbsvm'],
+        'C': [0.1, 1.0],
+        'beta': [0.25, 0.5]
+    },
+    {
+        'ngram_range': [(1, 1), (1, 2)],
+        'min_df': [1, 5],
+        'sublinear_tf': [False, True],
+        'use_idf': [False, True],
+        'classifier': ['nb'],
+        'alpha': [0.01, 0.1, 1.0]
+    }
+]
+
+
+# ## Run
+# Search workers re-import this job when they are spawned rather than
+# forked (the default on macOS, and on Linux from Python 3.14), so the job
+# only runs, and only starts the workers, in the main process.
+
+if __name__ == '__main__':
+
+    # ## Read data
+
+    with log.stage('read') as stage:
+        train = read_table(TRAIN_DATA, columns=['complaint', 'issue'],
+                           memory_map=True)
+        dev = read_table(DEV_DATA, columns=['complaint', 'issue'],
+                         memory_map=True)
+        stage.rows = len(train) + len(dev)
+
+
+    # ## Search
+
+    grid = candidates(space,
+                      n_iter=N_ITER or None,
+                      random_state=RANDOM_STATE)
+
+    # Every candidate is featurized, fitted and scored within this stage, on
+    # a pool of N_WORKERS processes that each receive the data once.
+
+    with log.stage('search', rows=len(train), candidates=len(grid)):
+        results = search(grid,
+                         train.complaint,
+                         train.issue.astype(str),
+                         dev.complaint,
+                         dev.issue.astype(str),
+                         n_workers=int(N_WORKERS) if N_WORKERS else None,
+                         scoring=SCORING)
+
+
+    # ## Write results
+
+    results.to_csv(RESULTS, index=False)
+
+    print(results.head(10))
+
+
+    # ## Print log
+
+    log.params(TRAIN_DATA=TRAIN_DATA,
+               DEV_DATA=DEV_DATA,
+               RESULTS=RESULTS,
+               N_ITER=N_ITER,
+               RANDOM_STATE=RANDOM_STATE,
+               N_WORKERS=N_WORKERS,
+               SCORING=SCORING)
+    print(log.summary())
+
+    print("JOB PARAMS:")
+    print("TRAIN_DATA: {}".format(TRAIN_DATA))
+    print("DEV_DATA: {}".format(DEV_DATA))
+    print("RESULTS: {}".format(RESULTS))
+    print("N_ITER: {}".format(N_ITER))
+    print("RANDOM_STATE: {}".format(RANDOM_STATE))
+    print("N_WORKERS: {}".format(N_WORKERS))
+    print("SCORING: {}".format(SCORING))
+    print("RUN_LOG: {}".format(RUN_LOG))